@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+飞书Aily本地模拟服务
+实现客户端用到的token、会话、消息、运行接口，Bot按固定速度逐字“生成”回复；
+可选提供运行事件流（text/event-stream），用于在没有真实凭据时对比事件流与轮询两种模式，
+/__stats 返回各接口的调用次数
+
+用法: python aily_mock_server.py [--port 8090] [--no-events] [--chars-per-second 40]
+      FEISHU_OPEN_API_BASE=http://127.0.0.1:8090 python app.py
+"""
+
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ROUTES = [
+    ('POST', r'/open-apis/auth/v3/tenant_access_token/internal$', 'token'),
+    ('POST', r'/open-apis/aily/v1/sessions$', 'create_session'),
+    ('DELETE', r'/open-apis/aily/v1/sessions/(?P<session>[^/]+)$', 'delete_session'),
+    ('POST', r'/open-apis/aily/v1/sessions/(?P<session>[^/]+)/messages$', 'create_message'),
+    ('GET', r'/open-apis/aily/v1/sessions/(?P<session>[^/]+)/messages$', 'list_messages'),
+    ('POST', r'/open-apis/aily/v1/sessions/(?P<session>[^/]+)/runs$', 'create_run'),
+    ('GET', r'/open-apis/aily/v1/sessions/(?P<session>[^/]+)/runs/(?P<run>[^/]+)$', 'run_status'),
+    ('POST', r'/open-apis/aily/v1/sessions/(?P<session>[^/]+)/runs/(?P<run>[^/]+)/cancel$', 'cancel_run'),
+    ('GET', r'/open-apis/aily/v1/sessions/(?P<session>[^/]+)/runs/(?P<run>[^/]+)/events$', 'run_events'),
+    ('GET', r'/__stats$', 'stats'),
+]
+
+
+class MockAily:
+    """会话与运行状态；回复内容按运行创建后经过的时间逐字展开"""
+
+    def __init__(self, events: bool = True, chars_per_second: float = 40, reply: str = None):
+        self.events = events
+        self.chars_per_second = chars_per_second
+        self.reply = reply
+        self.sessions = {}
+        self.runs = {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def reply_for(self, text: str) -> str:
+        return self.reply or f"收到：{text}。这是本地模拟服务生成的回复，用于联调流式输出。"
+
+    def run_snapshot(self, run_id: str):
+        """返回 (运行状态, Bot消息)"""
+        run = self.runs[run_id]
+        if run['cancelled']:
+            shown = run['shown']
+            status = 'CANCELLED'
+        else:
+            elapsed = time.time() - run['started_at']
+            shown = min(len(run['reply']), int(elapsed * self.chars_per_second))
+            run['shown'] = shown
+            status = 'COMPLETED' if shown >= len(run['reply']) else 'IN_PROGRESS'
+        message = {
+            'id': run['message_id'],
+            'content': run['reply'][:shown],
+            'status': 'COMPLETED' if status == 'COMPLETED' else 'IN_PROGRESS',
+            'sender': {'sender_type': 'ASSISTANT'},
+        }
+        return status, message
+
+
+class MockAilyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    mock: MockAily = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ok(self, data=None):
+        self._send_json({'code': 0, 'msg': 'success', 'data': data or {}})
+
+    def _dispatch(self, method):
+        parsed = urlparse(self.path)
+        for route_method, pattern, name in ROUTES:
+            match = re.match(pattern, parsed.path)
+            if route_method == method and match:
+                with self.mock.lock:
+                    self.mock.calls[name] += 1
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+                query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                return getattr(self, f'handle_{name}')(body, query, **match.groupdict())
+        self._send_json({'code': 404, 'msg': 'not found'}, 404)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def handle_token(self, body, query):
+        self._send_json({'code': 0, 'tenant_access_token': f't-{uuid.uuid4().hex}', 'expire': 7200})
+
+    def handle_stats(self, body, query):
+        with self.mock.lock:
+            self._send_json(dict(self.mock.calls))
+
+    def handle_create_session(self, body, query):
+        session_id = f'session_{uuid.uuid4().hex[:12]}'
+        with self.mock.lock:
+            self.mock.sessions[session_id] = {'messages': []}
+        self._ok({'session': {'id': session_id}})
+
+    def handle_delete_session(self, body, query, session):
+        with self.mock.lock:
+            self.mock.sessions.pop(session, None)
+        self._ok()
+
+    def handle_create_message(self, body, query, session):
+        message_id = f"msg_{body.get('idempotent_id') or uuid.uuid4().hex}"
+        with self.mock.lock:
+            messages = self.mock.sessions.setdefault(session, {'messages': []})['messages']
+            # 与上游一致：相同幂等键的重复提交返回同一条消息
+            if not any(msg['id'] == message_id for msg in messages):
+                messages.append({'id': message_id, 'content': body.get('content', ''), 'status': 'COMPLETED',
+                                 'sender': {'sender_type': 'USER'}})
+        self._ok({'message': {'id': message_id}})
+
+    def handle_create_run(self, body, query, session):
+        run_id = f'run_{uuid.uuid4().hex[:12]}'
+        with self.mock.lock:
+            messages = self.mock.sessions.setdefault(session, {'messages': []})['messages']
+            question = messages[-1]['content'] if messages else ''
+            self.mock.runs[run_id] = {
+                'session': session, 'started_at': time.time(), 'reply': self.mock.reply_for(question),
+                'message_id': f'msg_{uuid.uuid4().hex[:12]}', 'shown': 0, 'cancelled': False,
+            }
+        self._ok({'run': {'id': run_id, 'status': 'IN_PROGRESS'}})
+
+    def handle_run_status(self, body, query, session, run):
+        if run not in self.mock.runs:
+            return self._send_json({'code': 2320001, 'msg': 'run not found'}, 400)
+        status, _ = self.mock.run_snapshot(run)
+        self._ok({'run': {'id': run, 'status': status}})
+
+    def handle_cancel_run(self, body, query, session, run):
+        if run in self.mock.runs:
+            self.mock.runs[run]['cancelled'] = True
+        self._ok()
+
+    def handle_list_messages(self, body, query, session):
+        messages = list(self.mock.sessions.get(session, {}).get('messages', []))
+        for run_id, run in list(self.mock.runs.items()):
+            if run['session'] == session and query.get('run_id') in (None, run_id):
+                messages.append(self.mock.run_snapshot(run_id)[1])
+        self._ok({'messages': messages})
+
+    def handle_run_events(self, body, query, session, run):
+        if not self.mock.events or run not in self.mock.runs:
+            return self._send_json({'code': 404, 'msg': 'not found'}, 404)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        sent = None
+        try:
+            while True:
+                status, message = self.mock.run_snapshot(run)
+                if message['content'] != sent:
+                    sent = message['content']
+                    self._write_event('message', {'message': message})
+                if status != 'IN_PROGRESS':
+                    self._write_event('run', {'run': {'id': run, 'status': status}})
+                    return
+                time.sleep(0.02)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def _write_event(self, event, payload):
+        data = json.dumps(payload, ensure_ascii=False)
+        self.wfile.write(f'event: {event}\ndata: {data}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+
+def create_server(host: str = '127.0.0.1', port: int = 8090, **options) -> ThreadingHTTPServer:
+    handler = type('Handler', (MockAilyHandler,), {'mock': MockAily(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='飞书Aily本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--no-events', action='store_true', help='不提供运行事件流，客户端将回退为轮询')
+    parser.add_argument('--chars-per-second', type=float, default=40, help='模拟回复的生成速度')
+    parser.add_argument('--reply', help='固定回复内容，默认回显用户消息')
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, events=not args.no_events,
+                           chars_per_second=args.chars_per_second, reply=args.reply)
+    mode = '轮询' if args.no_events else '事件流 + 轮询'
+    print(f"飞书Aily模拟服务已启动: http://{args.host}:{args.port}（{mode}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,32 +9,56 @@ import uuid
 import tempfile
 import os
 import json
-import asyncio
 import logging
 from flask import Flask, request, jsonify, Response, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import requests
-import base64
 import hashlib
 import hmac
 import time
+from functools import wraps
 from urllib.parse import urlencode
 from config import *
 import config as settings
-from feishu_aily_streaming_client import FeishuAilyStreamingClient
+from logging_setup import setup_logging, sample_log
+from feishu_aily_streaming_client import FeishuAilyStreamingClient, AilyContentReplace
+from circuit_breaker import CircuitOpenError, get_breaker, hedged_call, breaker_snapshots
+from llm_router import LLMProviderRegistry
 from werkzeug.exceptions import RequestEntityTooLarge
+from stt_upload import ResumableUploadManager, UploadError
+from tts_store import TTSAudioStore, TTSPrerenderer, read_script_lines
+from tts_client import VolcanoTTSClient
+from tts_longform import LongFormSynthesizer
+from conversation_store import ConversationStore, TurnRecord
+from sse_stream import stream_sse
+from cancellation import CancellationRegistry, Deadline
+from retry import retry_call, retry_snapshots, is_retryable_unsent
+from llm_usage import UsageTracker, resolve_generation_params
+from client_metrics import ClientRenderStats
+from static_assets import StaticAssetPipeline
+from features import FeatureUnavailableError, LazyClient, get_settings
+from audio_vad import trim_wav_file
+from voice_turn import VoiceTurnPipeline
+from personas import PersonaRegistry
+from cache_backend import get_cache, cache_snapshot
+from http_session import create_http_session, pool_snapshots
+from health import health_monitor, http_reachable
+from profiling import request_tracer, sampling_profiler, mark, upstream_span
 
-# 配置日志
-logging.basicConfig(level=logging.DEBUG)  # 改为DEBUG级别以查看详细日志
+# 配置日志：级别、格式与采样率见 config.py，日志I/O在后台线程完成
+setup_logging()
 logger = logging.getLogger(__name__)
+# 启动级设置与功能开关：只读取校验一次，缺失配置的功能不会导致启动失败
+app_settings = get_settings()
 
 # 文件上传配置
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'ogg'}
 MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB
 
-app = Flask(__name__)
+# 关闭Flask内置静态路由，由下方 /static 路由统一处理（资源管线）
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -42,6 +66,8 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 # 确保上传目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# 断点续传上传会话
+upload_manager = ResumableUploadManager(UPLOAD_FOLDER)
 
 
 def allowed_file(filename):
@@ -78,9 +104,18 @@ class VolcanoLLMClient:
         self.api_url = DEEPSEEK_API_URL
         self.access_key = VOLCANO_ACCESS_KEY
         self.model = DEEPSEEK_MODEL
+        self.breaker = get_breaker('volcano_llm')
+        # 长连接会话，复用TCP/TLS连接（录制/回放模式下经由 http_cassette）
+        self.session = create_http_session(name='volcano_llm')
     
-    def chat_stream(self, message, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS):
-        """流式聊天接口"""
+    def chat_stream(self, message, temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS, system_prompt=None,
+                    deadline=None, top_p=None):
+        """流式聊天接口，system_prompt 由人设指定，未指定时使用内置人设
+
+        生成请求非幂等（重复执行会重复计费），只在请求确定未被执行（连接超时、429/503）时按退避重试，
+        连接与读取超时不超过 deadline 的剩余时间。
+        """
+        deadline = deadline or Deadline()
         # 火山引擎API使用API Key认证方式
         headers = {
             'Content-Type': 'application/json',
@@ -92,7 +127,7 @@ class VolcanoLLMClient:
             'messages': [
                 {
                     'role': 'system',
-                    'content': '你是陈耀忠，长城物业的董事长'
+                    'content': system_prompt or PERSONA_SYSTEM_PROMPT
                 },
                 {
                     'role': 'user',
@@ -101,115 +136,49 @@ class VolcanoLLMClient:
             ],
             'temperature': temperature,
             'max_tokens': max_tokens,
-            'stream': True
+            'stream': True,
+            # 流结束前额外返回一帧token用量，用于按会话核算费用
+            'stream_options': {'include_usage': True}
         }
+        if top_p is not None:
+            payload['top_p'] = top_p
         
+        # 熔断打开时快速失败，不再等待超时
+        self.breaker.before_call()
+        start_time = time.time()
         try:
             logger.info(f"发送LLM请求到: {self.api_url}")
             logger.info(f"使用模型: {self.model}")
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                stream=True,
-                timeout=30
-            )
-            logger.info(f"API响应状态码: {response.status_code}")
-            response.raise_for_status()
+            
+            def _post():
+                response = self.session.post(
+                    self.api_url,
+                    headers=headers,
+                    json=payload,
+                    stream=True,
+                    timeout=(deadline.timeout(VOLCANO_LLM_CONNECT_TIMEOUT), deadline.timeout(VOLCANO_LLM_READ_TIMEOUT))
+                )
+                logger.info(f"API响应状态码: {response.status_code}")
+                try:
+                    response.raise_for_status()
+                except requests.HTTPError:
+                    logger.error(f"响应内容: {response.text}")
+                    response.close()
+                    raise
+                return response
+            
+            response = retry_call(_post, 'volcano_llm.chat', deadline=deadline, retryable=is_retryable_unsent)
+            # 以首包耗时作为延迟指标
+            self.breaker.record_success(time.time() - start_time)
             return response
         except Exception as e:
+            self.breaker.record_failure(time.time() - start_time)
             logger.error(f"LLM请求失败: {e}")
-            logger.error(f"响应内容: {response.text if 'response' in locals() else '无响应'}")
+            if self.breaker.is_open():
+                # 本次失败触发了熔断，与飞书Aily客户端一致，交由调用方故障转移
+                raise CircuitOpenError(self.breaker.name, self.breaker.recovery_timeout) from e
             raise
 
-class VolcanoTTSClient:
-    """火山引擎语音合成客户端 - V3版本支持声音复刻"""
-    
-    def __init__(self):
-        self.app_id = VOICE_APP_ID
-        self.access_token = VOICE_ACCESS_TOKEN
-        self.voice_type = TTS_VOICE_TYPE  # 从环境变量读取音色ID
-        # 使用V3版本API端点
-        self.api_url = "https://openspeech.bytedance.com/api/v3/tts/unidirectional"
-    
-    def synthesize(self, text):
-        """语音合成 - V3版本"""
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Api-App-Id': self.app_id,
-            'X-Api-Access-Key': self.access_token,
-            'X-Api-Resource-Id': TTS_RESOURCE_ID,  # 从环境变量读取资源ID
-            'X-Api-Request-Id': str(int(time.time() * 1000))
-        }
-        
-        payload = {
-            'user': {
-                'uid': 'user_001'
-            },
-            'namespace': 'BidirectionalTTS',
-            'req_params': {
-                'text': text,
-                'speaker': self.voice_type,  # 使用声音复刻音色ID
-                'audio_params': {
-                    'format': 'mp3',
-                    'sample_rate': 24000,
-                    'speech_rate': TTS_SPEECH_RATE,  # 从配置常量读取语速
-                    'loudness_rate': 0  # 音量，取值范围[-50,100]
-                }
-            }
-        }
-        
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=30,
-                stream=True  # 启用流式响应
-            )
-            response.raise_for_status()
-            
-            # 处理流式响应 - V3版本返回多个JSON对象
-            audio_data_parts = []
-            
-            for line in response.iter_lines():
-                if line:
-                    line_str = line.decode('utf-8').strip()
-                    if not line_str:
-                        continue
-                        
-                    try:
-                        result = json.loads(line_str)
-                        logger.debug(f"TTS流式响应: {result}")
-                        
-                        # 检查是否有音频数据
-                        if result.get('data') and isinstance(result['data'], str):
-                            # 收集base64音频数据
-                            audio_data_parts.append(result['data'])
-                            
-                        # 检查是否完成
-                        if result.get('code') == 20000000 and result.get('message') == 'OK':
-                            logger.info("TTS流式响应完成")
-                            break
-                            
-                    except json.JSONDecodeError as e:
-                        logger.warning(f"TTS流式响应JSON解析失败: {e}, 行内容: {line_str}")
-                        continue
-            
-            # 合并所有音频数据
-            if audio_data_parts:
-                # 将所有base64数据合并
-                combined_audio_data = ''.join(audio_data_parts)
-                logger.info(f"TTS音频数据合并完成，总长度: {len(combined_audio_data)}")
-                return base64.b64decode(combined_audio_data)
-            else:
-                logger.error("TTS响应中未找到音频数据")
-                return None
-            
-        except Exception as e:
-            logger.error(f"TTS请求失败: {e}")
-            return None
-
 # 初始化客户端
 
 class VolcanoASRClient:
@@ -229,6 +198,8 @@ class VolcanoASRClient:
         self.enable_itn = ASR_ENABLE_ITN
         self.enable_punc = ASR_ENABLE_PUNC
         self.enable_ddc = ASR_ENABLE_DDC
+        self.breaker = get_breaker('volcano_asr')
+        self.session = create_http_session(name='volcano_asr')
 
         # 关键配置校验
         missing = []
@@ -298,25 +269,29 @@ class VolcanoASRClient:
                 safe_headers['X-Api-Access-Key'] = '***'
             if 'X-Api-App-Key' in safe_headers:
                 safe_headers['X-Api-App-Key'] = '***'
-            logger.debug(f"ASR请求头: {safe_headers}")
-            logger.debug(f"ASR请求体: {payload}")
+            if sample_log(logger, 'asr.http'):
+                logger.debug(f"ASR请求头: {safe_headers}")
+                logger.debug(f"ASR请求体: {payload}")
             
-            response = requests.post(
-                self.submit_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            # 详细日志：状态码、响应头、原始文本
-            logger.debug(f"ASR提交HTTP状态: {response.status_code}")
-            try:
-                logger.debug(f"ASR提交响应头: {dict(response.headers)}")
-            except Exception:
-                logger.debug("ASR提交响应头记录失败")
-            try:
-                logger.debug(f"ASR提交响应文本: {response.text[:1000]}")
-            except Exception:
-                logger.debug("ASR提交响应文本记录失败")
+            with upstream_span('volcano_asr.submit'):
+                response = self.breaker.call(
+                    self.session.post,
+                    self.submit_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=30
+                )
+            # 详细日志（按采样率记录）：状态码、响应头、原始文本
+            if sample_log(logger, 'asr.http'):
+                logger.debug(f"ASR提交HTTP状态: {response.status_code}")
+                try:
+                    logger.debug(f"ASR提交响应头: {dict(response.headers)}")
+                except Exception:
+                    logger.debug("ASR提交响应头记录失败")
+                try:
+                    logger.debug(f"ASR提交响应文本: {response.text[:1000]}")
+                except Exception:
+                    logger.debug("ASR提交响应文本记录失败")
 
             response.raise_for_status()
 
@@ -339,7 +314,8 @@ class VolcanoASRClient:
             except ValueError:
                 logger.debug("ASR提交响应体为空或非JSON格式")
                 result = {}
-            logger.debug(f"ASR提交响应JSON(兼容解析): {result}")
+            if sample_log(logger, 'asr.http'):
+                logger.debug(f"ASR提交响应JSON(兼容解析): {result}")
 
             resp = result.get('resp', {})
             code = resp.get('code')
@@ -402,24 +378,26 @@ class VolcanoASRClient:
                 safe_headers['X-Api-Access-Key'] = '***'
             if 'X-Api-App-Key' in safe_headers:
                 safe_headers['X-Api-App-Key'] = '***'
-            logger.debug(f"ASR查询请求头: {safe_headers}")
-            logger.debug(f"ASR查询请求体: {payload}")
+            if sample_log(logger, 'asr.http'):
+                logger.debug(f"ASR查询请求头: {safe_headers}")
+                logger.debug(f"ASR查询请求体: {payload}")
             
-            response = requests.post(
-                query_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            logger.debug(f"ASR查询HTTP状态: {response.status_code}")
-            try:
-                logger.debug(f"ASR查询响应头: {dict(response.headers)}")
-            except Exception:
-                logger.debug("ASR查询响应头记录失败")
-            try:
-                logger.debug(f"ASR查询响应文本: {response.text[:1000]}")
-            except Exception:
-                logger.debug("ASR查询响应文本记录失败")
+            # 查询接口幂等，使用对冲请求压低尾延迟，多次尝试只计一次熔断结果
+            with upstream_span('volcano_asr.query'):
+                response = hedged_call(
+                    lambda: self.session.post(query_url, headers=headers, json=payload, timeout=30),
+                    breaker=self.breaker
+                )
+            if sample_log(logger, 'asr.http'):
+                logger.debug(f"ASR查询HTTP状态: {response.status_code}")
+                try:
+                    logger.debug(f"ASR查询响应头: {dict(response.headers)}")
+                except Exception:
+                    logger.debug("ASR查询响应头记录失败")
+                try:
+                    logger.debug(f"ASR查询响应文本: {response.text[:1000]}")
+                except Exception:
+                    logger.debug("ASR查询响应文本记录失败")
 
             # 先依据响应头的状态码判断处理流程
             x_status = response.headers.get('X-Api-Status-Code') or response.headers.get('x-api-status-code')
@@ -448,7 +426,8 @@ class VolcanoASRClient:
             except ValueError:
                 logger.error(f"ASR查询响应非JSON，原始文本: {response.text}")
                 return {'success': False, 'error': '查询响应非JSON'}
-            logger.debug(f"ASR查询响应JSON: {result}")
+            if sample_log(logger, 'asr.http'):
+                logger.debug(f"ASR查询响应JSON: {result}")
             # 兼容 v3 返回结构：顶层包含 result
             if isinstance(result, dict) and 'result' in result:
                 res = result.get('result', {})
@@ -505,8 +484,12 @@ class VolcanoASRClient:
             logger.error(f"ASR结果查询异常: {str(e)}")
             return {'success': False, 'error': f'查询结果异常: {str(e)}'}
     
-    def recognize_with_polling(self, audio_url, max_wait_time=60, poll_interval=2):
-        """提交任务并轮询获取结果"""
+    def recognize_with_polling(self, audio_url, max_wait_time=60, poll_interval=2, cancel_token=None):
+        """提交任务并轮询获取结果，cancel_token 被取消时立即停止轮询，轮询时长不超过其截止时间"""
+        if cancel_token is not None:
+            remaining = cancel_token.deadline.remaining()
+            if remaining is not None:
+                max_wait_time = min(max_wait_time, remaining)
         # 提交任务
         submit_result = self.submit_task(audio_url)
         if not submit_result['success']:
@@ -517,6 +500,9 @@ class VolcanoASRClient:
         
         # 轮询查询结果
         while time.time() - start_time < max_wait_time:
+            if cancel_token is not None and cancel_token.is_set():
+                logger.info(f"ASR任务 {task_id} 已取消，停止轮询")
+                return {'success': False, 'error': '识别已取消', 'cancelled': True}
             query_result = self.query_result(task_id, request_id=submit_result.get('request_id'))
             
             if not query_result['success']:
@@ -525,7 +511,10 @@ class VolcanoASRClient:
             if query_result.get('status') == 'completed':
                 return query_result
             elif query_result.get('status') == 'processing':
-                time.sleep(poll_interval)
+                if cancel_token is not None:
+                    cancel_token.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
                 continue
             else:
                 return {'success': False, 'error': '未知状态'}
@@ -554,33 +543,168 @@ class VolcanoASRClient:
             logger.error(f"ASR识别异常: {str(e)}")
             return {'success': False, 'error': f'识别异常: {str(e)}'}
 
-# 初始化客户端
-if LLM_PROVIDER == "feishu_aily":
-    llm_client = FeishuAilyStreamingClient()
-    logger.info(f"使用飞书Aily流式LLM提供商")
-else:
-    llm_client = VolcanoLLMClient()
-    logger.info(f"使用火山引擎LLM提供商")
+# 初始化客户端：各LLM提供商常驻一个实例，按请求路由；只注册 LLM_PROVIDERS 中启用且配置完整的提供商
+LLM_CLIENT_FACTORIES = {'feishu_aily': FeishuAilyStreamingClient, 'volcano': VolcanoLLMClient}
+# 各提供商客户端使用的熔断器名称，就绪检查据此判断而不必创建客户端
+LLM_BREAKER_NAMES = {'feishu_aily': 'feishu_aily', 'volcano': 'volcano_llm'}
+llm_registry = LLMProviderRegistry(default_provider=app_settings.default_llm_provider)
+for _provider in app_settings.available_llm_providers:
+    llm_registry.register(_provider, LLM_CLIENT_FACTORIES[_provider])
+if app_settings.llm_warmup_on_start:
+    llm_registry.warm_up()
+logger.info(f"默认LLM提供商: {llm_registry.default_provider}，路由策略: {llm_registry.strategy}")
+
+# TTS/ASR客户端在首次使用时创建，纯文本部署或只承载部分路由的进程不会初始化它们
+tts_client = LazyClient('tts', VolcanoTTSClient, app_settings)
+tts_prerenderer = LazyClient('tts', lambda: TTSPrerenderer(tts_client.get(), TTSAudioStore(TTS_STORE_DIR)),
+                             app_settings)
+asr_client = LazyClient('asr', VolcanoASRClient, app_settings)
+conversation_store = ConversationStore(settings=app_settings.conversation_store)
+# 人设注册表：人设文件修改后自动重新加载，按请求选择人设，所有人设共用上面的客户端
+persona_registry = PersonaRegistry()
+cancellation_registry = CancellationRegistry()
+usage_tracker = UsageTracker()
+client_render_stats = ClientRenderStats()
+STARTED_AT = time.time()
+
+# 上游依赖探测：只登记已启用的提供商与功能，结果按 HEALTH_PROBE_INTERVAL 缓存
+if llm_registry.has_provider('feishu_aily'):
+    health_monitor.add_probe('feishu_token', lambda: llm_registry.get('feishu_aily').ping())
+if llm_registry.has_provider('volcano'):
+    health_monitor.add_probe('volcano_llm', lambda: http_reachable(llm_registry.get('volcano').api_url))
+if app_settings.feature('tts').available:
+    health_monitor.add_probe('volcano_tts', lambda: http_reachable(tts_client.get().api_url))
+if app_settings.feature('asr').available:
+    health_monitor.add_probe('volcano_asr', lambda: http_reachable(asr_client.get().submit_url))
+
+
+def require_feature(feature):
+    """路由装饰器：功能关闭或配置不完整时直接返回503"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                app_settings.require(feature)
+            except FeatureUnavailableError as e:
+                return jsonify({'error': str(e), 'feature': feature}), 503
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def require_admin(view):
+    """管理接口：未配置 ADMIN_TOKEN 时接口不存在，令牌不匹配时返回403"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': '接口不存在'}), 404
+        if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+            return jsonify({'error': '管理令牌无效'}), 403
+        return view(*args, **kwargs)
+    return wrapper
 
-tts_client = VolcanoTTSClient()
-asr_client = VolcanoASRClient()
+
+@app.before_request
+def begin_request_trace():
+    """请求追踪开启时为本请求建立追踪记录并绑定到请求线程"""
+    route = f"{request.method} {request.url_rule.rule if request.url_rule else '(unmatched)'}"
+    trace = request_tracer.begin(route, request.headers.get('X-Request-Id'))
+    if trace is not None:
+        request.environ['chatagent.trace'] = (trace, trace.attach())
+
+
+@app.after_request
+def finish_request_trace(response):
+    """响应（含流式响应）发送完毕、连接关闭时结束追踪"""
+    bound = request.environ.pop('chatagent.trace', None)
+    if bound is not None:
+        trace, token = bound
+
+        def finish():
+            trace.detach(token)
+            request_tracer.finish(trace)
+        response.call_on_close(finish)
+    return response
+
+
+def resolve_persona(name):
+    """按请求中的人设名称取人设，未指定时返回默认人设，名称不存在时返回None"""
+    return persona_registry.resolve((name or '').strip() or None)
+
+
+def request_timeout():
+    """本次请求的总时限：CHAT_REQUEST_TIMEOUT，客户端可通过 X-Request-Timeout（秒）缩短"""
+    try:
+        requested = float(request.headers.get('X-Request-Timeout') or 0)
+    except ValueError:
+        requested = 0
+    return min(requested, CHAT_REQUEST_TIMEOUT) if requested > 0 else CHAT_REQUEST_TIMEOUT
+
+
+def persona_tts_client(persona):
+    """人设对应音色/语速的TTS客户端视图"""
+    return tts_client.get().with_voice(persona.voice_type, persona.speech_rate)
+
+
+def get_failover_client(name):
+    """返回与当前提供商互为备份的另一LLM提供商（Volcano ↔ Aily），无可用备份时返回None"""
+    if not LLM_FAILOVER_ENABLED:
+        return None
+    return llm_registry.failover(name)
+
+
+def resolve_provider(provider, persona):
+    """本次请求指定的提供商：用户显式选择 > 人设绑定；都未指定时返回None，由会话绑定与路由策略决定"""
+    if provider:
+        return provider
+    if persona.provider and not llm_registry.has_provider(persona.provider):
+        logger.warning(f"人设 {persona.name} 绑定的LLM提供商 {persona.provider} 不可用，按路由策略选择")
+        return None
+    return persona.provider
+
+
+def select_llm_client(provider=None, conversation_id=None):
+    """选择本次请求使用的LLM提供商，返回 (名称, 客户端)；当前提供商熔断时按配置转移到备用提供商"""
+    name, client = llm_registry.route(provider, conversation_id)
+    if client.breaker.is_open():
+        backup = get_failover_client(name)
+        if backup is not None:
+            logger.warning(f"LLM提供商 {name} 熔断中，故障转移到 {backup[0]}")
+            return backup
+    return name, client
+
+# 静态资源管线：首次请求页面或静态资源时计算指纹并预压缩
+asset_pipeline = None
+if app_settings.static_assets.enabled:
+    asset_pipeline = StaticAssetPipeline(os.path.dirname(os.path.abspath(__file__)), settings=app_settings.static_assets)
+
+def serve_asset(directory, filename):
+    """优先从资源管线返回（带指纹URL长期缓存），未命中时回退为文件服务"""
+    if asset_pipeline is not None and asset_pipeline.ensure_built():
+        asset, immutable = asset_pipeline.lookup(f"{directory}/{filename}")
+        if asset is not None:
+            return asset_pipeline.make_response(asset, immutable)
+    return send_from_directory(directory, filename)
 
 @app.route('/')
 def index():
     """主页"""
+    if asset_pipeline is not None and asset_pipeline.ensure_built() and asset_pipeline.index_asset is not None:
+        return asset_pipeline.make_response(asset_pipeline.index_asset, immutable=False)
     return send_from_directory('.', 'index.html')
 
 @app.route('/static/<path:filename>')
 def static_files(filename):
     """静态文件服务"""
-    return send_from_directory('static', filename)
+    return serve_asset('static', filename)
 
 @app.route('/resources/<path:filename>')
 def resource_files(filename):
     """资源文件服务"""
-    return send_from_directory('resources', filename)
+    return serve_asset('resources', filename)
 
 @app.route('/api/chat', methods=['POST'])
+@require_feature('llm')
 def chat():
     """聊天接口"""
     try:
@@ -592,10 +716,32 @@ def chat():
         
         # 检查是否需要流式响应
         stream = data.get('stream', False)
+        # 按请求/会话选择LLM提供商，不影响其他用户
+        provider = (data.get('provider') or '').strip() or None
+        if provider and not llm_registry.has_provider(provider):
+            return jsonify({'error': '不支持的LLM提供商'}), 400
+        conversation_id = (data.get('conversation_id') or '').strip() or None
+        persona = resolve_persona(data.get('persona'))
+        if persona is None:
+            return jsonify({'error': '人设不存在'}), 400
+        provider = resolve_provider(provider, persona)
+        # 消息来源：text 为键盘输入，voice 为语音识别结果
+        input_mode = 'voice' if data.get('input_mode') == 'voice' else 'text'
+        # 生成参数：请求显式参数 > 人设 > profile 档位 > 按输入方式的默认档位（语音回答更短），不超过人设上限
+        generation = resolve_generation_params(data.get('profile'), input_mode, {
+            'temperature': data.get('temperature'),
+            'max_tokens': data.get('max_tokens'),
+            'top_p': data.get('top_p')
+        }, persona.generation_limits())
         
         if stream:
+            # 客户端断开或调用 /api/cancel 时取消，上游轮询与连接随即停止
+            cancel_token = cancellation_registry.register(request.headers.get('X-Request-Id'), request_timeout())
             return Response(
-                generate_stream_response(message),
+                cancellation_registry.guard(cancel_token, stream_sse(
+                    generate_stream_response(message, provider, conversation_id, input_mode, cancel_token,
+                                             generation, persona),
+                    cancel_token)),
                 mimetype='text/event-stream',
                 headers={
                     'Cache-Control': 'no-cache',
@@ -606,144 +752,336 @@ def chat():
             )
         else:
             # 非流式响应（备用）
-            if isinstance(llm_client, FeishuAilyStreamingClient):
-                # 飞书Aily非流式响应
-                response = llm_client.chat_completion(message)
+            turn = TurnRecord(conversation_id, message, input_mode)
+            turn.profile = generation['profile']
+            turn.provider, client = select_llm_client(provider, conversation_id)
+            try:
+                response = complete_llm_response(client, message, turn, generation, persona)
+            except CircuitOpenError as e:
+                # 熔断且尚未输出任何内容，与流式接口一致转移到备用提供商
+                backup = get_failover_client(turn.provider)
+                if backup is None:
+                    raise
+                logger.warning(f"{e}，故障转移到 {backup[0]}")
+                turn.provider, client = backup
+                response = complete_llm_response(client, message, turn, generation, persona)
+            turn.assistant_text = response or ''
+            record_turn_usage(turn)
+            if isinstance(client, FeishuAilyStreamingClient):
                 return jsonify({'response': response})
-            else:
-                # 火山引擎非流式响应
-                response = llm_client.chat_stream(message)
-                full_response = ""
-                
-                for line in response.iter_lines():
-                    if line:
-                        line = line.decode('utf-8')
-                        if line.startswith('data: '):
-                            data_str = line[6:]
-                            if data_str == '[DONE]':
-                                break
-                            try:
-                                data_obj = json.loads(data_str)
-                                if 'choices' in data_obj and data_obj['choices']:
-                                    delta = data_obj['choices'][0].get('delta', {})
-                                    content = delta.get('content', '')
-                                    full_response += content
-                            except json.JSONDecodeError:
-                                continue
-                
-                return jsonify({'response': full_response})
+            return jsonify({'response': response, 'usage': turn.usage})
             
+    except CircuitOpenError as e:
+        logger.error(f"聊天接口错误: {e}")
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"聊天接口错误: {e}")
         return jsonify({'error': '服务器内部错误'}), 500
 
-def generate_stream_response(message):
-    """生成流式响应"""
+def complete_llm_response(client, message, turn, generation, persona):
+    """非流式生成完整回答，火山引擎的token用量写入 turn.usage"""
+    if isinstance(client, FeishuAilyStreamingClient):
+        return client.chat_completion(message, skill_app_id=persona.skill_app_id, skill_id=persona.skill_id)
+    response = client.chat_stream(message, generation['temperature'], generation['max_tokens'],
+                                  persona.system_prompt, top_p=generation.get('top_p'))
+    full_response = ""
+    for line in response.iter_lines():
+        if not line:
+            continue
+        line = line.decode('utf-8')
+        if not line.startswith('data: '):
+            continue
+        data_str = line[6:]
+        if data_str == '[DONE]':
+            break
+        try:
+            data_obj = json.loads(data_str)
+        except json.JSONDecodeError:
+            continue
+        if data_obj.get('usage'):
+            turn.usage = data_obj['usage']
+        if data_obj.get('choices'):
+            full_response += data_obj['choices'][0].get('delta', {}).get('content', '')
+    return full_response
+
+
+def generate_stream_response(message, provider=None, conversation_id=None, input_mode='text', cancel_token=None,
+                             generation=None, persona=None):
+    """生成流式响应事件（文本增量或控制帧），结束（含客户端断开）后异步记录本轮对话与用量"""
+    generation = generation or resolve_generation_params(None, input_mode)
+    persona = persona or persona_registry.default
+    turn = TurnRecord(conversation_id, message, input_mode)
+    turn.profile = generation['profile']
     try:
         logger.info(f"开始生成流式响应，消息: {message}")
+        name, client = select_llm_client(provider, conversation_id)
+        try:
+            yield from track_llm_stream(name, stream_llm_response(client, message, turn, cancel_token, generation,
+                                                                  persona), turn)
+        except CircuitOpenError as e:
+            # 熔断且尚未输出任何内容，尝试转移到备用提供商
+            backup = get_failover_client(name)
+            if backup is None:
+                raise
+            logger.warning(f"{e}，故障转移到 {backup[0]}")
+            yield from track_llm_stream(backup[0], stream_llm_response(backup[1], message, turn, cancel_token,
+                                                                       generation, persona), turn)
+        if cancel_token is not None and cancel_token.is_set():
+            turn.status = 'aborted'
         
-        # 根据当前LLM客户端类型处理不同的响应格式
-        if isinstance(llm_client, FeishuAilyStreamingClient):
-            # 飞书Aily返回生成器
-            response_generator = llm_client.chat_completion_stream(message)
-            full_response = ""
-            
-            for chunk in response_generator:
-                if chunk:
+    except GeneratorExit:
+        turn.status = 'aborted'
+        raise
+    except Exception as e:
+        turn.status = 'error'
+        logger.error(f"流式响应错误: {e}")
+        yield {
+            'error': {
+                'message': '生成响应时出现错误',
+                'type': 'server_error'
+            }
+        }
+    finally:
+        record_turn_usage(turn)
+
+def record_turn_usage(turn):
+    """持久化本轮对话并计入按提供商/档位/会话的用量统计"""
+    conversation_store.record_turn(turn)
+    usage_tracker.record(turn.provider, turn.profile, turn.conversation_id, turn.usage,
+                         turn.first_chunk_latency, time.time() - turn.started_at)
+
+def track_llm_stream(name, events, turn=None):
+    """统计提供商在途请求数与首包延迟，供路由器按负载/延迟选择"""
+    start_time = time.time()
+    first_chunk_latency = None
+    llm_registry.begin(name)
+    if turn is not None:
+        turn.provider = name
+    try:
+        for event in events:
+            if first_chunk_latency is None:
+                first_chunk_latency = time.time() - start_time
+                mark(f'{name}.first_chunk')
+                if turn is not None:
+                    turn.first_chunk_latency = first_chunk_latency
+            yield event
+    finally:
+        mark(f'{name}.done')
+        llm_registry.end(name, first_chunk_latency)
+
+def stream_llm_response(client, message, turn=None, cancel_token=None, generation=None, persona=None):
+    """使用指定LLM客户端生成流式事件：str 为文本增量，dict 为需原样下发的控制帧
+
+    SSE分帧、微批合并与 [DONE] 结束标记由 sse_stream.stream_sse 统一处理。
+    generation 中的 temperature/max_tokens/top_p 仅对火山引擎生效，Aily由技能侧配置决定；
+    persona 决定火山引擎的系统提示词与Aily使用的技能。
+    """
+    persona = persona or persona_registry.default
+    # 根据LLM客户端类型处理不同的响应格式
+    if isinstance(client, FeishuAilyStreamingClient):
+        # 飞书Aily返回生成器
+        response_generator = client.chat_completion_stream(message, cancel_event=cancel_token,
+                                                           skill_app_id=persona.skill_app_id,
+                                                           skill_id=persona.skill_id,
+                                                           deadline=cancel_token.deadline if cancel_token else None)
+        full_response = ""
+        
+        for chunk in response_generator:
+            if chunk:
+                if sample_log(logger, 'aily.chunk'):
                     logger.debug(f"飞书Aily响应块: {chunk}")
-                    full_response += chunk
-                    
-                    # 构造SSE格式的响应
-                    sse_data = {
-                        'choices': [{
-                            'delta': {
-                                'content': chunk
-                            }
-                        }]
-                    }
-                    yield f'data: {json.dumps(sse_data, ensure_ascii=False)}\n\n'
-            
-            logger.info(f"飞书Aily流式响应完成，完整内容: {full_response}")
-            yield 'data: [DONE]\n\n'
-            
-        else:
-            # 火山引擎返回requests.Response对象
-            response = llm_client.chat_stream(message)
-            full_response = ""  # 用于收集完整响应
-            
+                if isinstance(chunk, AilyContentReplace):
+                    # 部分消息被改写，通知前端整体替换已显示内容
+                    full_response = str(chunk)
+                    if turn is not None:
+                        turn.assistant_text = full_response
+                    yield {'replace': full_response}
+                    continue
+                full_response += chunk
+                if turn is not None:
+                    turn.assistant_text = full_response
+                yield str(chunk)
+        
+        logger.info(f"飞书Aily流式响应完成，内容长度: {len(full_response)}")
+        if sample_log(logger, 'llm.answer'):
+            logger.debug(f"飞书Aily完整内容: {full_response}")
+        
+    else:
+        # 火山引擎返回requests.Response对象
+        generation = generation or resolve_generation_params(None)
+        response = client.chat_stream(message, generation['temperature'], generation['max_tokens'],
+                                      persona.system_prompt, cancel_token.deadline if cancel_token else None,
+                                      top_p=generation.get('top_p'))
+        full_response = ""  # 用于收集完整响应
+        if cancel_token is not None:
+            # 取消时直接关闭上游连接，打断阻塞中的读取
+            cancel_token.add_callback(response.close)
+        try:
             for line in response.iter_lines():
+                if cancel_token is not None and cancel_token.is_set():
+                    break
                 if line:
                     line = line.decode('utf-8')
-                    logger.debug(f"收到响应行: {line}")
-                    
+                    if sample_log(logger, 'llm.line'):
+                        logger.debug(f"收到响应行: {line}")
+                
                     # 处理火山引擎API的响应格式
                     if line.startswith('data: '):
                         data_content = line[6:].strip()  # 移除 'data: ' 前缀
-                        logger.debug(f"处理数据: {data_content}")
-                        
+                    
                         if data_content == '[DONE]':
-                            logger.info(f"流式响应完成，完整内容: {full_response}")
-                            yield 'data: [DONE]\n\n'
+                            logger.info(f"流式响应完成，内容长度: {len(full_response)}")
+                            if sample_log(logger, 'llm.answer'):
+                                logger.debug(f"完整内容: {full_response}")
                             break
-                        
+                    
                         try:
                             data = json.loads(data_content)
-                            # 提取内容并累积到完整响应中
-                            if 'choices' in data and len(data['choices']) > 0:
-                                choice = data['choices'][0]
-                                if 'delta' in choice and 'content' in choice['delta']:
-                                    content = choice['delta']['content']
-                                    if content:
-                                        full_response += content
                         except json.JSONDecodeError:
-                            pass
-                        
-                        # 直接转发数据
-                        yield f'data: {data_content}\n\n'
+                            continue
+                    
+                        # 最后一帧携带本次请求的token用量（choices为空）
+                        if data.get('usage') and turn is not None:
+                            turn.usage = data['usage']
+                        # 文本增量交给输出层合并，其余帧（角色、结束原因、用量等）原样下发
+                        content = ''
+                        if 'choices' in data and len(data['choices']) > 0:
+                            content = data['choices'][0].get('delta', {}).get('content') or ''
+                        if content:
+                            full_response += content
+                            if turn is not None:
+                                turn.assistant_text = full_response
+                            yield content
+                        else:
+                            yield data
                     elif line.strip():
                         # 如果不是标准SSE格式，尝试解析为JSON
                         try:
-                            json.loads(line)
-                            logger.debug(f"发送非SSE格式数据: {line}")
-                            yield f'data: {line}\n\n'
+                            data = json.loads(line)
+                            if sample_log(logger, 'llm.line'):
+                                logger.debug(f"发送非SSE格式数据: {line}")
+                            yield data
                         except json.JSONDecodeError:
-                            logger.debug(f"跳过非JSON行: {line}")
+                            if sample_log(logger, 'llm.line'):
+                                logger.debug(f"跳过非JSON行: {line}")
                             continue
-                        
-            # 确保发送结束信号
-            yield 'data: [DONE]\n\n'
-            logger.info("火山引擎流式响应完成")
+        except Exception:
+            # 取消回调关闭连接会使读取抛出异常，属正常结束
+            if cancel_token is None or not cancel_token.is_set():
+                raise
+        finally:
+            # 提前结束（取消或客户端断开）时及时释放上游连接
+            response.close()
+        if cancel_token is not None and cancel_token.is_set():
+            logger.info("火山引擎流式响应已取消")
+            return
+        logger.info("火山引擎流式响应完成")
+
+@app.route('/api/cancel', methods=['POST'])
+def cancel_request():
+    """按请求ID取消进行中的聊天或语音识别：停止轮询、关闭上游连接并取消Aily运行"""
+    data = request.get_json(silent=True, force=True) or {}
+    request_id = (data.get('request_id') or '').strip()
+    if not request_id:
+        return jsonify({'error': 'request_id 不能为空'}), 400
+    if not cancellation_registry.cancel(request_id, data.get('reason') or 'client'):
+        return jsonify({'error': '请求不存在或已结束'}), 404
+    return jsonify({'success': True, 'request_id': request_id})
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """运行指标：LLM路由与熔断状态、token用量与估算费用（按提供商/档位/会话汇总）"""
+    return jsonify({
+        'llm': llm_registry.snapshot(),
+        'breakers': breaker_snapshots(),
+        'usage': usage_tracker.snapshot(),
+        'conversation_store': conversation_store.stats(),
+        'features': app_settings.features_dict(),
+        'personas': persona_registry.snapshot(),
+        'cache': cache_snapshot(),
+        'retries': retry_snapshots(),
+        'client': client_render_stats.snapshot(),
+        'active_requests': cancellation_registry.active_count()
+    })
+
+@app.route('/api/metrics/conversations/<conversation_id>', methods=['GET'])
+def conversation_metrics(conversation_id):
+    """单个会话的累计token用量、估算费用与平均延迟"""
+    usage = usage_tracker.conversation(conversation_id)
+    if usage is None:
+        return jsonify({'error': '会话不存在或尚无用量记录'}), 404
+    return jsonify({'conversation_id': conversation_id, 'usage': usage})
+
+@app.route('/api/metrics/client', methods=['POST'])
+def report_client_metrics():
+    """前端上报一次流式回答的渲染耗时（sendBeacon 发送，页面关闭时也能送达）"""
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': '请求体必须是JSON对象'}), 400
+    if not client_render_stats.record(data.get('kind'), data):
+        return jsonify({'error': '指标类型未知或缺少有效计时'}), 400
+    return jsonify({'success': True})
+
+@app.route('/api/personas', methods=['GET'])
+def list_personas():
+    """可用人设列表（不含系统提示词与技能配置），default 为未指定人设时使用的人设"""
+    return jsonify(persona_registry.describe())
+
+@app.route('/api/history', methods=['GET'])
+def conversation_history():
+    """会话历史查询：按 before 游标向前翻页，返回按时间正序的对话"""
+    conversation_id = (request.args.get('conversation_id') or '').strip()
+    if not conversation_id:
+        return jsonify({'error': 'conversation_id 不能为空'}), 400
+    try:
+        before = request.args.get('before', type=int)
+        limit = request.args.get('limit', default=20, type=int)
+        return jsonify(conversation_store.history(conversation_id, before, limit))
+    except Exception as e:
+        logger.error(f"查询会话历史异常: {e}")
+        return jsonify({'error': '服务器内部错误'}), 500
+
+@app.route('/api/warmup', methods=['POST'])
+@require_feature('llm')
+def warmup():
+    """预热接口：用户开始输入或录音时调用，提前准备token、连接和会话"""
+    try:
+        data = request.get_json(silent=True) or {}
+        provider = (data.get('provider') or '').strip() or None
+        conversation_id = (data.get('conversation_id') or '').strip() or None
+        if provider and not llm_registry.has_provider(provider):
+            return jsonify({'error': '不支持的LLM提供商'}), 400
+        persona = resolve_persona(data.get('persona'))
+        if persona is None:
+            return jsonify({'error': '人设不存在'}), 400
+        
+        name, client = llm_registry.route(resolve_provider(provider, persona), conversation_id)
+        prewarm_async = getattr(client, 'prewarm_async', None)
+        if prewarm_async is None:
+            return jsonify({'success': True, 'provider': name, 'warming': False})
+        
+        # 后台预热（按人设的技能应用准备会话），立即返回
+        prewarm_async(persona.skill_app_id)
+        return jsonify({'success': True, 'provider': name, 'warming': True}), 202
         
     except Exception as e:
-        logger.error(f"流式响应错误: {e}")
-        error_data = {
-            'error': {
-                'message': '生成响应时出现错误',
-                'type': 'server_error'
-            }
-        }
-        yield f'data: {json.dumps(error_data, ensure_ascii=False)}\n\n'
-        yield 'data: [DONE]\n\n'
+        logger.error(f"预热接口错误: {e}")
+        return jsonify({'error': '服务器内部错误'}), 500
 
 @app.route('/api/switch-llm', methods=['POST'])
+@require_admin
 def switch_llm():
-    """切换LLM提供商接口"""
+    """切换全局默认LLM提供商（影响所有未指定提供商的请求，需管理令牌）；单个请求请在 /api/chat 中指定 provider"""
     try:
-        data = request.get_json()
-        provider = data.get('provider', '').strip()
+        data = request.get_json(silent=True) or {}
+        provider = str(data.get('provider') or '').strip()
         
-        if provider not in ['volcano', 'feishu_aily']:
+        if not llm_registry.has_provider(provider):
             return jsonify({'error': '不支持的LLM提供商'}), 400
         
-        global llm_client
-        
-        # 切换LLM客户端
-        if provider == 'feishu_aily':
-            llm_client = FeishuAilyStreamingClient()
-            logger.info("已切换到飞书Aily流式LLM提供商")
-        else:
-            llm_client = VolcanoLLMClient()
-            logger.info("已切换到火山引擎LLM提供商")
+        # 仅修改默认提供商：常驻客户端实例不重建，进行中的请求不受影响
+        llm_registry.set_default(provider)
+        logger.info(f"默认LLM提供商已切换为: {provider}")
         
         return jsonify({
             'success': True,
@@ -756,6 +1094,7 @@ def switch_llm():
         return jsonify({'error': '服务器内部错误'}), 500
 
 @app.route('/api/stt', methods=['POST'])
+@require_feature('asr')
 def speech_to_text():
     """语音转文字接口 - 支持大模型ASR"""
     try:
@@ -788,60 +1127,250 @@ def speech_to_text():
         file.save(file_path)
         logger.info(f"上传音频已保存: {file_path} 大小={os.path.getsize(file_path)} 字段名='audio' 原文件名='{secure_filename(file.filename)}'")
         
-        try:
-            # 构建音频文件URL (需要可公网访问)
-            public_base = settings.ASR_PUBLIC_BASE_URL.strip() if hasattr(settings, 'ASR_PUBLIC_BASE_URL') else ''
-            if public_base:
-                # 确保不重复斜杠
-                if public_base.endswith('/'):
-                    public_base = public_base[:-1]
-                logger.info(f"使用配置的ASR_PUBLIC_BASE_URL: {public_base}")
-            else:
-                # 动态从用户访问的URL推断公共基地址
-                public_base = infer_public_base_url(request)
-                if public_base:
-                    logger.info(f"自动推断ASR公共基地址: {public_base}")
-                    if ('127.0.0.1' in public_base) or ('localhost' in public_base) or public_base.startswith('http://0.0.0.0'):
-                        logger.warning("自动推断的公共基地址是本地地址，外部ASR服务可能无法访问。建议在 .env 中设置 ASR_PUBLIC_BASE_URL 为可公网访问的域名或IP:端口。")
-                else:
-                    # 无法推断则回退到本地地址
-                    public_base = f"http://127.0.0.1:{SERVER_PORT}"
-                    logger.warning("无法从请求推断公共基地址，回退使用本地地址。外部ASR服务可能无法访问 http://127.0.0.1。请在 .env 中设置 ASR_PUBLIC_BASE_URL 为可公网访问的域名或IP:端口。")
-            audio_url = f"{public_base}/uploads/{filename}"
-            logger.info(f"构建的音频URL: {audio_url}")
-            
-            # 使用大模型ASR进行识别
-            result = asr_client.recognize_with_polling(audio_url)
-            
-            # 清理临时文件
-            if not ASR_KEEP_UPLOADS:
-                try:
-                    os.unlink(file_path)
-                    logger.debug(f"已删除上传临时文件: {file_path}")
-                except Exception as del_err:
-                    logger.warning(f"删除上传临时文件失败: {del_err}")
-            else:
-                logger.info(f"保留上传文件以便调试: {file_path}")
-            
-            if result and result.get('success'):
-                return jsonify({
-                    'success': True,
-                    'text': result.get('text', ''),
-                    'confidence': result.get('confidence', 0),
-                    'language': result.get('language', 'auto'),
-                    'duration': result.get('duration', 0)
-                })
-            else:
-                err = result.get('error') if result else '识别失败'
-                logger.error(f"ASR识别失败: {err}")
-                return jsonify({'success': False, 'error': err}), 500
-        except Exception as e:
-            logger.error(f"处理上传音频时异常: {e}")
-            return jsonify({'error': f'处理失败: {str(e)}'}), 500
+        return recognize_uploaded_audio(filename, request.form.get('conversation_id'))
     except Exception as e:
         logger.error(f"语音转文字接口异常: {e}")
         return jsonify({'error': f'接口异常: {str(e)}'}), 500
 
+@app.route('/api/voice-turn', methods=['POST'])
+@require_feature('asr')
+@require_feature('llm')
+def voice_turn():
+    """一次往返完成语音对话：上传音频，服务端依次做ASR、LLM与分句TTS，
+    以一条SSE流返回识别文本（type=transcript）、文本增量与按序的音频分段（type=audio，base64 MP3）"""
+    try:
+        file = request.files.get('audio')
+        if file is None or file.filename == '':
+            return jsonify({'error': '未找到音频文件'}), 400
+        if not allowed_file(file.filename):
+            return jsonify({'error': '不支持的音频格式'}), 400
+        provider = (request.form.get('provider') or '').strip() or None
+        if provider and not llm_registry.has_provider(provider):
+            return jsonify({'error': '不支持的LLM提供商'}), 400
+        conversation_id = (request.form.get('conversation_id') or '').strip() or None
+        persona = resolve_persona(request.form.get('persona'))
+        if persona is None:
+            return jsonify({'error': '人设不存在'}), 400
+        
+        filename = f"{int(time.time())}_{secure_filename(file.filename)}"
+        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        # 公网URL依赖请求上下文，在进入流式生成前构建
+        audio_url = build_public_audio_url(filename)
+        generation = resolve_generation_params(request.form.get('profile'), 'voice', None,
+                                               persona.generation_limits())
+        
+        cancel_token = cancellation_registry.register(request.headers.get('X-Request-Id'), request_timeout())
+        return Response(
+            cancellation_registry.guard(cancel_token, stream_sse(
+                generate_voice_turn(filename, audio_url, resolve_provider(provider, persona), conversation_id, generation,
+                                    cancel_token, persona),
+                cancel_token)),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'Connection': 'keep-alive',
+                'Access-Control-Allow-Origin': '*',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+    except Exception as e:
+        logger.error(f"语音对话接口异常: {e}")
+        return jsonify({'error': f'接口异常: {str(e)}'}), 500
+
+def generate_voice_turn(filename, audio_url, provider, conversation_id, generation, cancel_token, persona):
+    """语音轮次事件流：识别结果 → LLM文本增量与分句合成的音频"""
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        audio_bytes = os.path.getsize(file_path)
+        if STT_VAD_ENABLED and filename.lower().endswith('.wav'):
+            vad = trim_wav_file(file_path)
+            if vad.analyzed and not vad.speech:
+                yield {'type': 'error', 'error': '未检测到语音', 'no_speech': True}
+                return
+        
+        recognize_start = time.time()
+        result = asr_client.get().recognize_with_polling(audio_url, cancel_token=cancel_token)
+        asr_seconds = time.time() - recognize_start
+        mark('asr.done')
+        conversation_store.record_transcript(conversation_id, filename, result, audio_bytes, asr_seconds)
+    finally:
+        discard_upload(file_path)
+    
+    if not result or not result.get('success') or not result.get('text'):
+        if not cancel_token.is_set():
+            yield {'type': 'error', 'error': (result or {}).get('error') or '语音识别失败'}
+        return
+    text = result['text']
+    yield {'type': 'transcript', 'text': text, 'asr_ms': int(asr_seconds * 1000)}
+    
+    # 语音合成未启用时只返回文本
+    synthesize = persona_tts_client(persona).synthesize if app_settings.feature('tts').available else None
+    pipeline = VoiceTurnPipeline(synthesize)
+    yield from pipeline.stream(
+        generate_stream_response(text, provider, conversation_id, 'voice', cancel_token, generation, persona),
+        cancel_token)
+
+def build_public_audio_url(filename):
+    """构建ASR服务可访问的音频URL (需要可公网访问)"""
+    public_base = settings.ASR_PUBLIC_BASE_URL.strip() if hasattr(settings, 'ASR_PUBLIC_BASE_URL') else ''
+    if public_base:
+        # 确保不重复斜杠
+        if public_base.endswith('/'):
+            public_base = public_base[:-1]
+        logger.info(f"使用配置的ASR_PUBLIC_BASE_URL: {public_base}")
+    else:
+        # 动态从用户访问的URL推断公共基地址
+        public_base = infer_public_base_url(request)
+        if public_base:
+            logger.info(f"自动推断ASR公共基地址: {public_base}")
+            if ('127.0.0.1' in public_base) or ('localhost' in public_base) or public_base.startswith('http://0.0.0.0'):
+                logger.warning("自动推断的公共基地址是本地地址，外部ASR服务可能无法访问。建议在 .env 中设置 ASR_PUBLIC_BASE_URL 为可公网访问的域名或IP:端口。")
+        else:
+            # 无法推断则回退到本地地址
+            public_base = f"http://127.0.0.1:{SERVER_PORT}"
+            logger.warning("无法从请求推断公共基地址，回退使用本地地址。外部ASR服务可能无法访问 http://127.0.0.1。请在 .env 中设置 ASR_PUBLIC_BASE_URL 为可公网访问的域名或IP:端口。")
+    return f"{public_base}/uploads/{filename}"
+
+def discard_upload(file_path):
+    """识别结束后删除上传的音频（ASR_KEEP_UPLOADS 为真时保留以便调试）"""
+    if ASR_KEEP_UPLOADS:
+        logger.info(f"保留上传文件以便调试: {file_path}")
+        return
+    try:
+        os.unlink(file_path)
+        logger.debug(f"已删除上传临时文件: {file_path}")
+    except Exception as del_err:
+        logger.warning(f"删除上传临时文件失败: {del_err}")
+
+def recognize_uploaded_audio(filename, conversation_id=None):
+    """对上传目录中的音频文件执行ASR识别并返回接口响应，识别后按配置清理文件"""
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        audio_bytes = os.path.getsize(file_path)
+        if STT_VAD_ENABLED and filename.lower().endswith('.wav'):
+            # 裁掉首尾静音，ASR只处理语音部分；整段无语音时不再提交识别
+            vad = trim_wav_file(file_path)
+            if vad.analyzed and not vad.speech:
+                logger.info(f"未检测到语音，跳过识别: {filename}（{vad.original_seconds:.2f}秒）")
+                discard_upload(file_path)
+                return jsonify({'success': False, 'error': '未检测到语音', 'no_speech': True}), 422
+            if vad.trimmed_seconds > 0:
+                logger.info(f"VAD裁剪静音 {vad.trimmed_seconds:.2f}秒，保留 {vad.kept_seconds:.2f}秒")
+        
+        audio_url = build_public_audio_url(filename)
+        logger.info(f"构建的音频URL: {audio_url}")
+        
+        # 使用大模型ASR进行识别，可通过 /api/cancel 按请求ID取消
+        recognize_start = time.time()
+        cancel_token = cancellation_registry.register(request.headers.get('X-Request-Id'), request_timeout())
+        try:
+            result = asr_client.get().recognize_with_polling(audio_url, cancel_token=cancel_token)
+        finally:
+            cancellation_registry.unregister(cancel_token)
+        conversation_store.record_transcript((conversation_id or '').strip() or None, filename, result,
+                                             audio_bytes, time.time() - recognize_start)
+        
+        # 清理临时文件
+        discard_upload(file_path)
+        
+        if result and result.get('success'):
+            return jsonify({
+                'success': True,
+                'text': result.get('text', ''),
+                'confidence': result.get('confidence', 0),
+                'language': result.get('language', 'auto'),
+                'duration': result.get('duration', 0)
+            })
+        elif result and result.get('cancelled'):
+            return jsonify({'success': False, 'error': result['error'], 'cancelled': True}), 409
+        else:
+            err = result.get('error') if result else '识别失败'
+            logger.error(f"ASR识别失败: {err}")
+            return jsonify({'success': False, 'error': err}), 500
+    except Exception as e:
+        logger.error(f"处理上传音频时异常: {e}")
+        return jsonify({'error': f'处理失败: {str(e)}'}), 500
+
+def upload_error_response(error):
+    """断点续传协议错误响应，附带服务端当前偏移量便于客户端续传"""
+    body = {'success': False, 'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status
+
+@app.route('/api/stt/uploads', methods=['POST'])
+@require_feature('asr')
+def create_stt_upload():
+    """创建断点续传上传会话"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename', ''))
+        if not filename or not allowed_file(filename):
+            return jsonify({'error': '不支持的音频格式'}), 400
+        total_size = data.get('size')
+        if total_size is not None:
+            if isinstance(total_size, bool) or not str(total_size).isdigit():
+                return jsonify({'error': 'size 必须为非负整数'}), 400
+            total_size = int(total_size)
+        session = upload_manager.create(filename, total_size)
+        return jsonify({'success': True, **session.to_dict()}), 201
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        logger.error(f"创建上传会话异常: {e}")
+        return jsonify({'error': '服务器内部错误'}), 500
+
+@app.route('/api/stt/uploads/<upload_id>', methods=['GET'])
+@require_feature('asr')
+def get_stt_upload(upload_id):
+    """查询上传会话的当前偏移量（断线后据此续传）"""
+    try:
+        return jsonify({'success': True, **upload_manager.get(upload_id).to_dict()})
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/stt/uploads/<upload_id>', methods=['PUT'])
+@require_feature('asr')
+def append_stt_upload(upload_id):
+    """上传一个原始二进制分片，请求头 Upload-Offset 指定写入偏移量，可选 X-Chunk-Sha256 校验分片"""
+    try:
+        offset = request.headers.get('Upload-Offset')
+        if offset is None or not offset.isdigit():
+            return jsonify({'error': '缺少或无效的Upload-Offset请求头'}), 400
+        session = upload_manager.append(
+            upload_id,
+            int(offset),
+            request.stream,
+            expected_sha256=request.headers.get('X-Chunk-Sha256')
+        )
+        return jsonify({'success': True, **session.to_dict()})
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        logger.error(f"写入上传分片异常: {e}")
+        return jsonify({'error': f'分片写入失败: {str(e)}'}), 500
+
+@app.route('/api/stt/uploads/<upload_id>', methods=['DELETE'])
+@require_feature('asr')
+def abort_stt_upload(upload_id):
+    """放弃上传"""
+    upload_manager.abort(upload_id)
+    return jsonify({'success': True})
+
+@app.route('/api/stt/uploads/<upload_id>/commit', methods=['POST'])
+@require_feature('asr')
+def commit_stt_upload(upload_id):
+    """提交上传：校验SHA-256后直接进入ASR识别，返回结果与 /api/stt 一致"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = upload_manager.commit(upload_id, data.get('sha256'))
+        return recognize_uploaded_audio(filename, data.get('conversation_id'))
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        logger.error(f"提交上传异常: {e}")
+        return jsonify({'error': f'接口异常: {str(e)}'}), 500
+
 # 提供上传文件的访问路由
 @app.route('/uploads/')
 def uploads_index():
@@ -852,6 +1381,7 @@ def uploaded_file(filename):
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 @app.route('/api/tts', methods=['POST'])
+@require_feature('tts')
 def text_to_speech():
     """语音合成接口"""
     try:
@@ -860,13 +1390,31 @@ def text_to_speech():
         
         if not text:
             return jsonify({'error': '文本不能为空'}), 400
+        persona = resolve_persona(data.get('persona'))
+        if persona is None:
+            return jsonify({'error': '人设不存在'}), 400
+        voice = persona_tts_client(persona)
         
         # 限制文本长度
-        if len(text) > 1000:
-            text = text[:1000]
+        if len(text) > app_settings.tts.longform_max_chars:
+            text = text[:app_settings.tts.longform_max_chars]
         
-        # 调用语音合成
-        audio_data = tts_client.synthesize(text)
+        # 固定话术优先使用预渲染音频（按人设音色查找）
+        audio_data = tts_prerenderer.get().lookup(text, voice)
+        cache_status = 'hit' if audio_data else 'miss'
+        if audio_data is None and len(text) > TTS_CHUNK_MAX_CHARS:
+            return Response(
+                stream_longform_tts(text, voice),
+                mimetype='audio/mpeg',
+                headers={
+                    'Content-Disposition': 'attachment; filename="speech.mp3"',
+                    'Cache-Control': 'no-cache',
+                    'X-TTS-Cache': cache_status,
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+        if audio_data is None:
+            audio_data = voice.synthesize(text)
         
         if audio_data:
             return Response(
@@ -874,7 +1422,8 @@ def text_to_speech():
                 mimetype='audio/mpeg',
                 headers={
                     'Content-Disposition': 'attachment; filename="speech.mp3"',
-                    'Cache-Control': 'no-cache'
+                    'Cache-Control': 'no-cache',
+                    'X-TTS-Cache': cache_status
                 }
             )
         else:
@@ -884,15 +1433,182 @@ def text_to_speech():
         logger.error(f"语音合成接口错误: {e}")
         return jsonify({'error': '服务器内部错误'}), 500
 
+def stream_longform_tts(text, voice):
+    """长文本分段合成，按顺序下发各段MP3帧；中途失败时结束响应，已下发的音频仍可播放
+
+    合成器只持有客户端视图，线程池在所有请求间共享，可按人设音色逐请求创建。
+    """
+    try:
+        for frames in LongFormSynthesizer(voice).stream(text):
+            yield frames
+    except Exception as e:
+        logger.error(f"长文本语音合成中断: {e}")
+
+@app.route('/api/tts/prerender', methods=['POST'])
+@require_feature('tts')
+def tts_prerender():
+    """批量预渲染固定话术：JSON {"texts": [...]} 或上传文本文件（每行一条），可选 persona 指定音色"""
+    try:
+        if 'file' in request.files:
+            content = request.files['file'].read().decode('utf-8')
+            texts = read_script_lines(content.splitlines())
+            persona_name = request.form.get('persona')
+        else:
+            data = request.get_json(silent=True) or {}
+            raw_texts = data.get('texts')
+            if not isinstance(raw_texts, list):
+                return jsonify({'error': 'texts 必须为字符串列表'}), 400
+            texts = read_script_lines(str(t) for t in raw_texts)
+            persona_name = data.get('persona')
+    except UnicodeDecodeError:
+        return jsonify({'error': '话术文件需为UTF-8编码'}), 400
+    persona = resolve_persona(persona_name)
+    if persona is None:
+        return jsonify({'error': '人设不存在'}), 400
+
+    if not texts:
+        return jsonify({'error': '没有需要预渲染的文本'}), 400
+    too_long = [t for t in texts if len(t) > 1000]
+    if too_long:
+        return jsonify({'error': f'单条文本不能超过1000字（共{len(too_long)}条超长）'}), 400
+
+    job = tts_prerenderer.get().submit(texts, persona_tts_client(persona))
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/tts/prerender/<job_id>', methods=['GET'])
+@require_feature('tts')
+def tts_prerender_status(job_id):
+    """查询预渲染任务进度"""
+    job = tts_prerenderer.get().get_job(job_id)
+    if job is None:
+        return jsonify({'error': '预渲染任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+def worker_load():
+    """本进程负载：进行中的流、各队列积压与连接池占用，均为本地状态，不访问上游"""
+    queues = health_monitor.queue_depths()
+    queues['conversation_store'] = conversation_store.stats()['queued']
+    return {
+        'active_streams': cancellation_registry.active_count(),
+        'queues': queues,
+        'http_pools': pool_snapshots()
+    }
+
+
+def readiness(load):
+    """根据本进程负载与熔断状态判断能否承接新请求，返回 (状态, 原因列表)
+
+    not_ready：流数或队列积压达到上限，或所有LLM提供商均已熔断；
+    degraded：仍可承接请求，但部分提供商熔断或连接池已占满
+    """
+    blocking, warnings = [], []
+    active = load['active_streams']
+    if app_settings.health.max_active_streams and active >= app_settings.health.max_active_streams:
+        blocking.append(f'进行中的流 {active} 已达上限 {app_settings.health.max_active_streams}')
+    for name, depth in load['queues'].items():
+        if app_settings.health.max_queue_depth and depth >= app_settings.health.max_queue_depth:
+            blocking.append(f'{name} 队列积压 {depth} 已达上限 {app_settings.health.max_queue_depth}')
+    providers = llm_registry.providers()
+    open_providers = [name for name in providers if get_breaker(LLM_BREAKER_NAMES[name]).is_open()]
+    if not providers:
+        warnings.append('没有可用的LLM提供商')
+    elif len(open_providers) == len(providers):
+        blocking.append('所有LLM提供商均已熔断')
+    elif open_providers:
+        warnings.append(f"LLM提供商熔断中: {', '.join(open_providers)}")
+    for name, pool in load['http_pools'].items():
+        if pool['capacity'] and pool['saturation'] >= 1:
+            warnings.append(f'{name} 连接池已占满')
+    if blocking:
+        return 'not_ready', blocking + warnings
+    return ('degraded' if warnings else 'ready'), warnings
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    """健康检查接口"""
+    """存活检查：进程能处理请求即返回200，不检查上游与负载（供容器HEALTHCHECK使用）"""
     return jsonify({
         'status': 'healthy',
         'timestamp': int(time.time()),
+        'uptime': round(time.time() - STARTED_AT, 1),
         'version': '1.0.0'
     })
 
+@app.route('/api/health/ready', methods=['GET'])
+def readiness_check():
+    """就绪检查：本worker饱和或LLM全部熔断时返回503，负载均衡器据此暂停分配新请求；不产生上游调用"""
+    load = worker_load()
+    status, reasons = readiness(load)
+    return jsonify({
+        'status': status,
+        'reasons': reasons,
+        'active_streams': load['active_streams'],
+        'queues': load['queues']
+    }), 503 if status == 'not_ready' else 200
+
+@app.route('/api/health/deep', methods=['GET'])
+def deep_health_check():
+    """详细健康信息：上游依赖的缓存探测结果（可达性与延迟）、本进程负载、连接池占用与熔断状态"""
+    load = worker_load()
+    status, reasons = readiness(load)
+    dependencies = health_monitor.probes()
+    return jsonify({
+        'status': status,
+        'reasons': reasons,
+        'dependencies': dependencies,
+        'dependencies_ok': all(result['status'] != 'fail' for result in dependencies.values()),
+        'load': load,
+        'breakers': breaker_snapshots(),
+        'uptime': round(time.time() - STARTED_AT, 1),
+        'timestamp': int(time.time())
+    })
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+@require_admin
+def admin_profiling():
+    """请求追踪状态与按路由的墙钟/CPU时间；POST {"enabled": bool, "slow_threshold": 秒} 运行时开关追踪"""
+    if request.method == 'POST':
+        data = request.get_json(force=True, silent=True) or {}
+        enabled = data.get('enabled')
+        threshold = data.get('slow_threshold')
+        if enabled is not None and not isinstance(enabled, bool):
+            return jsonify({'error': 'enabled 必须是布尔值'}), 400
+        if threshold is not None and (isinstance(threshold, bool) or not isinstance(threshold, (int, float))
+                                      or threshold <= 0):
+            return jsonify({'error': 'slow_threshold 必须是正数'}), 400
+        request_tracer.configure(enabled, threshold)
+    return jsonify({**request_tracer.status(), 'routes': request_tracer.routes()})
+
+@app.route('/api/admin/profiling/slow', methods=['GET'])
+@require_admin
+def admin_slow_requests():
+    """最近的慢请求：阶段耗时、上游调用记录与调用栈采样，可按 request_id 过滤"""
+    return jsonify({'slow_requests': request_tracer.slow_requests(request.args.get('request_id'))})
+
+@app.route('/api/admin/profiler', methods=['GET', 'POST'])
+@require_admin
+def admin_profiler():
+    """采样分析器：POST {"action": "start", "interval": 秒, "seconds": 秒} 启动，{"action": "stop"} 停止；
+    GET 返回采样统计，?format=collapsed 返回折叠栈文本"""
+    if request.method == 'POST':
+        data = request.get_json(force=True, silent=True) or {}
+        action = data.get('action')
+        if action == 'start':
+            try:
+                interval = float(data.get('interval') or PROFILER_INTERVAL)
+                seconds = float(data.get('seconds') or PROFILER_MAX_SECONDS)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'interval 与 seconds 必须是数字'}), 400
+            if not sampling_profiler.start(interval, seconds):
+                return jsonify({'error': '采样分析器已在运行'}), 409
+        elif action == 'stop':
+            sampling_profiler.stop()
+        else:
+            return jsonify({'error': 'action 必须是 start 或 stop'}), 400
+    if request.args.get('format') == 'collapsed':
+        return Response(sampling_profiler.collapsed(), mimetype='text/plain; charset=utf-8')
+    return jsonify(sampling_profiler.snapshot())
+
 @app.errorhandler(404)
 def not_found(error):
     """404错误处理"""
@@ -913,13 +1629,14 @@ if __name__ == '__main__':
     os.makedirs('static/js', exist_ok=True)
     os.makedirs('static/images', exist_ok=True)
     
-    logger.info(f"启动服务器，地址: http://{SERVER_HOST}:{SERVER_PORT}")
+    logger.info(f"启动服务器，地址: http://{app_settings.server_host}:{app_settings.server_port}")
     logger.info(f"使用模型: {DEEPSEEK_MODEL}")
-    logger.info(f"语音合成音色: {tts_client.voice_type}")
+    if app_settings.feature('tts').available:
+        logger.info(f"默认人设: {persona_registry.default.name}，语音合成音色: {persona_registry.default.voice_type}")
     
     app.run(
-        host=SERVER_HOST,
-        port=SERVER_PORT,
-        debug=DEBUG,
+        host=app_settings.server_host,
+        port=app_settings.server_port,
+        debug=app_settings.debug,
         threaded=True
     )
\ No newline at end of file
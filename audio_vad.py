@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于能量的语音活动检测（VAD）
+对上传的PCM WAV按帧计算能量，跟踪底噪自适应判定语音段，裁掉首尾静音后原地改写文件，
+减少ASR需要处理的音频时长；无法解析的格式原样放行
+"""
+
+import os
+import sys
+import math
+import wave
+import array
+import logging
+import operator
+from typing import Optional, Tuple
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class VadResult:
+    """一次VAD处理的结果"""
+
+    def __init__(self, analyzed: bool, speech: bool = True, original_seconds: float = 0.0,
+                 kept_seconds: float = 0.0):
+        self.analyzed = analyzed  # False 表示格式不支持，未做处理
+        self.speech = speech
+        self.original_seconds = original_seconds
+        self.kept_seconds = kept_seconds
+
+    @property
+    def trimmed_seconds(self) -> float:
+        return max(0.0, self.original_seconds - self.kept_seconds)
+
+    def to_dict(self):
+        return {
+            'analyzed': self.analyzed,
+            'speech': self.speech,
+            'original_seconds': round(self.original_seconds, 3),
+            'kept_seconds': round(self.kept_seconds, 3),
+        }
+
+
+def frame_energies_db(samples: array.array, frame_size: int) -> list:
+    """按帧计算RMS能量（dBFS，16位满幅为0dB）"""
+    energies = []
+    for start in range(0, len(samples) - frame_size + 1, frame_size):
+        frame = samples[start:start + frame_size]
+        power = sum(map(operator.mul, frame, frame)) / frame_size
+        energies.append(10 * math.log10(power / (32768.0 ** 2)) if power > 0 else -120.0)
+    return energies
+
+
+def detect_speech(energies: list, frame_ms: int = VAD_FRAME_MS, threshold_db: float = VAD_THRESHOLD_DB,
+                  min_db: float = VAD_MIN_DB, min_speech_ms: int = VAD_MIN_SPEECH_MS) -> Optional[Tuple[int, int]]:
+    """返回语音段的 [起始帧, 结束帧)，没有语音时返回None
+
+    底噪取能量最低的10%帧的均值，高于底噪 threshold_db 且不低于 min_db 的帧视为语音；
+    最安静的帧也很响（整段都在说话或环境嘈杂）时底噪不可信，只按 min_db 判定。
+    连续语音帧不足 min_speech_ms 的片段（按键声、咔哒声）忽略。
+    """
+    if not energies:
+        return None
+    quietest = sorted(energies)[:max(1, len(energies) // 10)]
+    noise_floor = sum(quietest) / len(quietest)
+    if noise_floor >= min_db + threshold_db:
+        threshold = min_db
+    else:
+        threshold = max(noise_floor + threshold_db, min_db)
+    min_run = max(1, min_speech_ms // frame_ms)
+
+    first = last = None
+    run = 0
+    for index, energy in enumerate(energies):
+        if energy >= threshold:
+            run += 1
+            if run >= min_run:
+                if first is None:
+                    first = index - run + 1
+                last = index + 1
+        else:
+            run = 0
+    if first is None:
+        return None
+    return first, last
+
+
+def trim_wav_file(path: str, frame_ms: int = VAD_FRAME_MS, padding_ms: int = VAD_PADDING_MS) -> VadResult:
+    """检测语音并裁掉首尾静音（保留 padding_ms 余量），就地写回
+
+    仅处理16位PCM WAV；其他格式或解析失败时返回 analyzed=False，调用方按原文件继续识别。
+    """
+    try:
+        with wave.open(path, 'rb') as wav:
+            channels = wav.getnchannels()
+            sample_width = wav.getsampwidth()
+            sample_rate = wav.getframerate()
+            frame_count = wav.getnframes()
+            if sample_width != 2 or sample_rate <= 0:
+                return VadResult(analyzed=False)
+            raw = wav.readframes(frame_count)
+    except (wave.Error, EOFError) as e:
+        logger.debug(f"VAD跳过非PCM WAV文件 {path}: {e}")
+        return VadResult(analyzed=False)
+
+    samples = array.array('h')
+    samples.frombytes(raw[:len(raw) - len(raw) % 2])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+    # 多声道时只用第一个声道判定
+    mono = samples[::channels] if channels > 1 else samples
+    original_seconds = len(mono) / sample_rate
+
+    frame_size = max(1, sample_rate * frame_ms // 1000)
+    segment = detect_speech(frame_energies_db(mono, frame_size), frame_ms)
+    if segment is None:
+        return VadResult(analyzed=True, speech=False, original_seconds=original_seconds)
+
+    padding = sample_rate * padding_ms // 1000
+    start = max(0, segment[0] * frame_size - padding)
+    end = min(len(mono), segment[1] * frame_size + padding)
+    kept_seconds = (end - start) / sample_rate
+    if start == 0 and end == len(mono):
+        return VadResult(analyzed=True, original_seconds=original_seconds, kept_seconds=kept_seconds)
+
+    # 写入临时文件后替换，避免写到一半时文件损坏
+    kept = samples[start * channels:end * channels]
+    if sys.byteorder == 'big':
+        kept.byteswap()
+    tmp_path = f"{path}.vad"
+    with wave.open(tmp_path, 'wb') as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(kept.tobytes())
+    os.replace(tmp_path, path)
+    return VadResult(analyzed=True, original_seconds=original_seconds, kept_seconds=kept_seconds)
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享缓存后端
+为上游客户端提供统一的缓存接口（bytes/JSON值、TTL、容量统计），后端可选：
+memory（进程内LRU）、mmap（内存映射文件，同机多个worker共享）、redis（Redis协议服务，多机共享）。
+缓存失败只记录日志并按未命中处理，不影响请求本身
+"""
+
+import os
+import json
+import mmap
+import time
+import queue
+import socket
+import struct
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+from config import *
+
+try:
+    import fcntl
+except ImportError:  # 非POSIX平台只能在单进程内共享
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CacheError(Exception):
+    """缓存后端错误（连接失败、协议错误等）"""
+
+
+class CacheBackend:
+    """缓存后端接口：键为字符串，值为bytes；ttl 单位秒，None 表示不过期"""
+
+    name = 'base'
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        """写入成功返回True；值超过后端单条上限等情况返回False"""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryCache(CacheBackend):
+    """进程内LRU缓存，按条目数与总字节数淘汰最久未使用的条目"""
+
+    name = 'memory'
+
+    def __init__(self, max_bytes: int = CACHE_MEMORY_MAX_MB * 1024 * 1024,
+                 max_entries: int = CACHE_MEMORY_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expire_at = entry
+            if expire_at is not None and expire_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if len(value) > self.max_bytes // 4:
+            return False
+        expire_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expire_at)
+            self._bytes += len(value)
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+        return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+                    'evictions': self._evictions}
+
+
+class MmapCache(CacheBackend):
+    """内存映射文件缓存，同一主机上的多个worker进程共享
+
+    文件由定长索引区与环形数据区组成：写入时把记录（键+值）追加到数据区，索引槽保存
+    键哈希、记录的逻辑位置与过期时间；数据区写满后从头覆盖（按写入顺序淘汰），
+    读取时通过逻辑位置判断记录是否已被覆盖。读写在进程内加线程锁、进程间加 flock。
+    """
+
+    name = 'mmap'
+    MAGIC = b'CACHEV1\0'
+    _HEADER = struct.Struct('<8sQQQ')  # magic, 索引槽数, 数据区容量, 写入位置（单调递增）
+    _SLOT = struct.Struct('<QQIId')  # 键哈希, 记录逻辑位置, 记录长度, 是否占用, 过期时间（0为不过期）
+    _RECORD = struct.Struct('<QdII')  # 键哈希, 过期时间, 键长度, 值长度
+    PROBE = 8  # 线性探测的最大槽数
+
+    def __init__(self, path: str = CACHE_MMAP_PATH, size: int = CACHE_MMAP_SIZE_MB * 1024 * 1024,
+                 index_slots: int = CACHE_MMAP_INDEX_SLOTS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._index_offset = self._HEADER.size
+        with self._file_lock(exclusive=True):
+            self._open(size, index_slots)
+
+    def _open(self, size: int, index_slots: int):
+        expected = self._HEADER.size + index_slots * self._SLOT.size + size
+        current = os.fstat(self._fd).st_size
+        header = os.pread(self._fd, self._HEADER.size, 0) if current >= self._HEADER.size else b''
+        if current != expected or header[:8] != self.MAGIC:
+            # 新文件或参数变化：重新初始化（其他worker会在同一把文件锁下看到相同结果）
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, expected)
+            os.pwrite(self._fd, self._HEADER.pack(self.MAGIC, index_slots, size, 0), 0)
+            logger.info(f"初始化共享缓存文件 {self.path}（{expected // (1024 * 1024)}MB）")
+        self.index_slots = index_slots
+        self.capacity = size
+        self._data_offset = self._index_offset + index_slots * self._SLOT.size
+        self._map = mmap.mmap(self._fd, expected)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        # flock 按打开的文件描述区分持有者，同进程的多个线程还需线程锁互斥
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _hash(key: bytes) -> int:
+        # 0 保留为空槽标记
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') or 1
+
+    def _write_pos(self) -> int:
+        return self._HEADER.unpack_from(self._map, 0)[3]
+
+    def _slot(self, index: int) -> Tuple[int, int, int, int, float]:
+        return self._SLOT.unpack_from(self._map, self._index_offset + index * self._SLOT.size)
+
+    def _put_slot(self, index: int, *values):
+        self._SLOT.pack_into(self._map, self._index_offset + index * self._SLOT.size, *values)
+
+    def _alive(self, pos: int, write_pos: int) -> bool:
+        """记录起点之后写入的数据不超过一圈时，记录仍完整"""
+        return pos >= write_pos - self.capacity
+
+    def _find(self, key_hash: int):
+        base = key_hash % self.index_slots
+        for i in range(self.PROBE):
+            index = (base + i) % self.index_slots
+            slot = self._slot(index)
+            if slot[3] and slot[0] == key_hash:
+                return index, slot
+        return None, None
+
+    def get(self, key: str) -> Optional[bytes]:
+        key_bytes = key.encode('utf-8')
+        key_hash = self._hash(key_bytes)
+        with self._file_lock(exclusive=False):
+            index, slot = self._find(key_hash)
+            if slot is None:
+                return None
+            _, pos, length, _, expire_at = slot
+            if (expire_at and expire_at <= time.time()) or not self._alive(pos, self._write_pos()):
+                return None
+            offset = self._data_offset + pos % self.capacity
+            record_hash, _, key_len, value_len = self._RECORD.unpack_from(self._map, offset)
+            start = offset + self._RECORD.size
+            if record_hash != key_hash or self._map[start:start + key_len] != key_bytes:
+                return None
+            start += key_len
+            return self._map[start:start + value_len]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        key_bytes = key.encode('utf-8')
+        length = self._RECORD.size + len(key_bytes) + len(value)
+        if length > self.capacity // 4:
+            return False
+        key_hash = self._hash(key_bytes)
+        expire_at = time.time() + ttl if ttl else 0.0
+        with self._file_lock(exclusive=True):
+            write_pos = self._write_pos()
+            # 记录必须连续存放，剩余空间不足时从数据区开头写起
+            if write_pos % self.capacity + length > self.capacity:
+                write_pos += self.capacity - write_pos % self.capacity
+            offset = self._data_offset + write_pos % self.capacity
+            self._RECORD.pack_into(self._map, offset, key_hash, expire_at, len(key_bytes), len(value))
+            start = offset + self._RECORD.size
+            self._map[start:start + len(key_bytes)] = key_bytes
+            start += len(key_bytes)
+            self._map[start:start + len(value)] = value
+            new_pos = write_pos + length
+            # 选槽：同键 > 空槽/失效槽 > 探测范围内最旧的槽
+            base = key_hash % self.index_slots
+            target = oldest = None
+            for i in range(self.PROBE):
+                index = (base + i) % self.index_slots
+                slot = self._slot(index)
+                if slot[3] and slot[0] == key_hash:
+                    target = index
+                    break
+                if target is None and (not slot[3] or not self._alive(slot[1], new_pos)
+                                       or (slot[4] and slot[4] <= time.time())):
+                    target = index
+                if oldest is None or slot[1] < self._slot(oldest)[1]:
+                    oldest = index
+            self._put_slot(oldest if target is None else target, key_hash, write_pos, length, 1, expire_at)
+            self._HEADER.pack_into(self._map, 0, self.MAGIC, self.index_slots, self.capacity, new_pos)
+        return True
+
+    def delete(self, key: str):
+        key_hash = self._hash(key.encode('utf-8'))
+        with self._file_lock(exclusive=True):
+            index, slot = self._find(key_hash)
+            if slot is not None:
+                self._put_slot(index, 0, 0, 0, 0, 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._file_lock(exclusive=False):
+            write_pos = self._write_pos()
+            now = time.time()
+            entries = used = 0
+            index_bytes = self._map[self._index_offset:self._data_offset]
+            for _, pos, length, occupied, expire_at in self._SLOT.iter_unpack(index_bytes):
+                if occupied and self._alive(pos, write_pos) and not (expire_at and expire_at <= now):
+                    entries += 1
+                    used += length
+        return {'entries': entries, 'bytes': used, 'max_bytes': self.capacity, 'path': self.path,
+                'wrapped': write_pos > self.capacity}
+
+
+class RespCache(CacheBackend):
+    """Redis协议（RESP）缓存客户端，仅使用 GET/SET PX/DEL 等基础命令，兼容Redis及同协议服务
+
+    连接放在池中复用；连接失败时按未命中处理，并在 CACHE_REDIS_RETRY_INTERVAL 秒内不再重试，
+    避免缓存服务故障拖慢请求。
+    """
+
+    name = 'redis'
+
+    def __init__(self, url: str = CACHE_REDIS_URL, timeout: float = CACHE_REDIS_TIMEOUT,
+                 pool_size: int = HTTP_POOL_MAXSIZE):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or '/0').lstrip('/') or 0)
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue" = queue.LifoQueue(maxsize=pool_size)
+        self._down_until = 0.0
+        self._errors = 0
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile('rb'))
+        if self.password:
+            self._execute(conn, 'AUTH', self.password)
+        if self.db:
+            self._execute(conn, 'SELECT', str(self.db))
+        return conn
+
+    @staticmethod
+    def _encode(*args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if isinstance(arg, str):
+                arg = arg.encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise CacheError('连接已关闭')
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode('utf-8')
+        if kind == b'-':
+            raise CacheError(body.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise CacheError('响应不完整')
+            return data[:-2]
+        if kind == b'*':
+            count = int(body)
+            return None if count < 0 else [self._read_reply(reader) for _ in range(count)]
+        raise CacheError(f'无法解析的响应: {line[:50]!r}')
+
+    def _execute(self, conn, *args):
+        conn[0].sendall(self._encode(*args))
+        return self._read_reply(conn[1])
+
+    def command(self, *args):
+        """执行一条命令，连接异常时关闭该连接并抛出 CacheError"""
+        if time.time() < self._down_until:
+            raise CacheError('缓存服务暂不可用')
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = None
+        try:
+            if conn is None:
+                conn = self._connect()
+            result = self._execute(conn, *args)
+        except (OSError, CacheError) as e:
+            if conn is not None:
+                self._close(conn)
+            if isinstance(e, OSError):
+                self._errors += 1
+                self._down_until = time.time() + CACHE_REDIS_RETRY_INTERVAL
+                raise CacheError(f'缓存服务连接失败: {e}') from e
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            self._close(conn)
+        return result
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn[1].close()
+            conn[0].close()
+        except OSError:
+            pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.command('GET', key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        if ttl:
+            return self.command('SET', key, value, 'PX', str(max(1, int(ttl * 1000)))) == 'OK'
+        return self.command('SET', key, value) == 'OK'
+
+    def delete(self, key: str):
+        self.command('DEL', key)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {'host': f'{self.host}:{self.port}', 'db': self.db, 'connection_errors': self._errors}
+        try:
+            stats['entries'] = self.command('DBSIZE')
+            stats['available'] = True
+        except CacheError:
+            stats['available'] = False
+        return stats
+
+
+class NamespacedCache:
+    """带命名空间前缀的缓存视图，统计命中率；后端异常时按未命中处理"""
+
+    def __init__(self, backend: CacheBackend, namespace: str, prefix: str = CACHE_KEY_PREFIX):
+        self.backend = backend
+        self.namespace = namespace
+        self.prefix = f"{prefix}:{namespace}:" if prefix else f"{namespace}:"
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            value = self.backend.get(self.prefix + key)
+        except CacheError as e:
+            self.errors += 1
+            logger.debug(f"缓存读取失败 {self.namespace}: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        try:
+            return self.backend.set(self.prefix + key, value, ttl)
+        except CacheError as e:
+            self.errors += 1
+            logger.debug(f"缓存写入失败 {self.namespace}: {e}")
+            return False
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(self.prefix + key)
+        except CacheError as e:
+            self.errors += 1
+            logger.debug(f"缓存删除失败 {self.namespace}: {e}")
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return self.set(key, json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'errors': self.errors,
+                'hit_rate': round(self.hits / total, 3) if total else None}
+
+
+def create_backend(kind: str = CACHE_BACKEND) -> CacheBackend:
+    """按配置创建缓存后端，mmap/redis 初始化失败时回退为进程内缓存"""
+    try:
+        if kind == 'mmap':
+            return MmapCache()
+        if kind == 'redis':
+            return RespCache()
+        if kind != 'memory':
+            logger.warning(f"未知的缓存后端 {kind}，使用进程内缓存")
+    except Exception as e:
+        logger.error(f"缓存后端 {kind} 初始化失败，回退为进程内缓存: {e}")
+    return MemoryCache()
+
+
+_backend: Optional[CacheBackend] = None
+_namespaces: Dict[str, NamespacedCache] = {}
+_cache_lock = threading.Lock()
+
+
+def get_cache(namespace: str) -> NamespacedCache:
+    """获取指定命名空间的缓存视图，各命名空间共用一个进程级后端实例"""
+    global _backend
+    with _cache_lock:
+        cache = _namespaces.get(namespace)
+        if cache is None:
+            if _backend is None:
+                _backend = create_backend()
+                logger.info(f"缓存后端: {_backend.name}")
+            cache = NamespacedCache(_backend, namespace)
+            _namespaces[namespace] = cache
+        return cache
+
+
+def cache_snapshot() -> Dict[str, Any]:
+    """缓存后端容量与各命名空间命中率"""
+    with _cache_lock:
+        backend = _backend
+        namespaces = dict(_namespaces)
+    if backend is None:
+        return {'backend': None}
+    return {
+        'backend': backend.name,
+        **backend.stats(),
+        'namespaces': {name: cache.stats() for name, cache in namespaces.items()},
+    }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求取消与截止时间
+协作式取消令牌与按请求ID的注册表：客户端断开或调用 /api/cancel 时，
+停止上游轮询、关闭上游连接并取消Aily运行；令牌携带请求的截止时间，
+下游调用据此缩短超时，避免单次请求无限期等待
+"""
+
+import time
+import uuid
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(TimeoutError):
+    """请求的截止时间已过"""
+
+
+class Deadline:
+    """请求截止时间（单调时钟），seconds 为None表示不限时"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout(self, default: float) -> float:
+        """下游调用的超时：不超过剩余时间；已过期时抛出 DeadlineExceeded"""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        if remaining <= 0:
+            raise DeadlineExceeded('请求已超过截止时间')
+        return min(default, remaining)
+
+
+class CancellationToken(threading.Event):
+    """取消令牌
+
+    继承 threading.Event：set() 即取消，wait(timeout) 可替代 time.sleep 在取消时立即唤醒。
+    add_callback 注册的回调（如关闭上游响应）在取消时执行一次，用于打断阻塞中的I/O。
+    """
+
+    def __init__(self, request_id: Optional[str] = None, deadline: Optional[Deadline] = None):
+        super().__init__()
+        self.request_id = request_id or uuid.uuid4().hex
+        self.deadline = deadline or Deadline()
+        self.reason = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._callback_lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.is_set()
+
+    def cancel(self, reason: str = 'cancelled'):
+        if self.reason is None:
+            self.reason = reason
+        self.set()
+
+    def set(self):
+        with self._callback_lock:
+            if self.is_set():
+                return
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"取消回调执行失败 {self.request_id}: {e}")
+
+    def add_callback(self, callback: Callable[[], None]):
+        """注册取消回调；已取消时立即执行"""
+        with self._callback_lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+class CancellationRegistry:
+    """按请求ID登记进行中的请求，供 /api/cancel 查找并取消"""
+
+    def __init__(self):
+        self._tokens: Dict[str, CancellationToken] = {}
+        self._lock = threading.Lock()
+
+    def register(self, request_id: Optional[str] = None, timeout: Optional[float] = None) -> CancellationToken:
+        """登记请求，timeout 为整个请求的时限（秒），由下游调用共同遵守"""
+        token = CancellationToken(request_id, Deadline(timeout))
+        with self._lock:
+            previous = self._tokens.get(token.request_id)
+            self._tokens[token.request_id] = token
+        if previous is not None:
+            # 同一请求ID重复提交（如客户端重试），旧请求不再需要
+            previous.cancel('superseded')
+        return token
+
+    def unregister(self, token: CancellationToken):
+        with self._lock:
+            if self._tokens.get(token.request_id) is token:
+                del self._tokens[token.request_id]
+
+    def cancel(self, request_id: str, reason: str = 'cancelled') -> bool:
+        """取消指定请求，请求不存在（已结束）时返回False"""
+        with self._lock:
+            token = self._tokens.get(request_id)
+        if token is None:
+            return False
+        logger.info(f"取消请求 {request_id}: {reason}")
+        token.cancel(reason)
+        return True
+
+    def guard(self, token: CancellationToken, frames: Iterable) -> Iterator:
+        """包装流式响应：响应结束或客户端断开后注销令牌"""
+        try:
+            yield from frames
+        finally:
+            self.unregister(token)
+
+    def active_count(self) -> int:
+        with self._lock:
+            return len(self._tokens)
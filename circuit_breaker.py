@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游服务熔断与对冲请求
+为飞书Aily、火山引擎LLM/ASR等上游依赖提供熔断器，并为幂等查询提供对冲请求能力
+"""
+
+import threading
+import time
+import logging
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional
+from features import get_settings
+from health import SharedExecutor
+from profiling import propagate
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被快速拒绝"""
+
+    def __init__(self, name: str, retry_after: float = 0):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"上游服务 {name} 熔断中，{retry_after:.1f}秒后重试")
+
+
+class CircuitBreaker:
+    """基于连续失败与慢调用的熔断器
+
+    - 连续失败（或耗时超过阈值的慢调用）达到 failure_threshold 次后打开
+    - 打开 recovery_timeout 秒后进入半开状态，放行一个探测请求
+    - 探测成功则关闭，失败则重新打开；打开期间迟到的成功结果（熔断前发出的请求）被忽略
+    """
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None,
+                 recovery_timeout: Optional[float] = None, slow_call_threshold: Optional[float] = None):
+        settings = get_settings().resilience
+        self.name = name
+        self.failure_threshold = failure_threshold if failure_threshold is not None \
+            else settings.breaker_failure_threshold
+        self.recovery_timeout = recovery_timeout if recovery_timeout is not None \
+            else settings.breaker_recovery_timeout
+        self.slow_call_threshold = slow_call_threshold if slow_call_threshold is not None \
+            else settings.breaker_slow_call_threshold
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = False
+        self._total_calls = 0
+        self._total_failures = 0
+        self._last_latency = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        # 调用方需持有锁
+        if self._state == STATE_OPEN and time.time() - self._opened_at >= self.recovery_timeout:
+            self._state = STATE_HALF_OPEN
+            self._half_open_in_flight = False
+            logger.info(f"熔断器 {self.name} 进入半开状态")
+        return self._state
+
+    def is_open(self) -> bool:
+        """熔断器是否拒绝新请求（半开且已有探测请求在途时也视为打开）"""
+        with self._lock:
+            state = self._current_state()
+            return state == STATE_OPEN or (state == STATE_HALF_OPEN and self._half_open_in_flight)
+
+    def allow_request(self) -> bool:
+        """判断是否放行请求，半开状态下只放行一个探测请求"""
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and not self._half_open_in_flight:
+                self._half_open_in_flight = True
+                return True
+            return False
+
+    def before_call(self):
+        """调用前检查，不允许时抛出 CircuitOpenError"""
+        if not self.allow_request():
+            retry_after = max(0.0, self.recovery_timeout - (time.time() - self._opened_at))
+            raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self, latency: float = 0.0):
+        """记录一次成功调用，慢调用按失败处理"""
+        if self.slow_call_threshold and latency > self.slow_call_threshold:
+            logger.warning(f"熔断器 {self.name} 记录慢调用: {latency:.2f}s > {self.slow_call_threshold}s")
+            self.record_failure(latency)
+            return
+        with self._lock:
+            self._total_calls += 1
+            self._last_latency = latency
+            state = self._current_state()
+            if state == STATE_OPEN or (state == STATE_HALF_OPEN and not self._half_open_in_flight):
+                # 熔断前发出的请求迟到的成功，不据此恢复放行
+                return
+            if state == STATE_HALF_OPEN:
+                logger.info(f"熔断器 {self.name} 探测成功，恢复关闭状态")
+                self._state = STATE_CLOSED
+                self._half_open_in_flight = False
+            self._consecutive_failures = 0
+
+    def record_failure(self, latency: float = 0.0):
+        """记录一次失败调用"""
+        with self._lock:
+            self._total_calls += 1
+            self._total_failures += 1
+            self._last_latency = latency
+            self._consecutive_failures += 1
+            state = self._current_state()
+            if state == STATE_HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != STATE_OPEN:
+                    logger.warning(f"熔断器 {self.name} 打开，连续失败 {self._consecutive_failures} 次")
+                self._state = STATE_OPEN
+                self._opened_at = time.time()
+                self._half_open_in_flight = False
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """在熔断器保护下执行调用"""
+        self.before_call()
+        start_time = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure(time.time() - start_time)
+            raise
+        self.record_success(time.time() - start_time)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回熔断器当前状态快照"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self._current_state(),
+                'consecutive_failures': self._consecutive_failures,
+                'total_calls': self._total_calls,
+                'total_failures': self._total_failures,
+                'last_latency': round(self._last_latency, 3)
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取（或创建）指定上游的熔断器，进程内单例"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name)
+            _breakers[name] = breaker
+        return breaker
+
+
+def breaker_snapshots() -> Dict[str, Dict[str, Any]]:
+    """返回所有熔断器的状态快照"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
+
+
+_hedge_executor = SharedExecutor('hedge', lambda: get_settings().resilience.hedge_max_workers, 'hedge')
+
+
+class _HedgePool:
+    """对冲请求使用的线程池名额：只在有空闲线程时提交，尝试不会在队列中等待（排队时间不计入 hedge_delay）"""
+
+    def __init__(self, max_in_flight: Optional[int] = None):
+        self.max_in_flight = max_in_flight
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def submit(self, func: Callable[[], Any]) -> Optional[Future]:
+        """有空闲线程时提交，否则返回None"""
+        with self._lock:
+            if self.max_in_flight is None:
+                self.max_in_flight = get_settings().resilience.hedge_max_workers
+            if self._in_flight >= self.max_in_flight:
+                return None
+            self._in_flight += 1
+        try:
+            future = _hedge_executor.submit(func)
+        except RuntimeError:
+            self._release()
+            return None
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+
+_hedge_pool = _HedgePool()
+
+
+def _run_hedged(func: Callable[[], Any], hedge_delay: float, max_attempts: int) -> Any:
+    """各次尝试都在线程池中执行，调用方等待所有在途尝试，返回最先成功的结果
+
+    线程池已满时首个尝试退回调用方线程执行（不对冲）；未完成的尝试无法中断，其结果被丢弃。
+    """
+    # 线程池中的上游调用计入当前请求的追踪
+    attempt = propagate(func)
+    first = _hedge_pool.submit(attempt)
+    if first is None:
+        logger.debug("对冲线程池已满，直接执行请求")
+        return func()
+    pending = {first}
+    launched = 1
+    first_error = None
+    while pending:
+        timeout = hedge_delay if launched < max_attempts else None
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            hedge = _hedge_pool.submit(attempt)
+            if hedge is None:
+                logger.debug("对冲线程池已满，不再发起对冲请求")
+                launched = max_attempts
+                continue
+            logger.debug(f"请求超过 {hedge_delay}s 未返回，已发起对冲请求")
+            pending.add(hedge)
+            launched += 1
+            continue
+        for future in done:
+            pending.discard(future)
+            error = future.exception()
+            if error is None:
+                return future.result()
+            if first_error is None:
+                first_error = error
+    raise first_error
+
+
+def hedged_call(func: Callable[[], Any], hedge_delay: Optional[float] = None,
+                max_attempts: Optional[int] = None, breaker: Optional[CircuitBreaker] = None) -> Any:
+    """对冲请求：首个请求超过 hedge_delay 仍未返回时并发发起备份请求
+
+    仅适用于幂等调用（如查询运行状态、查询ASR结果）。返回最先成功的尝试结果，全部失败时抛出首个错误；
+    尝试只在线程池有空闲线程时发起，不会因排队而提前触发对冲。
+    指定 breaker 时整个调用在熔断器保护下执行，多次尝试只计一次成败，func 内不应再经过该熔断器。
+    hedge_delay 为0或max_attempts<=1时退化为普通调用。
+    """
+    settings = get_settings().resilience
+    if hedge_delay is None:
+        hedge_delay = settings.hedge_delay
+    if max_attempts is None:
+        max_attempts = settings.hedge_max_attempts
+    if not hedge_delay or max_attempts <= 1:
+        run = func
+    else:
+        run = lambda: _run_hedged(func, hedge_delay, max_attempts)
+    if breaker is not None:
+        return breaker.call(run)
+    return run()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+前端渲染指标
+汇总浏览器上报的流式回答耗时：首个文本到达（first_token_ms）、首次绘制（first_paint_ms）、
+整段完成（total_ms）与渲染帧数，按回答类型（文字对话/语音对话轮次）保留最近的样本并计算分位数
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+from config import *
+
+# 上报的计时字段（毫秒）与计数字段
+TIMING_FIELDS = ('first_token_ms', 'first_paint_ms', 'total_ms')
+COUNT_FIELDS = ('chars', 'frames')
+KINDS = ('chat', 'voice_turn')
+# 超过该值的计时视为无效样本（页面挂起、时钟异常等）
+MAX_TIMING_MS = 600000
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class ClientRenderStats:
+    """按回答类型保存最近 window 个样本，快照时计算分位数"""
+
+    def __init__(self, window: int = CLIENT_METRICS_WINDOW):
+        self.window = max(1, window)
+        self._samples: Dict[str, Dict[str, deque]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: Optional[str], sample: Dict[str, Any]) -> bool:
+        """记录一次上报，类型未知或没有有效计时时返回False"""
+        if kind not in KINDS:
+            return False
+        values = {}
+        for field in TIMING_FIELDS + COUNT_FIELDS:
+            value = sample.get(field)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            limit = MAX_TIMING_MS if field in TIMING_FIELDS else float('inf')
+            if 0 <= value <= limit:
+                values[field] = float(value)
+        if not any(field in values for field in TIMING_FIELDS):
+            return False
+        with self._lock:
+            series = self._samples.setdefault(kind, {})
+            for field, value in values.items():
+                series.setdefault(field, deque(maxlen=self.window)).append(value)
+            self._counts[kind] = self._counts.get(kind, 0) + 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for kind, series in self._samples.items():
+                summary = {'reports': self._counts.get(kind, 0)}
+                for field, values in series.items():
+                    ordered = sorted(values)
+                    summary[field] = {
+                        'samples': len(ordered),
+                        'avg': round(sum(ordered) / len(ordered), 1),
+                        'p50': round(_percentile(ordered, 0.5), 1),
+                        'p90': round(_percentile(ordered, 0.9), 1),
+                        'p99': round(_percentile(ordered, 0.99), 1),
+                    }
+                result[kind] = summary
+            return result
@@ -24,6 +24,20 @@ VOICE_ACCESS_TOKEN = os.getenv("VOICE_ACCESS_TOKEN", "YOUR_VOICE_ACCESS_TOKEN")
 TTS_SPEECH_RATE = int(os.getenv("TTS_SPEECH_RATE", "0"))
 TTS_VOICE_TYPE = os.getenv("TTS_VOICE_TYPE", "S_dQcSOODF1")  # 陈耀忠音色ID
 TTS_RESOURCE_ID = os.getenv("TTS_RESOURCE_ID", "volc.megatts.default")  # 声音复刻2.0资源ID
+# 固定话术预渲染音频库
+TTS_STORE_DIR = os.getenv("TTS_STORE_DIR", "tts_store")  # 预渲染音频存放目录
+TTS_PRERENDER_CONCURRENCY = int(os.getenv("TTS_PRERENDER_CONCURRENCY", "4"))  # 批量合成并发数
+TTS_PRERENDER_RETRIES = int(os.getenv("TTS_PRERENDER_RETRIES", "2"))  # 单条合成失败重试次数
+# 长文本分段合成
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", "300"))  # 单次合成请求的最大字数，超过则分段并行合成
+TTS_FIRST_CHUNK_CHARS = int(os.getenv("TTS_FIRST_CHUNK_CHARS", "80"))  # 首段最大字数，越短首段音频越快
+TTS_LONGFORM_MAX_CHARS = int(os.getenv("TTS_LONGFORM_MAX_CHARS", "10000"))  # 单次请求可合成的最大字数
+TTS_LONGFORM_WORKERS = int(os.getenv("TTS_LONGFORM_WORKERS", "4"))  # 分段合成线程池大小（所有请求共享）
+TTS_LONGFORM_WINDOW = int(os.getenv("TTS_LONGFORM_WINDOW", "2"))  # 单个请求同时在合成的分段数，避免一个长文本占满线程池
+# 语音对话轮次（/api/voice-turn）：LLM输出按句切分后立即合成
+VOICE_TURN_TTS_WORKERS = int(os.getenv("VOICE_TURN_TTS_WORKERS", "3"))  # 分句合成线程池大小（所有请求共享）
+VOICE_TURN_TTS_WINDOW = int(os.getenv("VOICE_TURN_TTS_WINDOW", "2"))  # 单个语音轮次同时在合成的句子数，避免一个长回答占满线程池
+VOICE_TURN_MIN_SEGMENT_CHARS = int(os.getenv("VOICE_TURN_MIN_SEGMENT_CHARS", "4"))  # 短于该字数的句子与下一句合并
 
 # ASR语音识别配置 - 大模型录音文件识别API
 ASR_APP_ID = os.getenv("ASR_APP_ID", "")
@@ -43,6 +57,17 @@ ASR_ENABLE_DDC = os.getenv("ASR_ENABLE_DDC", "false").lower() == "true"
 ASR_PUBLIC_BASE_URL = os.getenv("ASR_PUBLIC_BASE_URL", "")
 # 是否保留上传的音频文件（默认不保留）
 ASR_KEEP_UPLOADS = os.getenv("ASR_KEEP_UPLOADS", "false").lower() == "true"
+# 断点续传上传配置
+STT_UPLOAD_MAX_SIZE = int(os.getenv("STT_UPLOAD_MAX_SIZE", str(50 * 1024 * 1024)))  # 单个录音最大字节数
+STT_UPLOAD_CHUNK_SIZE = int(os.getenv("STT_UPLOAD_CHUNK_SIZE", str(256 * 1024)))  # 建议客户端分片大小
+STT_UPLOAD_TTL = int(os.getenv("STT_UPLOAD_TTL", "600"))  # 上传会话无进展多久后清理（秒）
+# 上传音频的语音活动检测（仅PCM WAV）：裁掉首尾静音后再识别，无语音时直接返回
+STT_VAD_ENABLED = os.getenv("STT_VAD_ENABLED", "true").lower() == "true"
+VAD_FRAME_MS = int(os.getenv("VAD_FRAME_MS", "30"))  # 能量分析帧长（毫秒）
+VAD_THRESHOLD_DB = float(os.getenv("VAD_THRESHOLD_DB", "12"))  # 高于底噪多少dB判为语音
+VAD_MIN_DB = float(os.getenv("VAD_MIN_DB", "-50"))  # 语音能量下限（dBFS），避免安静环境下把底噪判为语音
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "150"))  # 短于该时长的能量突起视为噪声
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))  # 语音段前后保留的余量
 
 # 飞书Aily配置（支持环境变量覆盖）
 FEISHU_APP_ID = os.getenv("FEISHU_APP_ID", "YOUR_FEISHU_APP_ID")
@@ -54,6 +79,57 @@ SKILL_ID = os.getenv("SKILL_ID", "YOUR_SKILL_ID")
 FEISHU_OPEN_API_BASE = os.getenv("FEISHU_OPEN_API_BASE", "https://open.feishu.cn")
 FEISHU_POLLING_INTERVAL = float(os.getenv("FEISHU_POLLING_INTERVAL", "0.3"))
 FEISHU_MAX_POLLING_TIME = int(os.getenv("FEISHU_MAX_POLLING_TIME", "60"))
+FEISHU_MESSAGE_PAGE_SIZE = int(os.getenv("FEISHU_MESSAGE_PAGE_SIZE", "5"))  # 每次轮询按运行拉取的消息条数
+# 运行事件流：auto 由真实运行的事件流请求判定上游是否提供事件推送，不提供则轮询；on 强制使用；off 只轮询
+FEISHU_EVENT_STREAM = os.getenv("FEISHU_EVENT_STREAM", "auto").lower()
+FEISHU_EVENT_STREAM_PATH = os.getenv("FEISHU_EVENT_STREAM_PATH",
+                                     "/open-apis/aily/v1/sessions/{session_id}/runs/{run_id}/events")
+FEISHU_EVENT_STREAM_IDLE_TIMEOUT = float(os.getenv("FEISHU_EVENT_STREAM_IDLE_TIMEOUT", "20"))  # 事件流两次事件间最长等待（秒）
+# 飞书Aily预热配置：用户开始输入/录音时预创建会话
+FEISHU_WARM_POOL_MAX = int(os.getenv("FEISHU_WARM_POOL_MAX", "4"))  # 预热会话池上限
+FEISHU_WARM_SESSION_TTL = int(os.getenv("FEISHU_WARM_SESSION_TTL", "300"))  # 预热会话未使用多久后回收（秒）
+
+# HTTP连接池配置
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+
+# 上游HTTP录制与回放：off / record（正常访问上游并脱敏录制）/ replay（不访问网络，按记录回放）
+HTTP_CASSETTE_MODE = os.getenv("HTTP_CASSETTE_MODE", "off").lower()
+HTTP_CASSETTE_PATH = os.getenv("HTTP_CASSETTE_PATH", "cassettes/upstream.jsonl")  # 回放记录文件（JSONL）
+HTTP_REPLAY_SPEED = float(os.getenv("HTTP_REPLAY_SPEED", "1"))  # 回放速度倍数，1为按录制时间间隔，0为不等待
+
+# 共享缓存后端：memory（进程内LRU）/ mmap（内存映射文件，同机多worker共享）/ redis（Redis协议服务，多机共享）
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "chatagent")  # 键前缀，多个应用共用一个缓存服务时区分
+CACHE_MEMORY_MAX_MB = int(os.getenv("CACHE_MEMORY_MAX_MB", "64"))  # 进程内缓存容量上限
+CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "10000"))
+CACHE_MMAP_PATH = os.getenv("CACHE_MMAP_PATH", "data/cache.mmap")  # 共享缓存文件（同机各worker使用同一路径）
+CACHE_MMAP_SIZE_MB = int(os.getenv("CACHE_MMAP_SIZE_MB", "128"))  # 数据区大小，写满后按写入顺序覆盖
+CACHE_MMAP_INDEX_SLOTS = int(os.getenv("CACHE_MMAP_INDEX_SLOTS", "65536"))  # 索引槽数（最多缓存的条目数）
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", "0.5"))  # 连接与读写超时（秒）
+CACHE_REDIS_RETRY_INTERVAL = float(os.getenv("CACHE_REDIS_RETRY_INTERVAL", "10"))  # 连接失败后多久再重试（秒）
+TTS_CACHE_TTL = int(os.getenv("TTS_CACHE_TTL", "86400"))  # 合成音频缓存时长（秒），0为不缓存
+
+# SSE输出配置（微批合并、心跳、每个流的缓冲上限）
+SSE_BATCH_INTERVAL = float(os.getenv("SSE_BATCH_INTERVAL", "0.03"))  # 文本增量合并窗口（秒），0为不合并
+SSE_BATCH_MAX_BYTES = int(os.getenv("SSE_BATCH_MAX_BYTES", "1024"))  # 合并文本达到该字节数立即发送
+SSE_HEARTBEAT_INTERVAL = float(os.getenv("SSE_HEARTBEAT_INTERVAL", "15"))  # 空闲多少秒发送一次注释心跳
+SSE_BUFFER_MAX_EVENTS = int(os.getenv("SSE_BUFFER_MAX_EVENTS", "256"))  # 每个流缓冲的最大事件数，满时上游等待
+
+# 会话与转写记录持久化（SQLite WAL，异步批量写入）
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "data/conversations.db")
+CONVERSATION_QUEUE_SIZE = int(os.getenv("CONVERSATION_QUEUE_SIZE", "10000"))  # 写入队列上限，满时丢弃记录而不阻塞请求
+CONVERSATION_BATCH_SIZE = int(os.getenv("CONVERSATION_BATCH_SIZE", "200"))  # 单个事务最多写入条数
+CONVERSATION_FLUSH_INTERVAL = float(os.getenv("CONVERSATION_FLUSH_INTERVAL", "0.2"))  # 攒批等待时间（秒）
+CONVERSATION_HISTORY_MAX_LIMIT = int(os.getenv("CONVERSATION_HISTORY_MAX_LIMIT", "100"))  # 历史查询单页上限
+
+# 静态资源管线配置（内容指纹、预压缩、长期缓存）
+STATIC_ASSET_PIPELINE = os.getenv("STATIC_ASSET_PIPELINE", "true").lower() == "true"
+STATIC_COMPRESS_MIN_SIZE = int(os.getenv("STATIC_COMPRESS_MIN_SIZE", "1024"))  # 小于该字节数的文件不压缩
+STATIC_MAX_INMEMORY_SIZE = int(os.getenv("STATIC_MAX_INMEMORY_SIZE", str(5 * 1024 * 1024)))  # 超过该大小的文件直接走文件服务
+STATIC_IMAGE_VARIANTS = os.getenv("STATIC_IMAGE_VARIANTS", "true").lower() == "true"  # 生成WebP/AVIF变体（需安装Pillow）
+STATIC_IMAGE_QUALITY = int(os.getenv("STATIC_IMAGE_QUALITY", "80"))
 
 # 服务器配置（支持环境变量覆盖）
 SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
@@ -66,9 +142,80 @@ DEEPSEEK_API_URL = os.getenv("DEEPSEEK_API_URL", "https://ark.cn-beijing.volces.
 # 默认参数配置
 DEFAULT_TEMPERATURE = float(os.getenv("DEFAULT_TEMPERATURE", "0.7"))
 DEFAULT_MAX_TOKENS = int(os.getenv("DEFAULT_MAX_TOKENS", "2048"))
+# 语音对话档位（input_mode=voice 时默认使用，回答更短以缩短首段TTS）
+VOICE_TEMPERATURE = float(os.getenv("VOICE_TEMPERATURE", "0.6"))
+VOICE_MAX_TOKENS = int(os.getenv("VOICE_MAX_TOKENS", "300"))
+# 自定义生成参数档位（JSON），例如 {"brief": {"temperature": 0.3, "max_tokens": 200}}
+GENERATION_PROFILES = os.getenv("GENERATION_PROFILES", "")
+# token用量计费单价（每千token，币种自定），用于估算费用
+LLM_PRICE_INPUT_PER_1K = float(os.getenv("LLM_PRICE_INPUT_PER_1K", "0.004"))
+LLM_PRICE_OUTPUT_PER_1K = float(os.getenv("LLM_PRICE_OUTPUT_PER_1K", "0.016"))
+USAGE_CONVERSATION_MAX = int(os.getenv("USAGE_CONVERSATION_MAX", "10000"))  # 最多统计多少个会话的用量
+CLIENT_METRICS_WINDOW = int(os.getenv("CLIENT_METRICS_WINDOW", "1000"))  # 前端渲染指标每类保留的最近样本数
+
+# 人设配置：人设文件中的每个条目可单独指定系统提示词、提供商、Aily技能、音色、语速与生成参数上限，
+# 文件修改后自动重新加载；未配置的字段沿用下方及上文的全局默认值
+PERSONAS_FILE = os.getenv("PERSONAS_FILE", "personas.json")
+PERSONA_RELOAD_INTERVAL = float(os.getenv("PERSONA_RELOAD_INTERVAL", "5"))  # 最多每隔多少秒检查一次人设文件是否变化
+DEFAULT_PERSONA = os.getenv("DEFAULT_PERSONA", "")  # 请求未指定人设时使用，空则取人设文件中的 default 或内置人设
+PERSONA_SYSTEM_PROMPT = os.getenv("PERSONA_SYSTEM_PROMPT", "你是陈耀忠，长城物业的董事长")  # 内置人设的系统提示词
 
 # LLM提供商配置
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "feishu_aily")
+# LLM路由配置：default（使用默认提供商）/ least_loaded（在途请求最少）/ latency（首包延迟最低）
+LLM_ROUTING_STRATEGY = os.getenv("LLM_ROUTING_STRATEGY", "default")
+LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", "0.3"))  # 延迟滑动平均系数
+LLM_CONVERSATION_PIN_MAX = int(os.getenv("LLM_CONVERSATION_PIN_MAX", "10000"))  # 最多记忆多少个会话的提供商绑定
+# 火山引擎LLM请求超时（连接超时, 首包/读超时，单位秒）
+VOLCANO_LLM_CONNECT_TIMEOUT = float(os.getenv("VOLCANO_LLM_CONNECT_TIMEOUT", "5"))
+VOLCANO_LLM_READ_TIMEOUT = float(os.getenv("VOLCANO_LLM_READ_TIMEOUT", "30"))
+
+# 重试与截止时间配置
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # 单次上游调用最多尝试次数（含首次）
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.1"))  # 退避基数（秒），第n次重试在 [0, base*2^n] 内随机等待
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "2"))  # 单次退避上限（秒）
+CHAT_REQUEST_TIMEOUT = float(os.getenv("CHAT_REQUEST_TIMEOUT", "90"))  # 一次对话请求的总时限（秒），客户端可用 X-Request-Timeout 缩短
+FEISHU_TOKEN_TIMEOUT = float(os.getenv("FEISHU_TOKEN_TIMEOUT", "10"))  # 获取tenant token的超时（秒）
+FEISHU_API_TIMEOUT = float(os.getenv("FEISHU_API_TIMEOUT", "30"))  # 单次Aily接口调用超时上限（秒），同时受请求截止时间约束
+FEISHU_RETRYABLE_CODES = os.getenv("FEISHU_RETRYABLE_CODES", "99991400")  # 可重试的飞书业务错误码（逗号分隔，如限流）
+FEISHU_POLL_MAX_FAILURES = int(os.getenv("FEISHU_POLL_MAX_FAILURES", "5"))  # 轮询连续失败多少次后中止
+
+# 熔断与故障转移配置
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))  # 连续失败次数达到阈值后熔断
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))  # 熔断后多久进入半开探测
+BREAKER_SLOW_CALL_THRESHOLD = float(os.getenv("BREAKER_SLOW_CALL_THRESHOLD", "10"))  # 超过该耗时的调用视为失败，0为不启用
+LLM_FAILOVER_ENABLED = os.getenv("LLM_FAILOVER_ENABLED", "false").lower() == "true"  # 熔断时是否切换到另一LLM提供商
+# 对冲请求配置（仅用于幂等查询）
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "0.5"))  # 首个请求超过该时间未返回则发起备份请求，0为不启用
+HEDGE_MAX_ATTEMPTS = int(os.getenv("HEDGE_MAX_ATTEMPTS", "2"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "16"))
+
+# 健康检查配置
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "30"))  # 上游依赖探测结果缓存时间（秒），过期后后台刷新
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))  # 单次依赖探测超时（秒）
+HEALTH_MAX_ACTIVE_STREAMS = int(os.getenv("HEALTH_MAX_ACTIVE_STREAMS", "50"))  # 进行中的流达到该数量时就绪检查返回503，0为不限制
+HEALTH_MAX_QUEUE_DEPTH = int(os.getenv("HEALTH_MAX_QUEUE_DEPTH", "100"))  # 合成线程池或对话落库队列积压达到该值时就绪检查返回503，0为不限制
+
+# 性能诊断配置
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # 管理接口令牌（请求头 X-Admin-Token），为空时管理接口关闭
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"  # 启动时开启请求追踪，也可通过管理接口运行时开关
+PROFILING_SLOW_THRESHOLD = float(os.getenv("PROFILING_SLOW_THRESHOLD", "5"))  # 超过该耗时（秒）的请求记录调用栈采样与上游调用
+PROFILING_SLOW_MAX = int(os.getenv("PROFILING_SLOW_MAX", "50"))  # 最多保留多少条慢请求记录
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.01"))  # 采样分析器默认采样间隔（秒）
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "120"))  # 采样分析器单次最长运行时间（秒）
+
+# 功能开关：关闭的功能不创建客户端，相关接口返回503；配置不完整的功能同样视为不可用
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "feishu_aily,volcano")  # 启用的LLM提供商（逗号分隔）
+TTS_ENABLED = os.getenv("TTS_ENABLED", "true").lower() == "true"
+ASR_ENABLED = os.getenv("ASR_ENABLED", "true").lower() == "true"
+LLM_WARMUP_ON_START = os.getenv("LLM_WARMUP_ON_START", "true").lower() == "true"  # 启动时预建LLM客户端，关闭则首次请求时创建
 
 # 调试模式
-DEBUG = os.getenv("DEBUG", "true").lower() == "true"
\ No newline at end of file
+DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+
+# 日志配置
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG 级别需显式设置，不随 DEBUG 开启（逐块日志开销大且可能含对话内容）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text 或 json（结构化日志）
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # 日志队列上限，满时丢弃新日志而不阻塞请求
+# 高频调试日志的按事件采样率（0~1），未列出的事件全部记录
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "aily.chunk=0.05,llm.line=0.02,tts.line=0.02,asr.http=0.2,llm.answer=0.1")
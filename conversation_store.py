@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话与语音识别记录持久化
+对话轮次、ASR转写及音频元数据经有界队列异步批量写入SQLite（WAL模式），
+写入不阻塞SSE流；历史记录按自增ID做键集分页查询
+"""
+
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+from features import ConversationStoreSettings, get_settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    input_mode TEXT NOT NULL DEFAULT 'text',
+    user_text TEXT NOT NULL,
+    assistant_text TEXT NOT NULL DEFAULT '',
+    provider TEXT,
+    status TEXT NOT NULL DEFAULT 'ok',
+    first_chunk_ms INTEGER,
+    total_ms INTEGER,
+    created_at REAL NOT NULL,
+    profile TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_turns_conversation ON turns (conversation_id, id);
+
+CREATE TABLE IF NOT EXISTS transcripts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT,
+    filename TEXT NOT NULL,
+    audio_bytes INTEGER,
+    audio_duration REAL,
+    text TEXT NOT NULL DEFAULT '',
+    confidence REAL,
+    success INTEGER NOT NULL,
+    recognize_ms INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcripts_conversation ON transcripts (conversation_id, id);
+"""
+
+TURN_COLUMNS = ('conversation_id', 'input_mode', 'user_text', 'assistant_text', 'provider', 'status',
+                'first_chunk_ms', 'total_ms', 'created_at', 'profile', 'prompt_tokens', 'completion_tokens')
+# 旧版本数据库缺少的列，启动时补齐
+TURN_MIGRATIONS = (('profile', 'TEXT'), ('prompt_tokens', 'INTEGER'), ('completion_tokens', 'INTEGER'))
+TRANSCRIPT_COLUMNS = ('conversation_id', 'filename', 'audio_bytes', 'audio_duration', 'text', 'confidence',
+                      'success', 'recognize_ms', 'created_at')
+
+
+class TurnRecord:
+    """一轮对话的记录，在流式响应过程中逐步填充"""
+
+    def __init__(self, conversation_id: Optional[str], user_text: str, input_mode: str = 'text'):
+        self.conversation_id = conversation_id
+        self.user_text = user_text
+        self.input_mode = input_mode
+        self.assistant_text = ''
+        self.provider = None
+        self.status = 'ok'
+        self.first_chunk_latency = None
+        self.profile = None
+        self.usage = None  # 上游返回的token用量（prompt_tokens/completion_tokens），Aily不提供
+        self.started_at = time.time()
+
+    def to_row(self) -> tuple:
+        total_ms = int((time.time() - self.started_at) * 1000)
+        first_ms = int(self.first_chunk_latency * 1000) if self.first_chunk_latency is not None else None
+        usage = self.usage or {}
+        return (self.conversation_id, self.input_mode, self.user_text, self.assistant_text, self.provider,
+                self.status, first_ms, total_ms, self.started_at, self.profile,
+                usage.get('prompt_tokens'), usage.get('completion_tokens'))
+
+
+class ConversationStore:
+    """SQLite会话存储
+
+    请求线程只做 put_nowait 入队（队列满时丢弃并计数），单个后台写线程攒批后
+    在一个事务中 executemany 写入；写线程在第一条记录入队时才启动，进程退出时写完剩余记录。
+    读取使用各线程独立的只读连接，WAL模式下读写互不阻塞。
+    """
+
+    def __init__(self, db_path: Optional[str] = None, settings: Optional[ConversationStoreSettings] = None):
+        self.settings = settings or get_settings().conversation_store
+        self.db_path = db_path or self.settings.db_path
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.settings.queue_size)
+        self._local = threading.local()
+        self.dropped = 0
+        self.written = 0
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._migrate(conn)
+        conn.close()
+
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(turns)')}
+        for column, column_type in TURN_MIGRATIONS:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE turns ADD COLUMN {column} {column_type}')
+        conn.commit()
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    # ---- 写入（write-behind） ----
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='conversation-writer', daemon=True)
+                self._writer.start()
+                # 写线程为守护线程，进程退出前先写完队列中的记录
+                atexit.register(self.close)
+
+    def _enqueue(self, table: str, row: tuple):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((table, row))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"会话存储写入队列已满，丢弃一条{table}记录（累计丢弃 {self.dropped}）")
+
+    def record_turn(self, turn: TurnRecord):
+        """异步记录一轮对话，没有会话ID的请求不记录"""
+        if turn.conversation_id:
+            self._enqueue('turns', turn.to_row())
+
+    def record_transcript(self, conversation_id: Optional[str], filename: str, result: Optional[Dict],
+                          audio_bytes: Optional[int], recognize_seconds: float):
+        """异步记录一次语音识别结果与音频元数据"""
+        result = result or {}
+        self._enqueue('transcripts', (
+            conversation_id, filename, audio_bytes, result.get('duration'), result.get('text', ''),
+            result.get('confidence'), 1 if result.get('success') else 0, int(recognize_seconds * 1000), time.time()
+        ))
+
+    def _write_loop(self):
+        conn = self._connect()
+        columns = {'turns': TURN_COLUMNS, 'transcripts': TRANSCRIPT_COLUMNS}
+        while True:
+            batch = [self._queue.get()]
+            # 攒批：等待片刻收集更多记录，最多 batch_size 条
+            deadline = time.time() + self.settings.flush_interval
+            while len(batch) < self.settings.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            rows: Dict[str, List[tuple]] = {}
+            for table, row in batch:
+                rows.setdefault(table, []).append(row)
+            try:
+                with conn:
+                    for table, table_rows in rows.items():
+                        cols = columns[table]
+                        conn.executemany(
+                            f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                            table_rows
+                        )
+                self.written += len(batch)
+            except Exception as e:
+                logger.error(f"会话存储批量写入失败，丢弃 {len(batch)} 条记录: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待队列中的记录写入完成（用于关闭前或调试）"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 5.0) -> bool:
+        """关闭前写入队列中剩余的记录（进程退出时自动调用），超时未写完返回False"""
+        if self._writer is None:
+            return True
+        flushed = self.flush(timeout)
+        if not flushed:
+            logger.warning(f"会话存储关闭时仍有 {self._queue.unfinished_tasks} 条记录未写入")
+        return flushed
+
+    # ---- 查询 ----
+
+    def history(self, conversation_id: str, before: Optional[int] = None, limit: int = 20) -> Dict:
+        """按自增ID倒序做键集分页，返回按时间正序排列的一页对话及下一页游标"""
+        limit = max(1, min(limit, self.settings.history_max_limit))
+        sql = ("SELECT id, input_mode, user_text, assistant_text, provider, status, created_at "
+               "FROM turns WHERE conversation_id = ?")
+        params: list = [conversation_id]
+        if before is not None:
+            sql += " AND id < ?"
+            params.append(before)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._reader().execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        items = [dict(row) for row in reversed(rows)]
+        return {
+            'items': items,
+            'has_more': has_more,
+            'next_before': items[0]['id'] if has_more and items else None
+        }
+
+    def stats(self) -> Dict:
+        return {'queued': self._queue.qsize(), 'written': self.written, 'dropped': self.dropped}
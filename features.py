@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+功能开关与启动配置
+启动时一次性读取并校验配置，得到类型化的只读设置对象（含各功能的分组设置）；
+各功能（LLM/TTS/ASR）的客户端、线程池与后台任务按需创建，关闭或配置缺失的功能不影响其余接口启动
+"""
+
+import logging
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+# 各功能必需的配置项；值为空或仍为 YOUR_ 开头的占位符视为缺失
+REQUIRED_SETTINGS: Dict[str, Tuple[str, ...]] = {
+    'feishu_aily': ('FEISHU_APP_ID', 'FEISHU_APP_SECRET', 'SKILL_APP_ID', 'SKILL_ID'),
+    'volcano': ('VOLCANO_ACCESS_KEY', 'DEEPSEEK_API_URL', 'DEEPSEEK_MODEL'),
+    'tts': ('VOICE_APP_ID', 'VOICE_ACCESS_TOKEN', 'TTS_VOICE_TYPE'),
+    'asr': ('ASR_APP_ID', 'ASR_ACCESS_TOKEN', 'ASR_SUBMIT_URL', 'ASR_QUERY_URL'),
+}
+
+FEATURE_NAMES = {
+    'feishu_aily': '飞书Aily对话',
+    'volcano': '火山引擎对话',
+    'tts': '语音合成',
+    'asr': '语音识别',
+    'llm': '对话',
+}
+
+# LLM提供商对应的功能名
+LLM_PROVIDER_NAMES = ('feishu_aily', 'volcano')
+
+
+class FeatureUnavailableError(RuntimeError):
+    """功能已关闭或配置不完整"""
+
+    def __init__(self, feature: str, reason: str):
+        self.feature = feature
+        self.reason = reason
+        super().__init__(f"{FEATURE_NAMES.get(feature, feature)}不可用: {reason}")
+
+
+@dataclass(frozen=True)
+class FeatureStatus:
+    name: str
+    enabled: bool
+    missing: Tuple[str, ...] = ()
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and not self.missing
+
+    @property
+    def reason(self) -> str:
+        if not self.enabled:
+            return '功能未启用'
+        if self.missing:
+            return f"缺少配置: {', '.join(self.missing)}"
+        return ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'enabled': self.enabled, 'available': self.available, 'missing': list(self.missing)}
+
+
+@dataclass(frozen=True)
+class TTSSettings:
+    """语音合成分段与线程池"""
+    chunk_max_chars: int
+    first_chunk_chars: int
+    longform_max_chars: int
+    longform_workers: int
+    longform_window: int
+
+
+@dataclass(frozen=True)
+class VoiceTurnSettings:
+    """语音对话轮次的分句合成"""
+    tts_workers: int
+    tts_window: int
+    min_segment_chars: int
+
+
+@dataclass(frozen=True)
+class ConversationStoreSettings:
+    """会话存储的写入队列与攒批"""
+    db_path: str
+    queue_size: int
+    batch_size: int
+    flush_interval: float
+    history_max_limit: int
+
+
+@dataclass(frozen=True)
+class StaticAssetSettings:
+    """静态资源预压缩与图片变体"""
+    enabled: bool
+    compress_min_size: int
+    max_inmemory_size: int
+    image_variants: bool
+    image_quality: int
+
+
+@dataclass(frozen=True)
+class ResilienceSettings:
+    """熔断与对冲请求"""
+    breaker_failure_threshold: int
+    breaker_recovery_timeout: float
+    breaker_slow_call_threshold: float
+    hedge_delay: float
+    hedge_max_attempts: int
+    hedge_max_workers: int
+
+
+@dataclass(frozen=True)
+class HealthSettings:
+    """依赖探测与就绪检查阈值"""
+    probe_interval: float
+    probe_timeout: float
+    max_active_streams: int
+    max_queue_depth: int
+
+
+@dataclass(frozen=True)
+class Settings:
+    """类型化的只读设置，启动时读取并校验一次"""
+    server_host: str
+    server_port: int
+    debug: bool
+    llm_providers: Tuple[str, ...]
+    default_llm_provider: str
+    llm_warmup_on_start: bool
+    features: Dict[str, FeatureStatus]
+    tts: TTSSettings
+    voice_turn: VoiceTurnSettings
+    conversation_store: ConversationStoreSettings
+    static_assets: StaticAssetSettings
+    resilience: ResilienceSettings
+    health: HealthSettings
+
+    def feature(self, name: str) -> FeatureStatus:
+        return self.features[name]
+
+    @property
+    def available_llm_providers(self) -> Tuple[str, ...]:
+        """已启用且配置完整的LLM提供商"""
+        return tuple(name for name in self.llm_providers if self.features[name].available)
+
+    def require(self, name: str):
+        """功能不可用时抛出 FeatureUnavailableError；name 为 llm 时要求至少一个LLM提供商可用"""
+        if name == 'llm':
+            if not self.available_llm_providers:
+                raise FeatureUnavailableError(name, '没有配置完整的LLM提供商')
+            return
+        status = self.features[name]
+        if not status.available:
+            raise FeatureUnavailableError(name, status.reason)
+
+    def features_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {name: status.to_dict() for name, status in self.features.items()}
+
+
+def _missing(names: Tuple[str, ...]) -> Tuple[str, ...]:
+    missing = []
+    for name in names:
+        value = str(getattr(config, name, '') or '').strip()
+        if not value or value.startswith('YOUR_'):
+            missing.append(name)
+    return tuple(missing)
+
+
+def _parse_providers(spec: str) -> Tuple[str, ...]:
+    providers = []
+    for name in spec.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in LLM_PROVIDER_NAMES:
+            logger.warning(f"LLM_PROVIDERS 中的未知提供商已忽略: {name}")
+            continue
+        if name not in providers:
+            providers.append(name)
+    return tuple(providers)
+
+
+def _at_least(name: str, value, minimum):
+    """数值小于下限时记录日志并取下限"""
+    if value < minimum:
+        logger.warning(f"{name}={value} 小于下限，改用 {minimum}")
+        return minimum
+    return value
+
+
+def _load_feature_settings() -> Dict[str, Any]:
+    return {
+        'tts': TTSSettings(
+            chunk_max_chars=_at_least('TTS_CHUNK_MAX_CHARS', config.TTS_CHUNK_MAX_CHARS, 1),
+            first_chunk_chars=_at_least('TTS_FIRST_CHUNK_CHARS', config.TTS_FIRST_CHUNK_CHARS, 1),
+            longform_max_chars=_at_least('TTS_LONGFORM_MAX_CHARS', config.TTS_LONGFORM_MAX_CHARS, 1),
+            longform_workers=_at_least('TTS_LONGFORM_WORKERS', config.TTS_LONGFORM_WORKERS, 1),
+            longform_window=_at_least('TTS_LONGFORM_WINDOW', config.TTS_LONGFORM_WINDOW, 1),
+        ),
+        'voice_turn': VoiceTurnSettings(
+            tts_workers=_at_least('VOICE_TURN_TTS_WORKERS', config.VOICE_TURN_TTS_WORKERS, 1),
+            tts_window=_at_least('VOICE_TURN_TTS_WINDOW', config.VOICE_TURN_TTS_WINDOW, 1),
+            min_segment_chars=_at_least('VOICE_TURN_MIN_SEGMENT_CHARS', config.VOICE_TURN_MIN_SEGMENT_CHARS, 0),
+        ),
+        'conversation_store': ConversationStoreSettings(
+            db_path=config.CONVERSATION_DB_PATH,
+            queue_size=_at_least('CONVERSATION_QUEUE_SIZE', config.CONVERSATION_QUEUE_SIZE, 1),
+            batch_size=_at_least('CONVERSATION_BATCH_SIZE', config.CONVERSATION_BATCH_SIZE, 1),
+            flush_interval=_at_least('CONVERSATION_FLUSH_INTERVAL', config.CONVERSATION_FLUSH_INTERVAL, 0.0),
+            history_max_limit=_at_least('CONVERSATION_HISTORY_MAX_LIMIT', config.CONVERSATION_HISTORY_MAX_LIMIT, 1),
+        ),
+        'static_assets': StaticAssetSettings(
+            enabled=config.STATIC_ASSET_PIPELINE,
+            compress_min_size=_at_least('STATIC_COMPRESS_MIN_SIZE', config.STATIC_COMPRESS_MIN_SIZE, 0),
+            max_inmemory_size=_at_least('STATIC_MAX_INMEMORY_SIZE', config.STATIC_MAX_INMEMORY_SIZE, 0),
+            image_variants=config.STATIC_IMAGE_VARIANTS,
+            image_quality=min(100, _at_least('STATIC_IMAGE_QUALITY', config.STATIC_IMAGE_QUALITY, 1)),
+        ),
+        'resilience': ResilienceSettings(
+            breaker_failure_threshold=_at_least('BREAKER_FAILURE_THRESHOLD', config.BREAKER_FAILURE_THRESHOLD, 1),
+            breaker_recovery_timeout=_at_least('BREAKER_RECOVERY_TIMEOUT', config.BREAKER_RECOVERY_TIMEOUT, 0.0),
+            breaker_slow_call_threshold=_at_least('BREAKER_SLOW_CALL_THRESHOLD',
+                                                  config.BREAKER_SLOW_CALL_THRESHOLD, 0.0),
+            hedge_delay=_at_least('HEDGE_DELAY', config.HEDGE_DELAY, 0.0),
+            hedge_max_attempts=_at_least('HEDGE_MAX_ATTEMPTS', config.HEDGE_MAX_ATTEMPTS, 1),
+            hedge_max_workers=_at_least('HEDGE_MAX_WORKERS', config.HEDGE_MAX_WORKERS, 1),
+        ),
+        'health': HealthSettings(
+            probe_interval=_at_least('HEALTH_PROBE_INTERVAL', config.HEALTH_PROBE_INTERVAL, 1.0),
+            probe_timeout=_at_least('HEALTH_PROBE_TIMEOUT', config.HEALTH_PROBE_TIMEOUT, 0.1),
+            max_active_streams=_at_least('HEALTH_MAX_ACTIVE_STREAMS', config.HEALTH_MAX_ACTIVE_STREAMS, 0),
+            max_queue_depth=_at_least('HEALTH_MAX_QUEUE_DEPTH', config.HEALTH_MAX_QUEUE_DEPTH, 0),
+        ),
+    }
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """读取并校验配置（只执行一次），配置问题记录日志而不中断启动"""
+    providers = _parse_providers(config.LLM_PROVIDERS)
+    if not providers:
+        logger.error("LLM_PROVIDERS 未启用任何有效提供商，回退为 feishu_aily,volcano")
+        providers = ('feishu_aily', 'volcano')
+
+    port = config.SERVER_PORT
+    if not 0 < port < 65536:
+        raise ValueError(f"SERVER_PORT 超出范围: {port}")
+
+    enabled = {
+        'feishu_aily': 'feishu_aily' in providers,
+        'volcano': 'volcano' in providers,
+        'tts': config.TTS_ENABLED,
+        'asr': config.ASR_ENABLED,
+    }
+    features = {}
+    for name, required in REQUIRED_SETTINGS.items():
+        status = FeatureStatus(name, enabled[name], _missing(required) if enabled[name] else ())
+        features[name] = status
+        if status.enabled and status.missing:
+            logger.warning(f"{FEATURE_NAMES[name]}配置不完整（{status.reason}），相关接口将不可用")
+
+    # 默认提供商优先取配置完整的提供商
+    usable = [name for name in providers if features[name].available] or list(providers)
+    default_provider = config.LLM_PROVIDER
+    if default_provider not in usable:
+        logger.warning(f"默认LLM提供商 {default_provider} 未启用或配置不完整，改用 {usable[0]}")
+        default_provider = usable[0]
+
+    settings = Settings(
+        server_host=config.SERVER_HOST,
+        server_port=port,
+        debug=config.DEBUG,
+        llm_providers=providers,
+        default_llm_provider=default_provider,
+        llm_warmup_on_start=config.LLM_WARMUP_ON_START,
+        features=features,
+        **_load_feature_settings(),
+    )
+    available = [FEATURE_NAMES[name] for name, status in features.items() if status.available]
+    logger.info(f"已启用功能: {', '.join(available) or '无'}")
+    return settings
+
+
+class LazyClient:
+    """按需创建的客户端
+
+    首次 get() 时才构造（线程安全，只构造一次）；所属功能不可用时抛出 FeatureUnavailableError。
+    构造失败不缓存，下次调用重试。
+    """
+
+    def __init__(self, feature: str, factory: Callable[[], Any], settings: Optional[Settings] = None):
+        self.feature = feature
+        self.factory = factory
+        self.settings = settings or get_settings()
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        instance = self._instance
+        if instance is not None:
+            return instance
+        self.settings.require(self.feature)
+        with self._lock:
+            if self._instance is None:
+                self._instance = self.factory()
+                logger.info(f"{FEATURE_NAMES.get(self.feature, self.feature)}客户端已创建")
+            return self._instance
@@ -2,18 +2,171 @@
 # -*- coding: utf-8 -*-
 """
 飞书Aily流式输出客户端
-基于飞书Aily对话API实现流式输出效果
+基于飞书Aily对话API实现流式输出效果：上游提供运行事件流时按推送增量输出，
+否则（或事件流中断时）回退为轮询运行状态与消息列表
 """
 
 import requests
 import json
 import time
 import logging
-from typing import Generator, Optional, Dict, Any
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, Optional, Dict, Any, Iterable, Iterator, Tuple
+from urllib.parse import urlencode
 from config import *
+from circuit_breaker import CircuitOpenError, get_breaker, hedged_call
+from http_session import create_http_session
+from cache_backend import get_cache
+from cancellation import Deadline, DeadlineExceeded
+from retry import retry_call, is_retryable, is_retryable_unsent
+from profiling import upstream_span
+from logging_setup import sample_log
 
 logger = logging.getLogger(__name__)
 
+
+RETRYABLE_CODES = {code.strip() for code in FEISHU_RETRYABLE_CODES.split(',') if code.strip()}
+
+
+class AilyAPIError(Exception):
+    """飞书开放平台返回的业务错误（code != 0）
+
+    FEISHU_RETRYABLE_CODES 中的错误码（如限流）表示请求被拒绝、未被执行，可安全重试。
+    """
+
+    def __init__(self, code, message: str):
+        self.code = code
+        self.retryable = self.rejected = str(code) in RETRYABLE_CODES
+        super().__init__(message)
+
+
+class AilyContentReplace(str):
+    """Bot部分消息被非追加式改写时输出的完整内容，调用方应整体替换已输出文本"""
+
+
+class EventStreamUnavailable(Exception):
+    """上游未提供运行事件流（接口不存在或未返回 text/event-stream）
+
+    unsupported 为True表示上游明确不支持（404/405/415 或非事件流响应），其余状态码视为暂时不可用。
+    """
+
+    def __init__(self, status_code: int, message: str):
+        self.status_code = status_code
+        self.unsupported = status_code in EVENT_STREAM_UNSUPPORTED_STATUS or status_code == 200
+        super().__init__(message)
+
+
+# 运行的终态
+RUN_FINAL_STATUSES = ('COMPLETED', 'FAILED', 'CANCELLED')
+# 表示上游不支持运行事件流的HTTP状态码
+EVENT_STREAM_UNSUPPORTED_STATUS = (404, 405, 415)
+# auto 模式下判定不支持后，至少间隔多久再用真实运行尝试事件流（秒）
+EVENT_STREAM_REPROBE_INTERVAL = 300
+
+
+def iter_sse_events(response: requests.Response) -> Iterator[Tuple[str, str]]:
+    """把 text/event-stream 响应解析为 (事件名, data) 序列，忽略注释行（心跳）"""
+    # 事件流固定为UTF-8，未声明charset时requests会按ISO-8859-1解码
+    response.encoding = 'utf-8'
+    event, data = 'message', []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, '\n'.join(data)
+            event, data = 'message', []
+        elif line.startswith(':'):
+            continue
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, '\n'.join(data)
+
+
+class AilyMessageReader:
+    """按运行增量读取Bot回复消息
+
+    - 首次定位到Bot消息后记住其ID，之后只按ID匹配，不再扫描已知消息
+    - 优先按 run_id 过滤消息列表；接口不支持该参数时回退为完整列表
+    - 内容为追加时输出新增部分，发生改写时输出 AilyContentReplace
+    """
+
+    def __init__(self, client: 'FeishuAilyStreamingClient', session_id: str, run_id: str,
+                 known_message_ids: Iterable[str] = (), deadline: Optional[Deadline] = None):
+        self.client = client
+        self.session_id = session_id
+        self.run_id = run_id
+        self.deadline = deadline
+        self.known_message_ids = set(known_message_ids)
+        self.bot_message_id = None
+        self.content = ""
+        self.completed = False
+        self.run_status = ''
+        self._filter_by_run = True
+
+    def _fetch_messages(self):
+        if self._filter_by_run:
+            try:
+                data = self.client._list_messages(self.session_id, with_partial=True, run_id=self.run_id,
+                                                  page_size=FEISHU_MESSAGE_PAGE_SIZE, deadline=self.deadline)
+                return data.get('messages', [])
+            except AilyAPIError as e:
+                if e.retryable:
+                    raise
+                logger.warning(f"按run_id获取消息失败，回退为完整消息列表: {e}")
+                self._filter_by_run = False
+        data = self.client._list_messages(self.session_id, with_partial=True, deadline=self.deadline)
+        return data.get('messages', [])
+
+    def _find_bot_message(self, messages):
+        if self.bot_message_id:
+            for msg in messages:
+                if msg.get('id') == self.bot_message_id:
+                    return msg
+            return None
+        for msg in messages:
+            message_id = msg.get('id')
+            if message_id in self.known_message_ids:
+                continue
+            if msg.get('sender', {}).get('sender_type') == 'ASSISTANT':
+                self.bot_message_id = message_id
+                return msg
+            self.known_message_ids.add(message_id)
+        return None
+
+    @property
+    def finished(self) -> bool:
+        """运行已结束，或Bot消息已完成且有内容"""
+        return self.run_status in RUN_FINAL_STATUSES or (self.completed and bool(self.content))
+
+    def poll(self) -> Optional[str]:
+        """拉取一次并返回内容变化：新增文本、AilyContentReplace 或 None（无变化）"""
+        return self.apply(self._fetch_messages())
+
+    def apply(self, messages) -> Optional[str]:
+        """处理一批消息快照（轮询结果或事件流推送），返回内容变化"""
+        bot_message = self._find_bot_message(messages)
+        if not bot_message:
+            return None
+        self.completed = bot_message.get('status') == 'COMPLETED'
+        return self._diff(bot_message.get('content', '') or '')
+
+    def _diff(self, current: str) -> Optional[str]:
+        previous = self.content
+        if current == previous:
+            return None
+        self.content = current
+        if current.startswith(previous):
+            return current[len(previous):]
+        logger.info(f"飞书Aily部分消息被改写，整体替换已输出内容（{len(previous)} -> {len(current)} 字符）")
+        return AilyContentReplace(current)
+
+
 class FeishuAilyStreamingClient:
     """飞书Aily流式输出客户端"""
     
@@ -28,48 +181,115 @@ class FeishuAilyStreamingClient:
         
         self._tenant_access_token = None
         self._token_expires_at = 0
+        self._token_lock = threading.Lock()
+        # tenant token 放在共享缓存中，多个worker共用一个token，不必各自获取
+        self.token_cache = get_cache('feishu_token')
+        self.breaker = get_breaker('feishu_aily')
+        # 长连接会话，预热后复用TCP/TLS连接
+        self.session = create_http_session(name='feishu_aily')
+        # 预热会话池：按技能应用分开存放 (session_id, 创建时间)，各人设共用同一token与连接池
+        self._warm_sessions: Dict[str, deque] = {}
+        self._warm_lock = threading.Lock()
+        self._warm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='aily-warmup')
+        # 预热池非空时定时清理过期会话，没有新请求时过期会话也会被回收
+        self._sweep_timer: Optional[threading.Timer] = None
+        # 运行事件流是否可用：None 为未知，auto 模式下由真实运行的事件流请求判定
+        self._event_stream_supported = {'on': True, 'off': False}.get(FEISHU_EVENT_STREAM)
+        self._event_stream_checked_at = 0.0
         
-    def _get_tenant_access_token(self) -> str:
-        """获取tenant access token"""
+    def _get_tenant_access_token(self, min_ttl: float = 0) -> str:
+        """获取tenant access token
+
+        min_ttl: 要求token至少还有多少秒有效期，不足则提前刷新（预热时使用）
+        """
         current_time = time.time()
         
         # 如果token还未过期，直接返回
-        if self._tenant_access_token and current_time < self._token_expires_at:
+        if self._tenant_access_token and current_time + min_ttl < self._token_expires_at:
             return self._tenant_access_token
-            
-        url = f"{self.base_url}/open-apis/auth/v3/tenant_access_token/internal"
-        headers = {
-            'Content-Type': 'application/json; charset=utf-8'
-        }
-        data = {
-            "app_id": self.app_id,
-            "app_secret": self.app_secret
-        }
         
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=10)
-            response.raise_for_status()
+        with self._token_lock:
+            current_time = time.time()
+            if self._tenant_access_token and current_time + min_ttl < self._token_expires_at:
+                return self._tenant_access_token
             
-            result = response.json()
-            if result.get('code') == 0:
-                self._tenant_access_token = result['tenant_access_token']
-                # 设置过期时间（提前5分钟刷新）
-                expires_in = result.get('expire', 7200)
-                self._token_expires_at = current_time + expires_in - 300
-                
-                logger.info("成功获取飞书tenant access token")
+            # 其他worker已获取的token
+            cached = self.token_cache.get_json(self.app_id)
+            if cached and current_time + min_ttl < cached.get('expires_at', 0):
+                self._tenant_access_token = cached['token']
+                self._token_expires_at = cached['expires_at']
                 return self._tenant_access_token
-            else:
-                raise Exception(f"获取token失败: {result}")
-                
-        except Exception as e:
-            logger.error(f"获取飞书tenant access token失败: {e}")
-            raise
+            
+            url = f"{self.base_url}/open-apis/auth/v3/tenant_access_token/internal"
+            headers = {
+                'Content-Type': 'application/json; charset=utf-8'
+            }
+            data = {
+                "app_id": self.app_id,
+                "app_secret": self.app_secret
+            }
+            
+            def _fetch():
+                response = self.session.post(url, headers=headers, json=data, timeout=FEISHU_TOKEN_TIMEOUT)
+                response.raise_for_status()
+                return response.json()
+            
+            try:
+                # 获取token是幂等的，瞬时错误直接重试
+                result = retry_call(_fetch, 'feishu.token')
+                if result.get('code') == 0:
+                    self._tenant_access_token = result['tenant_access_token']
+                    # 设置过期时间（提前5分钟刷新）
+                    expires_in = result.get('expire', 7200)
+                    self._token_expires_at = current_time + expires_in - 300
+                    self.token_cache.set_json(self.app_id, {
+                        'token': self._tenant_access_token,
+                        'expires_at': self._token_expires_at
+                    }, ttl=max(1, self._token_expires_at - current_time))
+                    
+                    logger.info("成功获取飞书tenant access token")
+                    return self._tenant_access_token
+                else:
+                    raise Exception(f"获取token失败: {result}")
+                    
+            except Exception as e:
+                logger.error(f"获取飞书tenant access token失败: {e}")
+                raise
     
-    def _make_api_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict[Any, Any]:
-        """发起API请求"""
+    def ping(self, timeout: float = HEALTH_PROBE_TIMEOUT) -> Dict[str, Any]:
+        """健康探测：直接请求一次token接口（不重试、不走缓存），返回上游业务码"""
+        url = f"{self.base_url}/open-apis/auth/v3/tenant_access_token/internal"
+        response = self.session.post(url, json={"app_id": self.app_id, "app_secret": self.app_secret},
+                                     timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+        if result.get('code') != 0:
+            raise AilyAPIError(result.get('code'), f"获取token失败: {result.get('msg')}")
+        return {'code': 0}
+    
+    def _make_api_request(self, method: str, endpoint: str, data: Optional[Dict] = None, operation: str = 'aily.api',
+                          deadline: Optional[Deadline] = None, idempotent: bool = True,
+                          guarded: bool = True) -> Dict[Any, Any]:
+        """发起API请求（受熔断器保护），瞬时错误按退避重试
+
+        重试在熔断器之内进行，一次请求的多次尝试只计一次成败；
+        idempotent 为False的写操作（如触发运行）只在请求未被执行时重试，避免重复执行。
+        guarded 为False时不经过熔断器，由调用方（如对冲请求）统一记录成败。
+        """
+        call = lambda: retry_call(
+            lambda: self._do_api_request(method, endpoint, data, deadline),
+            operation,
+            deadline=deadline,
+            retryable=is_retryable if idempotent else is_retryable_unsent
+        )
+        return self.breaker.call(call) if guarded else call()
+
+    def _do_api_request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                        deadline: Optional[Deadline] = None) -> Dict[Any, Any]:
+        """实际发起API请求，超时不超过请求剩余时间"""
         token = self._get_tenant_access_token()
         url = f"{self.base_url}{endpoint}"
+        timeout = deadline.timeout(FEISHU_API_TIMEOUT) if deadline is not None else FEISHU_API_TIMEOUT
         
         headers = {
             'Authorization': f'Bearer {token}',
@@ -78,15 +298,17 @@ class FeishuAilyStreamingClient:
         
         try:
             if method.upper() == 'GET':
-                response = requests.get(url, headers=headers, timeout=30)
+                response = self.session.get(url, headers=headers, timeout=timeout)
+            elif method.upper() == 'DELETE':
+                response = self.session.delete(url, headers=headers, timeout=timeout)
             else:
-                response = requests.post(url, headers=headers, json=data, timeout=30)
+                response = self.session.post(url, headers=headers, json=data, timeout=timeout)
             
             response.raise_for_status()
             result = response.json()
             
             if result.get('code') != 0:
-                raise Exception(f"API请求失败: {result}")
+                raise AilyAPIError(result.get('code'), f"API请求失败: {result}")
                 
             return result.get('data', {})
             
@@ -94,14 +316,14 @@ class FeishuAilyStreamingClient:
             logger.error(f"API请求失败 {method} {endpoint}: {e}")
             raise
     
-    def _create_session(self) -> str:
-        """创建会话"""
+    def _create_session(self, skill_app_id: Optional[str] = None, deadline: Optional[Deadline] = None) -> str:
+        """创建会话（重试至多多出一个空会话，视为可重试）"""
         endpoint = f"/open-apis/aily/v1/sessions"
         data = {
-            "app_id": self.skill_app_id
+            "app_id": skill_app_id or self.skill_app_id
         }
         
-        result = self._make_api_request('POST', endpoint, data)
+        result = self._make_api_request('POST', endpoint, data, 'aily.create_session', deadline)
         session_data = result.get('session', {})
         session_id = session_data.get('id')
         
@@ -111,8 +333,99 @@ class FeishuAilyStreamingClient:
         logger.info(f"创建飞书Aily会话成功: {session_id}")
         return session_id
     
-    def _create_message(self, session_id: str, content: str) -> str:
-        """创建用户消息"""
+    def _delete_session(self, session_id: str):
+        """删除会话（回收未使用的预热会话）"""
+        endpoint = f"/open-apis/aily/v1/sessions/{session_id}"
+        self._make_api_request('DELETE', endpoint, operation='aily.delete_session')
+        logger.info(f"已回收飞书Aily预热会话: {session_id}")
+    
+    def _reclaim_expired_sessions(self):
+        """移除超过TTL的预热会话并在后台删除"""
+        expired = []
+        now = time.time()
+        with self._warm_lock:
+            for pool in self._warm_sessions.values():
+                while pool and now - pool[0][1] > FEISHU_WARM_SESSION_TTL:
+                    expired.append(pool.popleft()[0])
+        for session_id in expired:
+            self._warm_executor.submit(self._safe_delete_session, session_id)
+    
+    def _schedule_sweep(self):
+        """预热池中有会话时，在最早的会话过期后清理一次；清理后仍有会话则继续定时"""
+        with self._warm_lock:
+            if self._sweep_timer is not None:
+                return
+            created = [pool[0][1] for pool in self._warm_sessions.values() if pool]
+            if not created:
+                return
+            delay = max(1.0, min(created) + FEISHU_WARM_SESSION_TTL - time.time() + 1)
+            self._sweep_timer = threading.Timer(delay, self._sweep)
+            self._sweep_timer.daemon = True
+            self._sweep_timer.start()
+    
+    def _sweep(self):
+        with self._warm_lock:
+            self._sweep_timer = None
+        try:
+            self._reclaim_expired_sessions()
+        except RuntimeError:
+            # 线程池已关闭（进程退出中）
+            return
+        self._schedule_sweep()
+    
+    def _safe_delete_session(self, session_id: str):
+        try:
+            self._delete_session(session_id)
+        except Exception as e:
+            logger.warning(f"回收飞书Aily预热会话失败 {session_id}: {e}")
+    
+    def _acquire_session(self, skill_app_id: Optional[str] = None, deadline: Optional[Deadline] = None) -> str:
+        """优先取用该技能应用未过期的预热会话，没有则现场创建"""
+        skill_app_id = skill_app_id or self.skill_app_id
+        self._reclaim_expired_sessions()
+        with self._warm_lock:
+            pool = self._warm_sessions.get(skill_app_id)
+            if pool:
+                session_id, _ = pool.pop()
+                logger.info(f"使用飞书Aily预热会话: {session_id}")
+                return session_id
+        return self._create_session(skill_app_id, deadline)
+    
+    def prewarm(self, skill_app_id: Optional[str] = None):
+        """预热：刷新token、建立连接，并为指定技能应用预创建会话放入预热池"""
+        skill_app_id = skill_app_id or self.skill_app_id
+        self._reclaim_expired_sessions()
+        # 保证token在会话TTL内不会过期，同时完成TCP/TLS握手
+        self._get_tenant_access_token(min_ttl=FEISHU_WARM_SESSION_TTL)
+        with self._warm_lock:
+            if len(self._warm_sessions.get(skill_app_id, ())) >= FEISHU_WARM_POOL_MAX:
+                return
+        session_id = self._create_session(skill_app_id)
+        with self._warm_lock:
+            pool = self._warm_sessions.setdefault(skill_app_id, deque())
+            pool.append((session_id, time.time()))
+            overflow = []
+            while len(pool) > FEISHU_WARM_POOL_MAX:
+                overflow.append(pool.popleft()[0])
+        for extra_id in overflow:
+            self._safe_delete_session(extra_id)
+        self._schedule_sweep()
+    
+    def prewarm_async(self, skill_app_id: Optional[str] = None):
+        """在后台线程中预热，不阻塞调用方"""
+        def _run():
+            try:
+                self.prewarm(skill_app_id)
+            except Exception as e:
+                logger.warning(f"飞书Aily预热失败: {e}")
+        self._warm_executor.submit(_run)
+    
+    def warm_pool_size(self) -> int:
+        with self._warm_lock:
+            return sum(len(pool) for pool in self._warm_sessions.values())
+    
+    def _create_message(self, session_id: str, content: str, deadline: Optional[Deadline] = None) -> str:
+        """创建用户消息：幂等键在重试间复用，上游据此去重，不会重复发送消息"""
         endpoint = f"/open-apis/aily/v1/sessions/{session_id}/messages"
         import uuid
         data = {
@@ -122,7 +435,7 @@ class FeishuAilyStreamingClient:
             "idempotent_id": str(uuid.uuid4())
         }
         
-        result = self._make_api_request('POST', endpoint, data)
+        result = self._make_api_request('POST', endpoint, data, 'aily.create_message', deadline)
         message_data = result.get('message', {})
         message_id = message_data.get('id')
         
@@ -132,15 +445,16 @@ class FeishuAilyStreamingClient:
         logger.info(f"创建用户消息成功: {message_id}")
         return message_id
     
-    def _create_run(self, session_id: str) -> str:
-        """触发Bot执行"""
+    def _create_run(self, session_id: str, skill_app_id: Optional[str] = None, skill_id: Optional[str] = None,
+                    deadline: Optional[Deadline] = None) -> str:
+        """触发Bot执行（无幂等键，只在请求未被执行时重试）"""
         endpoint = f"/open-apis/aily/v1/sessions/{session_id}/runs"
         data = {
-            "app_id": self.skill_app_id,  # 使用app_id而不是skill_id
-            "skill_id": self.skill_id  # 指定技能ID可以节省技能选择时间
+            "app_id": skill_app_id or self.skill_app_id,  # 使用app_id而不是skill_id
+            "skill_id": skill_id or self.skill_id  # 指定技能ID可以节省技能选择时间
         }
         
-        result = self._make_api_request('POST', endpoint, data)
+        result = self._make_api_request('POST', endpoint, data, 'aily.create_run', deadline, idempotent=False)
         run_data = result.get('run', {})
         run_id = run_data.get('id')
         
@@ -150,98 +464,247 @@ class FeishuAilyStreamingClient:
         logger.info(f"创建Bot运行成功: {run_id}")
         return run_id
     
-    def _get_run_status(self, session_id: str, run_id: str) -> Dict[str, Any]:
-        """获取运行状态"""
+    def _cancel_run(self, session_id: str, run_id: str):
+        """取消Bot运行，停止上游继续生成并消耗额度"""
+        endpoint = f"/open-apis/aily/v1/sessions/{session_id}/runs/{run_id}/cancel"
+        self._make_api_request('POST', endpoint, {}, 'aily.cancel_run')
+        logger.info(f"已取消飞书Aily运行: {run_id}")
+    
+    def _safe_cancel_run(self, session_id: str, run_id: str):
+        try:
+            self._cancel_run(session_id, run_id)
+        except Exception as e:
+            logger.warning(f"取消飞书Aily运行失败 {run_id}: {e}")
+    
+    def _get_run_status(self, session_id: str, run_id: str, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """获取运行状态（幂等查询，支持对冲请求）"""
         endpoint = f"/open-apis/aily/v1/sessions/{session_id}/runs/{run_id}"
-        return self._make_api_request('GET', endpoint)
+        return hedged_call(lambda: self._make_api_request('GET', endpoint, operation='aily.run_status',
+                                                          deadline=deadline, guarded=False),
+                           breaker=self.breaker)
     
-    def _list_messages(self, session_id: str, with_partial: bool = True) -> Dict[str, Any]:
-        """获取消息列表"""
+    def _list_messages(self, session_id: str, with_partial: bool = True,
+                       run_id: Optional[str] = None, page_size: Optional[int] = None,
+                       deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """获取消息列表（幂等查询，支持对冲请求）
+
+        指定 run_id 时只返回该次运行产生的消息，避免随会话变长重复下载历史消息。
+        """
         endpoint = f"/open-apis/aily/v1/sessions/{session_id}/messages"
+        params = {}
         if with_partial:
-            endpoint += "?with_partial_message=true"
+            params['with_partial_message'] = 'true'
+        if run_id:
+            params['run_id'] = run_id
+        if page_size:
+            params['page_size'] = page_size
+        if params:
+            endpoint += f"?{urlencode(params)}"
         
-        return self._make_api_request('GET', endpoint)
+        return hedged_call(lambda: self._make_api_request('GET', endpoint, operation='aily.list_messages',
+                                                          deadline=deadline, guarded=False),
+                           breaker=self.breaker)
     
-    def chat_completion_stream(self, message: str, **kwargs) -> Generator[str, None, None]:
-        """流式聊天完成接口"""
+    def _open_event_stream(self, session_id: str, run_id: str,
+                           deadline: Optional[Deadline] = None) -> requests.Response:
+        """打开运行事件流，上游未返回 text/event-stream 时抛出 EventStreamUnavailable"""
+        endpoint = FEISHU_EVENT_STREAM_PATH.format(session_id=session_id, run_id=run_id)
+        read_timeout = FEISHU_EVENT_STREAM_IDLE_TIMEOUT
+        if deadline is not None:
+            read_timeout = deadline.timeout(read_timeout)
+        response = self.session.get(
+            f"{self.base_url}{endpoint}",
+            headers={'Authorization': f'Bearer {self._get_tenant_access_token()}',
+                     'Accept': 'text/event-stream'},
+            stream=True,
+            timeout=(FEISHU_TOKEN_TIMEOUT, read_timeout)
+        )
+        content_type = response.headers.get('Content-Type', '')
+        if response.status_code != 200 or not content_type.startswith('text/event-stream'):
+            response.close()
+            raise EventStreamUnavailable(response.status_code,
+                                         f"HTTP {response.status_code} {content_type or '无Content-Type'}")
+        if FEISHU_EVENT_STREAM == 'auto' and self._event_stream_supported is not True:
+            logger.info("飞书Aily运行事件流可用，流式对话将使用事件推送")
+            self._event_stream_supported = True
+        return response
+
+    def _use_event_stream(self) -> bool:
+        """本次运行是否先尝试事件流：支持或未知时尝试；判定不支持后每隔 EVENT_STREAM_REPROBE_INTERVAL 秒重试一次"""
+        supported = self._event_stream_supported
+        if supported is False and FEISHU_EVENT_STREAM == 'auto' \
+                and time.time() - self._event_stream_checked_at >= EVENT_STREAM_REPROBE_INTERVAL:
+            self._event_stream_checked_at = time.time()
+            return True
+        return supported is not False
+
+    def _event_stream_unavailable(self, error: EventStreamUnavailable):
+        """记录真实运行的事件流请求结果：上游明确不支持时后续运行直接轮询，其余错误只影响本次运行"""
+        if FEISHU_EVENT_STREAM != 'auto' or not error.unsupported:
+            logger.warning(f"飞书Aily事件流不可用，本次改为轮询: {error}")
+            return
+        logger.info(f"飞书Aily未提供运行事件流，改用轮询，{EVENT_STREAM_REPROBE_INTERVAL}秒后再尝试: {error}")
+        self._event_stream_supported = False
+        self._event_stream_checked_at = time.time()
+
+    def _stream_run_events(self, session_id: str, run_id: str, reader: AilyMessageReader,
+                           cancel_event: Optional[threading.Event], deadline: Deadline) -> Generator[str, None, None]:
+        """消费运行事件流，输出Bot回复的内容变化；运行结束（reader.finished）、取消或超时时返回
+
+        事件 data 为JSON：含 message（与消息列表中的消息结构相同的快照）或 run（含 status）；
+        事件名为 error 时 data 为飞书错误结构。
+        """
+        with upstream_span('aily.run_events'):
+            response = self._open_event_stream(session_id, run_id, deadline)
+        add_callback = getattr(cancel_event, 'add_callback', None)
+        if add_callback is not None:
+            # 取消时关闭连接，打断阻塞中的读取
+            add_callback(response.close)
+        start_time = time.time()
+        try:
+            for event, data in iter_sse_events(response):
+                payload = json.loads(data)
+                if event == 'error':
+                    raise AilyAPIError(payload.get('code'), f"事件流返回错误: {payload}")
+                if 'run' in payload:
+                    reader.run_status = payload['run'].get('status', '')
+                if 'message' in payload:
+                    delta = reader.apply([payload['message']])
+                    if delta:
+                        if sample_log(logger, 'aily.chunk'):
+                            logger.debug(f"飞书Aily推送内容: {delta}")
+                        yield delta
+                if reader.finished:
+                    logger.info(f"飞书Aily事件流结束，运行状态: {reader.run_status or '消息已完成'}")
+                    return
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if deadline.expired or time.time() - start_time >= self.max_polling_time:
+                    logger.warning("飞书Aily事件流超过截止时间，停止读取")
+                    return
+        finally:
+            response.close()
+
+    def chat_completion_stream(self, message: str, cancel_event: Optional[threading.Event] = None,
+                               skill_app_id: Optional[str] = None, skill_id: Optional[str] = None,
+                               deadline: Optional[Deadline] = None, **kwargs) -> Generator[str, None, None]:
+        """流式聊天完成接口
+
+        熔断器打开且尚未输出任何内容时抛出 CircuitOpenError，便于调用方故障转移。
+        cancel_event 被设置时（如客户端已断开）立即停止轮询；未正常结束的运行会在上游取消。
+        skill_app_id/skill_id 按人设指定Aily技能，未指定时使用全局配置。
+        deadline 为请求截止时间：各次接口调用的超时与重试等待不会超过剩余时间，到期后停止轮询。
+        """
+        deadline = deadline or Deadline()
+        emitted = False
+        session_id = run_id = None
+        run_finished = False
         try:
             logger.info(f"开始飞书Aily流式对话: {message}")
             
-            # 1. 创建会话
-            session_id = self._create_session()
+            # 1. 获取会话（优先使用预热会话）
+            session_id = self._acquire_session(skill_app_id, deadline)
             
             # 2. 创建用户消息
-            user_message_id = self._create_message(session_id, message)
+            user_message_id = self._create_message(session_id, message, deadline)
             
             # 3. 触发Bot执行
-            run_id = self._create_run(session_id)
+            run_id = self._create_run(session_id, skill_app_id, skill_id, deadline)
             
-            # 4. 轮询获取流式输出
             start_time = time.time()
-            last_content = ""
+            reader = AilyMessageReader(self, session_id, run_id, known_message_ids={user_message_id},
+                                       deadline=deadline)
+            
+            # 4. 上游提供事件流时按推送增量输出；不可用或中途断开时由下面的轮询接着读取
+            if self._use_event_stream():
+                try:
+                    for delta in self._stream_run_events(session_id, run_id, reader, cancel_event, deadline):
+                        emitted = True
+                        yield delta
+                    run_finished = reader.finished
+                except CircuitOpenError:
+                    raise
+                except DeadlineExceeded:
+                    # 下面的轮询循环随即因截止时间结束
+                    logger.warning("飞书Aily事件流超过请求截止时间")
+                except EventStreamUnavailable as e:
+                    self._event_stream_unavailable(e)
+                except Exception as e:
+                    if cancel_event is None or not cancel_event.is_set():
+                        logger.warning(f"飞书Aily事件流中断，改为轮询: {e}")
             
-            while time.time() - start_time < self.max_polling_time:
+            # 5. 轮询获取流式输出（按运行与消息ID增量读取）
+            consecutive_failures = 0
+            
+            while not run_finished and time.time() - start_time < self.max_polling_time:
+                if cancel_event is not None and cancel_event.is_set():
+                    logger.info("飞书Aily流式对话已取消，停止轮询")
+                    break
+                if deadline.expired:
+                    logger.warning("飞书Aily流式对话超过请求截止时间，停止轮询")
+                    break
                 try:
                     # 获取运行状态
-                    run_status = self._get_run_status(session_id, run_id)
+                    run_status = self._get_run_status(session_id, run_id, deadline)
                     status = run_status.get('run', {}).get('status', '')
                     
-                    # 获取消息列表（包含部分消息）
-                    messages_data = self._list_messages(session_id, with_partial=True)
-                    messages = messages_data.get('messages', [])
-                    
-                    # 查找Bot的回复消息
-                    bot_message = None
-                    for msg in messages:
-                        sender = msg.get('sender', {})
-                        if (sender.get('sender_type') == 'ASSISTANT' and 
-                            msg.get('id') != user_message_id):
-                            bot_message = msg
-                            break
+                    # 增量获取Bot回复（追加输出新增部分，改写时输出整段替换）
+                    delta = reader.poll()
+                    if delta:
+                        if sample_log(logger, 'aily.chunk'):
+                            logger.debug(f"飞书Aily新增内容: {delta}")
+                        emitted = True
+                        yield delta
                     
-                    if bot_message:
-                        current_content = bot_message.get('content', '')
-                        
-                        # 如果内容有更新，输出新增部分
-                        if len(current_content) > len(last_content):
-                            new_content = current_content[len(last_content):]
-                            logger.debug(f"飞书Aily新增内容: {new_content}")
-                            yield new_content
-                            last_content = current_content
-                        
-                        # 如果消息状态已完成且内容不再变化，提前结束
-                        elif (bot_message.get('status') == 'COMPLETED' and 
-                              current_content and 
-                              len(current_content) == len(last_content)):
-                            logger.info("飞书Aily消息已完成且内容稳定，提前结束")
-                            break
+                    # 如果Bot消息已完成且内容不再变化，提前结束
+                    elif reader.completed and reader.content:
+                        logger.info("飞书Aily Bot消息已完成且内容稳定，结束轮询")
+                        run_finished = True
+                        break
                     
                     # 检查是否完成 - 修复状态判断（使用大写）
                     if status in ['COMPLETED', 'FAILED', 'CANCELLED']:
                         logger.info(f"飞书Aily对话完成，状态: {status}")
+                        run_finished = True
                         break
-                    
-                    # 额外检查：如果Bot消息已完成且内容不再变化，也应该结束
-                    if (bot_message and 
-                        bot_message.get('status') == 'COMPLETED' and 
-                        len(current_content) == len(last_content) and 
-                        current_content):  # 确保有内容
-                        logger.info("飞书Aily Bot消息已完成且内容稳定，结束轮询")
-                        break
+                    consecutive_failures = 0
                         
+                except CircuitOpenError:
+                    # 上游已熔断，继续轮询只会拉长尾延迟
+                    raise
+                except DeadlineExceeded:
+                    logger.warning("飞书Aily流式对话超过请求截止时间，停止轮询")
+                    break
                 except Exception as e:
-                    logger.error(f"轮询过程中出错: {e}")
-                    # 继续轮询，不中断
+                    # 单次调用已在 retry_call 中退避重试；不可重试的错误或连续失败过多时中止，不再空等到超时
+                    consecutive_failures += 1
+                    if not is_retryable(e) or consecutive_failures >= FEISHU_POLL_MAX_FAILURES:
+                        raise
+                    logger.error(f"轮询过程中出错（连续第{consecutive_failures}次）: {e}")
                 
-                # 等待下次轮询
-                time.sleep(self.polling_interval)
+                # 等待下次轮询，取消时立即唤醒
+                if cancel_event is not None:
+                    cancel_event.wait(self.polling_interval)
+                else:
+                    time.sleep(self.polling_interval)
             
             logger.info("飞书Aily流式对话结束")
             
+        except CircuitOpenError as e:
+            logger.error(f"飞书Aily流式对话中止: {e}")
+            if not emitted:
+                raise
+            yield f"对话出现错误: {str(e)}"
         except Exception as e:
             logger.error(f"飞书Aily流式对话失败: {e}")
+            if not emitted and self.breaker.is_open():
+                # 本次失败触发了熔断，交由调用方故障转移
+                raise CircuitOpenError(self.breaker.name, self.breaker.recovery_timeout) from e
             yield f"对话出现错误: {str(e)}"
+        finally:
+            # 取消、超时或调用方提前关闭生成器时，运行仍在上游执行，后台取消之
+            if run_id and not run_finished:
+                self._warm_executor.submit(self._safe_cancel_run, session_id, run_id)
     
     def chat_completion(self, message: str, **kwargs) -> str:
         """非流式聊天完成接口"""
@@ -251,10 +714,16 @@ class FeishuAilyStreamingClient:
             # 收集所有流式输出
             full_response = ""
             for chunk in self.chat_completion_stream(message, **kwargs):
-                full_response += chunk
+                if isinstance(chunk, AilyContentReplace):
+                    full_response = str(chunk)
+                else:
+                    full_response += chunk
             
             return full_response
             
+        except CircuitOpenError:
+            # 熔断且尚未输出任何内容，交由调用方故障转移
+            raise
         except Exception as e:
             logger.error(f"飞书Aily非流式对话失败: {e}")
             return f"对话出现错误: {str(e)}"
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+健康检查
+上游依赖探测（token接口、LLM、TTS、ASR）的结果缓存 probe_interval 秒，过期后在后台刷新，
+读取方从不等待上游；探测结果写入共享缓存，多worker共用一份结果。
+就绪判断只看本进程负载（进行中的流、队列深度）与熔断状态，负载均衡器频繁探测也不会产生上游调用
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+import requests
+from cache_backend import get_cache
+from features import get_settings
+from http_session import create_http_session
+
+logger = logging.getLogger(__name__)
+
+
+class SharedExecutor:
+    """按需创建的共享线程池
+
+    首次提交任务时才创建线程（线程数在创建时从设置读取），只服务部分接口的worker
+    不会为用不到的功能启动线程；watch 为 True 时登记到 health_monitor 报告排队任务数。
+    """
+
+    def __init__(self, name: str, max_workers: Union[int, Callable[[], int]], thread_name_prefix: str,
+                 watch: bool = True):
+        self.name = name
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        if watch:
+            health_monitor.watch_executor(name, self)
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def get(self) -> ThreadPoolExecutor:
+        executor = self._executor
+        if executor is not None:
+            return executor
+        with self._lock:
+            if self._executor is None:
+                workers = self.max_workers() if callable(self.max_workers) else self.max_workers
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.thread_name_prefix)
+                logger.debug(f"线程池 {self.name} 已创建（{workers} 个线程）")
+            return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        return self.get().submit(fn, *args, **kwargs)
+
+    def queue_depth(self) -> int:
+        executor = self._executor
+        # ThreadPoolExecutor 未公开队列长度，读取其内部工作队列
+        return executor._work_queue.qsize() if executor is not None else 0
+
+
+_probe_executor = SharedExecutor('health_probe', 4, 'health-probe', watch=False)
+_probe_session = None
+_probe_session_lock = threading.Lock()
+
+
+def http_reachable(url: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """轻量可达性探测：HEAD 请求目标地址，只要服务端有非5xx应答即视为可达（不消耗模型调用额度）"""
+    global _probe_session
+    if timeout is None:
+        timeout = get_settings().health.probe_timeout
+    with _probe_session_lock:
+        if _probe_session is None:
+            _probe_session = create_http_session(pool_maxsize=4, name='health')
+    response = _probe_session.head(url, timeout=timeout, allow_redirects=False)
+    if response.status_code >= 500:
+        raise requests.HTTPError(f'HTTP {response.status_code}', response=response)
+    return {'http_status': response.status_code}
+
+
+class DependencyProbe:
+    """单个上游依赖的探测
+
+    check 不带参数，失败时抛出异常，可返回附加信息字典。结果过期后由后台线程刷新，
+    同一时刻只有一个刷新在进行；其他worker写入共享缓存的较新结果直接采用，不重复探测。
+    """
+
+    def __init__(self, name: str, check: Callable[[], Optional[Dict[str, Any]]],
+                 interval: Optional[float] = None):
+        self.name = name
+        self.check = check
+        self.interval = max(1.0, interval if interval is not None else get_settings().health.probe_interval)
+        self.cache = get_cache('health')
+        self._result: Dict[str, Any] = {'status': 'unknown', 'checked_at': 0}
+        self._running = False
+        self._lock = threading.Lock()
+
+    def _fresh(self, result: Optional[Dict[str, Any]]) -> bool:
+        return bool(result) and time.time() - result.get('checked_at', 0) < self.interval
+
+    def run(self) -> Dict[str, Any]:
+        """同步执行一次探测并缓存结果"""
+        started = time.time()
+        result = {'status': 'ok', 'checked_at': started}
+        try:
+            detail = self.check()
+            if detail:
+                result.update(detail)
+        except Exception as e:
+            result['status'] = 'fail'
+            result['error'] = str(e)[:200]
+            logger.warning(f"依赖探测失败 {self.name}: {e}")
+        result['latency_ms'] = round((time.time() - started) * 1000, 1)
+        with self._lock:
+            self._result = result
+            self._running = False
+        self.cache.set_json(self.name, result, ttl=self.interval * 4)
+        return result
+
+    def result(self) -> Dict[str, Any]:
+        """返回缓存的探测结果；结果过期时触发一次后台刷新，本次仍返回旧结果"""
+        with self._lock:
+            result = self._result
+            if self._fresh(result) or self._running:
+                return self._view(result)
+            shared = self.cache.get_json(self.name)
+            if self._fresh(shared):
+                self._result = shared
+                return self._view(shared)
+            self._running = True
+        try:
+            _probe_executor.submit(self.run)
+        except RuntimeError:
+            with self._lock:
+                self._running = False
+        return self._view(result)
+
+    def _view(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        view = dict(result)
+        checked_at = view.pop('checked_at', 0)
+        view['age'] = round(time.time() - checked_at, 1) if checked_at else None
+        view['stale'] = not self._fresh(result)
+        return view
+
+
+class HealthMonitor:
+    """依赖探测与线程池队列的登记处"""
+
+    def __init__(self):
+        self._probes: Dict[str, DependencyProbe] = {}
+        self._executors: Dict[str, Union[ThreadPoolExecutor, SharedExecutor]] = {}
+        self._lock = threading.Lock()
+
+    def add_probe(self, name: str, check: Callable[[], Optional[Dict[str, Any]]]):
+        with self._lock:
+            self._probes[name] = DependencyProbe(name, check)
+
+    def watch_executor(self, name: str, executor: Union[ThreadPoolExecutor, SharedExecutor]):
+        """登记共享线程池，就绪检查与健康详情中报告其排队任务数"""
+        with self._lock:
+            self._executors[name] = executor
+
+    def probes(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            probes = list(self._probes.values())
+        return {probe.name: probe.result() for probe in probes}
+
+    def queue_depths(self) -> Dict[str, int]:
+        with self._lock:
+            executors = dict(self._executors)
+        return {name: executor.queue_depth() if isinstance(executor, SharedExecutor) else executor._work_queue.qsize()
+                for name, executor in executors.items()}
+
+
+health_monitor = HealthMonitor()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游HTTP录制与回放
+HTTP_CASSETTE_MODE=record 时，各上游客户端会话的每次HTTP往返（含流式响应的每个分块及其到达时间）
+脱敏后追加写入回放记录文件（JSONL，每行一次往返）；replay 时不访问网络，按记录返回响应，
+响应头与各分块按录制时的时间间隔（除以 HTTP_REPLAY_SPEED）到达，用于离线、可重复的性能基准
+"""
+
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from config import *
+from logging_setup import redact
+
+logger = logging.getLogger(__name__)
+
+# 录制时掩码的请求头
+SENSITIVE_HEADERS = {'authorization', 'x-api-access-key', 'x-api-app-key', 'x-api-app-id', 'cookie'}
+# 录制时不保存的响应头：分块已是解压后的内容，回放时长度与编码由分块决定
+DROPPED_RESPONSE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'set-cookie', 'connection'}
+# 记录中保存的请求体最大长度（仅供查看，匹配使用完整请求体的摘要）
+MAX_RECORDED_BODY = 2000
+
+
+def _normalize_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return f'{parts.scheme}://{parts.netloc}{parts.path}' + (f'?{query}' if query else '')
+
+
+def _sanitize_body(body) -> str:
+    if body is None:
+        return ''
+    if isinstance(body, bytes):
+        try:
+            body = body.decode('utf-8')
+        except UnicodeDecodeError:
+            return f'<{len(body)} bytes>'
+    return redact(str(body))
+
+
+def _body_digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def _encode_chunk(offset: float, chunk: bytes) -> Dict[str, Any]:
+    try:
+        return {'t': round(offset, 4), 'text': redact(chunk.decode('utf-8'))}
+    except UnicodeDecodeError:
+        # 二进制或在多字节字符中间截断的分块
+        return {'t': round(offset, 4), 'b64': base64.b64encode(chunk).decode('ascii')}
+
+
+def _decode_chunk(chunk: Dict[str, Any]) -> bytes:
+    if 'text' in chunk:
+        return chunk['text'].encode('utf-8')
+    return base64.b64decode(chunk['b64'])
+
+
+class Cassette:
+    """回放记录文件
+
+    回放时优先按 (方法, URL, 请求体摘要) 匹配尚未使用的记录，其次按 (方法, URL) 顺序匹配；
+    同一URL的记录用完后重复最后一条（轮询次数随回放速度变化时，保持最终状态）。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._exchanges: List[Dict[str, Any]] = []
+        self._by_body: Dict[str, List[int]] = {}
+        self._by_url: Dict[str, List[int]] = {}
+        self._used: set = set()
+        self._file = None
+        self.recorded = 0
+        self.misses = 0
+
+    def load(self) -> 'Cassette':
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    self._index(json.loads(line))
+        logger.info(f"已加载回放记录 {self.path}：{len(self._exchanges)} 次往返")
+        return self
+
+    def _index(self, exchange: Dict[str, Any]):
+        index = len(self._exchanges)
+        self._exchanges.append(exchange)
+        url_key = f"{exchange['method']} {exchange['url']}"
+        self._by_url.setdefault(url_key, []).append(index)
+        self._by_body.setdefault(f"{url_key} {exchange.get('body_sha', '')}", []).append(index)
+
+    def record(self, exchange: Dict[str, Any]):
+        line = json.dumps(exchange, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'w', encoding='utf-8')
+                logger.info(f"开始录制上游HTTP往返到 {self.path}")
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.recorded += 1
+
+    def match(self, method: str, url: str, body_sha: str) -> Optional[Dict[str, Any]]:
+        url_key = f'{method} {url}'
+        with self._lock:
+            for candidates in (self._by_body.get(f'{url_key} {body_sha}', []), self._by_url.get(url_key, [])):
+                for index in candidates:
+                    if index not in self._used:
+                        self._used.add(index)
+                        return self._exchanges[index]
+            candidates = self._by_url.get(url_key)
+            if candidates:
+                return self._exchanges[candidates[-1]]
+            self.misses += 1
+            return None
+
+    def rewind(self):
+        """重新从头回放（基准的每轮开始时调用）"""
+        with self._lock:
+            self._used.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'path': self.path, 'exchanges': len(self._exchanges), 'used': len(self._used),
+                    'recorded': self.recorded, 'misses': self.misses}
+
+
+class _RecordingBody:
+    """包装 urllib3 响应体：读取的同时记录每个分块及其相对响应头的到达时间，读完或关闭时写入记录"""
+
+    def __init__(self, raw, exchange: Dict[str, Any], cassette: Cassette):
+        self._raw = raw
+        self._exchange = exchange
+        self._cassette = cassette
+        self._started = time.perf_counter()
+        self._done = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def _capture(self, chunk: bytes):
+        if chunk and not self._done:
+            self._exchange['chunks'].append(_encode_chunk(time.perf_counter() - self._started, chunk))
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self._cassette.record(self._exchange)
+
+    def stream(self, amt: int = 2 ** 16, decode_content: Optional[bool] = None) -> Iterator[bytes]:
+        for chunk in self._raw.stream(amt, decode_content=True):
+            self._capture(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt: Optional[int] = None, decode_content: Optional[bool] = None, **kwargs) -> bytes:
+        data = self._raw.read(amt, decode_content=True, **kwargs)
+        if data:
+            self._capture(data)
+        if not data or amt is None:
+            self._finish()
+        return data
+
+    def close(self):
+        self._finish()
+        self._raw.close()
+
+
+class RecordingAdapter(HTTPAdapter):
+    """正常访问上游，同时把脱敏后的往返写入回放记录"""
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        response = super().send(request, **kwargs)
+        body = _sanitize_body(request.body)
+        exchange = {
+            'method': request.method,
+            'url': _normalize_url(request.url),
+            'request_headers': {k: ('***' if k.lower() in SENSITIVE_HEADERS else v)
+                                for k, v in request.headers.items()},
+            'body': body[:MAX_RECORDED_BODY],
+            'body_sha': _body_digest(body),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {k: v for k, v in response.headers.items() if k.lower() not in DROPPED_RESPONSE_HEADERS},
+            'elapsed': round(time.perf_counter() - started, 4),
+            'chunks': [],
+        }
+        response.raw = _RecordingBody(response.raw, exchange, self.cassette)
+        return response
+
+
+class _ReplayBody:
+    """按录制时间间隔产出分块的响应体；关闭后立即停止（与真实连接被取消时一致）"""
+
+    def __init__(self, chunks: List[Dict[str, Any]], speed: float):
+        self._chunks = chunks
+        self._speed = speed
+        self._closed = threading.Event()
+        self._started = time.perf_counter()
+        self._position = 0
+
+    def _wait_for(self, offset: float) -> bool:
+        if self._speed > 0:
+            delay = self._started + offset / self._speed - time.perf_counter()
+            if delay > 0:
+                self._closed.wait(delay)
+        return not self._closed.is_set()
+
+    def stream(self, amt: int = 2 ** 16, decode_content: Optional[bool] = None) -> Iterator[bytes]:
+        while self._position < len(self._chunks):
+            chunk = self._chunks[self._position]
+            if not self._wait_for(chunk['t']):
+                return
+            self._position += 1
+            yield _decode_chunk(chunk)
+
+    def read(self, amt: Optional[int] = None, decode_content: Optional[bool] = None, **kwargs) -> bytes:
+        return b''.join(self.stream())
+
+    def close(self):
+        self._closed.set()
+
+    def release_conn(self):
+        pass
+
+
+class ReplayAdapter(BaseAdapter):
+    """不访问网络，按回放记录返回响应；没有匹配记录时抛出 ConnectionError，与上游不可达时一致"""
+
+    def __init__(self, cassette: Cassette, speed: float = HTTP_REPLAY_SPEED):
+        super().__init__()
+        self.cassette = cassette
+        self.speed = speed
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = _normalize_url(request.url)
+        exchange = self.cassette.match(request.method, url, _body_digest(_sanitize_body(request.body)))
+        if exchange is None:
+            raise requests.ConnectionError(f'回放记录中没有匹配的请求: {request.method} {url}', request=request)
+        if self.speed > 0:
+            time.sleep(exchange['elapsed'] / self.speed)
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.reason = exchange.get('reason')
+        response.headers = CaseInsensitiveDict(exchange.get('headers') or {})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _ReplayBody(exchange.get('chunks') or [], self.speed)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Optional[Cassette]:
+    """当前进程的回放记录，HTTP_CASSETTE_MODE=off 时返回None"""
+    global _cassette
+    if HTTP_CASSETTE_MODE not in ('record', 'replay'):
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(HTTP_CASSETTE_PATH)
+            if HTTP_CASSETTE_MODE == 'replay':
+                _cassette.load()
+        return _cassette
+
+
+def create_adapter(pool_maxsize: int) -> BaseAdapter:
+    """按 HTTP_CASSETTE_MODE 创建会话使用的适配器"""
+    cassette = get_cassette()
+    if cassette is not None and HTTP_CASSETTE_MODE == 'replay':
+        return ReplayAdapter(cassette)
+    if cassette is not None:
+        return RecordingAdapter(cassette, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=pool_maxsize)
+    return HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=pool_maxsize)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享HTTP会话
+为各上游客户端提供带连接池的 requests.Session，复用TCP/TLS连接；
+创建的会话按名称登记，健康检查据此报告连接池占用情况。
+HTTP_CASSETTE_MODE 为 record/replay 时会话改用录制/回放适配器（见 http_cassette）
+"""
+
+import threading
+import weakref
+from typing import Any, Dict, List, Tuple
+import requests
+from config import *
+from http_cassette import create_adapter
+
+_sessions: List[Tuple[str, 'weakref.ref[requests.Session]']] = []
+_sessions_lock = threading.Lock()
+
+
+def create_http_session(pool_maxsize: int = HTTP_POOL_MAXSIZE, name: str = 'default') -> requests.Session:
+    """创建带keep-alive连接池的HTTP会话"""
+    session = requests.Session()
+    adapter = create_adapter(pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    with _sessions_lock:
+        _sessions[:] = [(n, ref) for n, ref in _sessions if ref() is not None]
+        _sessions.append((name, weakref.ref(session)))
+    return session
+
+
+def _pool_usage(session: requests.Session) -> Dict[str, Any]:
+    hosts, in_use, capacity = 0, 0, 0
+    for adapter in {id(a): a for a in session.adapters.values()}.values():
+        pools = getattr(getattr(adapter, 'poolmanager', None), 'pools', None)
+        if pools is None:
+            continue
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            # 连接池队列中是空闲连接与尚未创建的空位，其余即被请求占用
+            hosts += 1
+            capacity += pool.pool.maxsize
+            in_use += max(0, pool.pool.maxsize - pool.pool.qsize())
+    return {'hosts': hosts, 'in_use': in_use, 'capacity': capacity}
+
+
+def pool_snapshots() -> Dict[str, Dict[str, Any]]:
+    """各会话连接池的占用情况：已连接主机数、占用连接数、容量与占用率（同名会话合并统计）"""
+    with _sessions_lock:
+        sessions = [(name, ref()) for name, ref in _sessions]
+    result: Dict[str, Dict[str, Any]] = {}
+    for name, session in sessions:
+        if session is None:
+            continue
+        usage = _pool_usage(session)
+        merged = result.setdefault(name, {'sessions': 0, 'hosts': 0, 'in_use': 0, 'capacity': 0})
+        merged['sessions'] += 1
+        for field in ('hosts', 'in_use', 'capacity'):
+            merged[field] += usage[field]
+    for merged in result.values():
+        merged['saturation'] = round(merged['in_use'] / merged['capacity'], 3) if merged['capacity'] else 0.0
+    return result
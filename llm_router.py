@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM提供商注册表与路由
+常驻各提供商客户端实例，按请求/会话选择提供商，可按负载或延迟自动路由
+"""
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# 延迟路由时，尚无延迟数据的提供商至少间隔多久探测一次（秒）
+LATENCY_EXPLORE_INTERVAL = 30
+
+
+class ProviderStats:
+    """单个提供商的在途请求数与首包延迟（指数滑动平均）"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.total_requests = 0
+        self.ewma_latency = None
+
+    def observe_latency(self, latency: float):
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            alpha = LLM_ROUTER_EWMA_ALPHA
+            self.ewma_latency = alpha * latency + (1 - alpha) * self.ewma_latency
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'in_flight': self.in_flight,
+            'total_requests': self.total_requests,
+            'ewma_latency': round(self.ewma_latency, 3) if self.ewma_latency is not None else None
+        }
+
+
+class LLMProviderRegistry:
+    """LLM提供商注册表
+
+    每个提供商只创建一个长期存活的客户端实例（启动时预热），切换提供商不再重建客户端，
+    也不会影响其他用户正在进行的流式请求。
+    """
+
+    def __init__(self, default_provider: str = LLM_PROVIDER, strategy: str = LLM_ROUTING_STRATEGY):
+        self.default_provider = default_provider
+        self.strategy = strategy
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._clients: Dict[str, Any] = {}
+        self._stats: Dict[str, ProviderStats] = {}
+        self._conversation_providers: "OrderedDict[str, str]" = OrderedDict()
+        self._explored_at = 0.0
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """注册提供商客户端工厂"""
+        self._factories[name] = factory
+        self._stats[name] = ProviderStats()
+
+    def providers(self):
+        return list(self._factories.keys())
+
+    def has_provider(self, name: Optional[str]) -> bool:
+        return bool(name) and name in self._factories
+
+    def warm_up(self):
+        """预先创建所有提供商客户端，失败的提供商记录日志后跳过"""
+        for name in self._factories:
+            try:
+                self.get(name)
+                logger.info(f"LLM提供商 {name} 预热完成")
+            except Exception as e:
+                logger.error(f"LLM提供商 {name} 预热失败: {e}")
+
+    def get(self, name: str) -> Any:
+        """获取提供商的常驻客户端实例"""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                client = self._factories[name]()
+                self._clients[name] = client
+            return client
+
+    def set_default(self, name: str):
+        """设置默认提供商，仅影响之后未指定提供商的请求"""
+        self.default_provider = name
+
+    def _is_available(self, name: str) -> bool:
+        breaker = getattr(self.get(name), 'breaker', None)
+        return breaker is None or not breaker.is_open()
+
+    def _auto_route(self) -> str:
+        candidates = [name for name in self._factories if self._is_available(name)]
+        if not candidates:
+            return self.default_provider
+        if self.strategy == 'least_loaded':
+            return min(candidates, key=lambda n: (self._stats[n].in_flight, n != self.default_provider))
+        if self.strategy == 'latency':
+            return self._latency_route(candidates)
+        return self.default_provider
+
+    def _latency_route(self, candidates) -> str:
+        """选择首包延迟最低的提供商；尚无延迟数据的视为未知而排在最后，每隔 LATENCY_EXPLORE_INTERVAL 秒探测一次"""
+        known = [n for n in candidates if self._stats[n].ewma_latency is not None]
+        unknown = [n for n in candidates if self._stats[n].ewma_latency is None]
+        if unknown:
+            with self._lock:
+                explore = not known or time.time() - self._explored_at >= LATENCY_EXPLORE_INTERVAL
+                if explore:
+                    self._explored_at = time.time()
+            if explore:
+                return min(unknown, key=lambda n: n != self.default_provider)
+        return min(known, key=lambda n: (self._stats[n].ewma_latency, n != self.default_provider))
+
+    def route(self, provider: Optional[str] = None, conversation_id: Optional[str] = None) -> Tuple[str, Any]:
+        """为本次请求选择提供商
+
+        优先级：请求显式指定 > 会话已绑定的提供商 > 路由策略（default/least_loaded/latency）
+        返回 (提供商名称, 客户端实例)
+        """
+        name = provider if self.has_provider(provider) else None
+        if name is None and conversation_id:
+            with self._lock:
+                name = self._conversation_providers.get(conversation_id)
+        if name is None:
+            name = self._auto_route()
+        if conversation_id:
+            with self._lock:
+                self._conversation_providers[conversation_id] = name
+                self._conversation_providers.move_to_end(conversation_id)
+                while len(self._conversation_providers) > LLM_CONVERSATION_PIN_MAX:
+                    self._conversation_providers.popitem(last=False)
+        return name, self.get(name)
+
+    def failover(self, name: str) -> Optional[Tuple[str, Any]]:
+        """返回可用的备用提供商，没有可用备份时返回None"""
+        for other in self._factories:
+            if other != name and self._is_available(other):
+                return other, self.get(other)
+        return None
+
+    def begin(self, name: str):
+        """记录一次请求开始"""
+        with self._lock:
+            stats = self._stats[name]
+            stats.in_flight += 1
+            stats.total_requests += 1
+
+    def end(self, name: str, first_chunk_latency: Optional[float] = None):
+        """记录一次请求结束及其首包延迟"""
+        with self._lock:
+            stats = self._stats[name]
+            stats.in_flight = max(0, stats.in_flight - 1)
+            if first_chunk_latency is not None:
+                stats.observe_latency(first_chunk_latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'default_provider': self.default_provider,
+                'strategy': self.strategy,
+                'providers': {name: stats.to_dict() for name, stats in self._stats.items()}
+            }
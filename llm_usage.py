@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成参数与用量统计
+按请求/路由选择生成参数档位（如语音模式限制 max_tokens），
+汇总上游返回的token用量并按会话、提供商核算费用与延迟
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# 内置档位：default 为文本聊天，voice 为语音对话（回答更短，首字与TTS更快）
+BUILTIN_PROFILES: Dict[str, Dict[str, Any]] = {
+    'default': {'temperature': DEFAULT_TEMPERATURE, 'max_tokens': DEFAULT_MAX_TOKENS},
+    'voice': {'temperature': VOICE_TEMPERATURE, 'max_tokens': VOICE_MAX_TOKENS},
+}
+
+# 请求与自定义档位可设置参数的取值范围
+PARAM_LIMITS = {
+    'temperature': (0.0, 2.0, float),
+    'max_tokens': (1, DEFAULT_MAX_TOKENS, int),
+    'top_p': (0.01, 1.0, float),
+}
+
+
+def clamp_param(key: str, value: Any) -> Any:
+    """按 PARAM_LIMITS 转换并限定参数范围，无法转换时抛出 ValueError"""
+    low, high, cast = PARAM_LIMITS[key]
+    if isinstance(value, bool):
+        raise ValueError(f'{key} 不能为布尔值')
+    try:
+        return min(max(cast(value), low), high)
+    except TypeError as e:
+        raise ValueError(f'{key} 取值无效: {value!r}') from e
+
+
+def load_profiles(spec: str = GENERATION_PROFILES) -> Dict[str, Dict[str, Any]]:
+    """合并内置档位与 GENERATION_PROFILES（JSON对象：档位名 -> 参数）中的自定义档位
+
+    配置格式错误时记录日志并只使用内置档位；参数超出 PARAM_LIMITS 时取边界值，无效参数忽略。
+    """
+    profiles = {name: dict(params) for name, params in BUILTIN_PROFILES.items()}
+    if not spec:
+        return profiles
+    try:
+        custom = json.loads(spec)
+    except json.JSONDecodeError as e:
+        logger.error(f"GENERATION_PROFILES 解析失败，仅使用内置档位: {e}")
+        return profiles
+    if not isinstance(custom, dict):
+        logger.error(f"GENERATION_PROFILES 应为JSON对象，实际为 {type(custom).__name__}，仅使用内置档位")
+        return profiles
+    for name, params in custom.items():
+        if not isinstance(params, dict):
+            logger.error(f"GENERATION_PROFILES 档位 {name} 应为JSON对象，已忽略")
+            continue
+        profile = profiles.setdefault(name, dict(BUILTIN_PROFILES['default']))
+        for key, value in params.items():
+            if key not in PARAM_LIMITS:
+                logger.warning(f"GENERATION_PROFILES 档位 {name} 的参数 {key} 不支持，已忽略")
+                continue
+            try:
+                clamped = clamp_param(key, value)
+            except ValueError as e:
+                logger.warning(f"GENERATION_PROFILES 档位 {name} 的参数已忽略: {e}")
+                continue
+            if clamped != value:
+                logger.warning(f"GENERATION_PROFILES 档位 {name} 的 {key}={value} 超出范围，改为 {clamped}")
+            profile[key] = clamped
+    return profiles
+
+
+PROFILES = load_profiles()
+
+
+def resolve_generation_params(profile: Optional[str], input_mode: str = 'text',
+                              overrides: Optional[Dict[str, Any]] = None,
+                              limits: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """确定本次请求的生成参数
+
+    优先级：请求中显式的 temperature/max_tokens/top_p > 人设的 temperature > 请求指定的档位
+    > 按输入方式（语音走 voice 档位）> default。
+    limits 为人设级参数：temperature 替换档位默认值，max_tokens 为上限（请求参数同样受其约束）。
+    返回值附带 profile 字段，便于记录与统计。
+    """
+    name = profile if profile in PROFILES else ('voice' if input_mode == 'voice' else 'default')
+    params = dict(PROFILES[name])
+    limits = limits or {}
+    if limits.get('temperature') is not None:
+        params['temperature'] = limits['temperature']
+    for key, value in (overrides or {}).items():
+        if key not in PARAM_LIMITS or value is None:
+            continue
+        try:
+            params[key] = clamp_param(key, value)
+        except ValueError:
+            continue
+    if limits.get('max_tokens'):
+        params['max_tokens'] = min(params['max_tokens'], limits['max_tokens'])
+    params['profile'] = name
+    return params
+
+
+def estimate_cost(prompt_tokens: int, completion_tokens: int) -> float:
+    """按 config.py 中的单价估算费用（每千token）"""
+    return (prompt_tokens * LLM_PRICE_INPUT_PER_1K + completion_tokens * LLM_PRICE_OUTPUT_PER_1K) / 1000
+
+
+class UsageAggregate:
+    """一组请求的用量与延迟累计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.requests_with_usage = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.first_chunk_seconds = 0.0
+        self.total_seconds = 0.0
+        self.last_seen = time.time()
+
+    def add(self, usage: Optional[Dict[str, int]], first_chunk_latency: Optional[float], total_latency: float):
+        self.requests += 1
+        self.total_seconds += total_latency
+        self.first_chunk_seconds += first_chunk_latency or 0.0
+        self.last_seen = time.time()
+        if usage:
+            prompt = int(usage.get('prompt_tokens') or 0)
+            completion = int(usage.get('completion_tokens') or 0)
+            self.requests_with_usage += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.cost += estimate_cost(prompt, completion)
+
+    def to_dict(self) -> Dict[str, Any]:
+        requests = self.requests or 1
+        return {
+            'requests': self.requests,
+            'requests_with_usage': self.requests_with_usage,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.prompt_tokens + self.completion_tokens,
+            'cost': round(self.cost, 6),
+            'avg_first_chunk_latency': round(self.first_chunk_seconds / requests, 3),
+            'avg_total_latency': round(self.total_seconds / requests, 3),
+        }
+
+
+class UsageTracker:
+    """按提供商、档位与会话汇总用量；会话维度只保留最近 USAGE_CONVERSATION_MAX 个"""
+
+    def __init__(self, max_conversations: int = USAGE_CONVERSATION_MAX):
+        self.max_conversations = max_conversations
+        self._totals = UsageAggregate()
+        self._by_provider: Dict[str, UsageAggregate] = {}
+        self._by_profile: Dict[str, UsageAggregate] = {}
+        self._by_conversation: "OrderedDict[str, UsageAggregate]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, provider: Optional[str], profile: Optional[str], conversation_id: Optional[str],
+               usage: Optional[Dict[str, int]], first_chunk_latency: Optional[float], total_latency: float):
+        with self._lock:
+            self._totals.add(usage, first_chunk_latency, total_latency)
+            if provider:
+                self._by_provider.setdefault(provider, UsageAggregate()).add(usage, first_chunk_latency, total_latency)
+            if profile:
+                self._by_profile.setdefault(profile, UsageAggregate()).add(usage, first_chunk_latency, total_latency)
+            if conversation_id:
+                aggregate = self._by_conversation.pop(conversation_id, None) or UsageAggregate()
+                aggregate.add(usage, first_chunk_latency, total_latency)
+                self._by_conversation[conversation_id] = aggregate
+                while len(self._by_conversation) > self.max_conversations:
+                    self._by_conversation.popitem(last=False)
+
+    def conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            aggregate = self._by_conversation.get(conversation_id)
+            return aggregate.to_dict() if aggregate else None
+
+    def snapshot(self, top: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            costly = sorted(self._by_conversation.items(),
+                            key=lambda item: (item[1].cost, item[1].total_seconds), reverse=True)[:top]
+            return {
+                'totals': self._totals.to_dict(),
+                'providers': {name: agg.to_dict() for name, agg in self._by_provider.items()},
+                'profiles': {name: agg.to_dict() for name, agg in self._by_profile.items()},
+                'top_conversations': {cid: agg.to_dict() for cid, agg in costly},
+                'tracked_conversations': len(self._by_conversation),
+            }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志子系统
+结构化JSON日志、基于队列的非阻塞处理器、按事件采样与敏感信息脱敏
+"""
+
+import re
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from typing import Dict
+from config import *
+
+# 敏感信息脱敏规则：(正则, 替换)
+REDACTION_PATTERNS = [
+    (re.compile(r'(Bearer\s+)[A-Za-z0-9\-._~+/]+=*', re.IGNORECASE), r'\1***'),
+    (re.compile(r'''(['"]?(?:X-Api-Access-Key|X-Api-App-Key|X-Api-App-Id|Authorization|app_secret|tenant_access_token|access_token|api_key)['"]?\s*[:=]\s*['"]?(?:Bearer\s+)?)[^'",\s}]+''',
+                re.IGNORECASE), r'\1***'),
+]
+
+# 事件采样率，形如 {"aily.chunk": 0.01}
+_sample_rates: Dict[str, float] = {}
+_listener = None
+
+
+def redact(text: str) -> str:
+    """对日志文本中的密钥、token等敏感信息做掩码"""
+    for pattern, replacement in REDACTION_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """解析采样配置，例如 "aily.chunk=0.01,llm.line=0.01" """
+    rates = {}
+    for item in spec.split(','):
+        if '=' not in item:
+            continue
+        event, rate = item.split('=', 1)
+        try:
+            rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def sample_log(logger: logging.Logger, event: str, level: int = logging.DEBUG) -> bool:
+    """按事件采样的日志开关
+
+    仅当日志级别启用且命中采样率时返回True。调用方应在格式化消息前判断，
+    这样未命中采样的高频日志（如每个流式块）不产生任何格式化开销。
+    """
+    if not logger.isEnabledFor(level):
+        return False
+    rate = _sample_rates.get(event, 1.0)
+    return rate >= 1.0 or (rate > 0 and random.random() < rate)
+
+
+class RedactingFormatter(logging.Formatter):
+    """文本格式，输出前脱敏"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    """结构化JSON格式，输出前脱敏"""
+
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': redact(record.getMessage()),
+        }
+        # 通过 extra={...} 传入的结构化字段
+        for key, value in record.__dict__.items():
+            if key not in self.RESERVED and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_text or record.exc_info:
+            payload['exc'] = redact(record.exc_text or self.formatException(record.exc_info))
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """非阻塞队列处理器
+
+    请求线程只负责入队：不在请求线程中格式化消息，队列满时直接丢弃并计数，
+    格式化、脱敏与I/O全部由后台监听线程完成。
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 异常堆栈需要在当前线程展开，其余格式化延迟到监听线程
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging():
+    """按 config.py 中的配置初始化根日志器，重复调用安全"""
+    global _listener
+    if _listener is not None:
+        return
+
+    _sample_rates.update(parse_sample_rates(LOG_SAMPLE_RATES))
+
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = RedactingFormatter('%(asctime)s %(levelname)s [%(name)s] %(message)s')
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.INFO))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
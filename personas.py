@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+人设注册表
+从人设文件（JSON）加载多个人设，每个人设可单独指定系统提示词、LLM提供商、Aily技能、
+音色、语速与生成参数上限；文件修改后自动热加载，按请求选择人设。
+各人设共用同一批常驻客户端（连接池、token、熔断器），只在请求参数上区分，
+一个进程即可同时承载多个人设
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, Optional, Tuple
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class PersonaConfigError(ValueError):
+    """人设文件内容无效"""
+
+
+@dataclass(frozen=True)
+class Persona:
+    name: str
+    display_name: str
+    system_prompt: str
+    provider: Optional[str] = None  # 为空时按请求/会话/路由策略选择
+    skill_app_id: str = SKILL_APP_ID
+    skill_id: str = SKILL_ID
+    voice_type: str = TTS_VOICE_TYPE
+    speech_rate: int = TTS_SPEECH_RATE
+    temperature: Optional[float] = None  # 为空时使用生成参数档位
+    max_tokens: Optional[int] = None  # 该人设允许的最大输出token数
+
+    def generation_limits(self) -> Dict[str, Any]:
+        """供 resolve_generation_params 使用的人设级生成参数"""
+        return {key: value for key, value in (('temperature', self.temperature), ('max_tokens', self.max_tokens))
+                if value is not None}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """对外展示的人设信息（不含系统提示词与技能ID）"""
+        return {
+            'name': self.name,
+            'display_name': self.display_name,
+            'provider': self.provider,
+            'voice_type': self.voice_type,
+        }
+
+
+# 字段类型：人设文件中的值按此转换，转换失败视为文件无效
+_FIELD_TYPES = {'temperature': float, 'max_tokens': int, 'speech_rate': int}
+_PERSONA_FIELDS = {f.name for f in fields(Persona)} - {'name'}
+
+
+def builtin_persona() -> Persona:
+    """由全局配置构成的内置人设，人设文件不存在时使用，也是文件中各人设的默认值"""
+    return Persona(name='default', display_name='默认', system_prompt=PERSONA_SYSTEM_PROMPT)
+
+
+def parse_personas(data: Any, base: Persona) -> Tuple[Dict[str, Persona], Optional[str]]:
+    """解析人设文件内容，返回 (人设字典, 文件指定的默认人设)
+
+    格式: {"default": "名称", "personas": {"名称": {"system_prompt": ..., "voice_type": ..., ...}}}
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('personas'), dict):
+        raise PersonaConfigError('人设文件需包含 personas 对象')
+    personas = {}
+    for name, entry in data['personas'].items():
+        if not isinstance(entry, dict):
+            raise PersonaConfigError(f'人设 {name} 的配置必须是对象')
+        unknown = set(entry) - _PERSONA_FIELDS
+        if unknown:
+            raise PersonaConfigError(f"人设 {name} 含未知字段: {', '.join(sorted(unknown))}")
+        values = {}
+        for key, value in entry.items():
+            cast = _FIELD_TYPES.get(key)
+            if cast is not None and value is not None:
+                try:
+                    value = cast(value)
+                except (TypeError, ValueError):
+                    raise PersonaConfigError(f'人设 {name} 的 {key} 取值无效: {value!r}')
+            values[key] = value
+        values.setdefault('display_name', name)
+        personas[name] = replace(base, name=name, **values)
+    default = data.get('default')
+    if default is not None and default not in personas:
+        raise PersonaConfigError(f'默认人设 {default} 不存在')
+    return personas, default
+
+
+class PersonaRegistry:
+    """可热加载的人设注册表
+
+    读取时最多每隔 check_interval 秒检查一次文件修改时间，变化后重新解析并整体替换
+    （读路径无锁）；新文件无效时保留上一版本并记录错误，不影响正在服务的请求。
+    """
+
+    def __init__(self, path: str = PERSONAS_FILE, check_interval: float = PERSONA_RELOAD_INTERVAL,
+                 default_name: str = DEFAULT_PERSONA):
+        self.path = path
+        self.check_interval = max(0.0, check_interval)
+        self.default_name = default_name
+        self._base = builtin_persona()
+        self._personas: Dict[str, Persona] = {self._base.name: self._base}
+        self._file_default: Optional[str] = None
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._version = 0
+        self._loaded_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _stat(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def reload(self, force: bool = False) -> bool:
+        """文件有变化（或 force）时重新加载，返回是否加载了新版本"""
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            mtime = self._stat()
+            if mtime == self._mtime and not force:
+                return False
+            if mtime is None:
+                if self._mtime is not None:
+                    logger.warning(f"人设文件 {self.path} 已删除，回退为内置人设")
+                self._personas = {self._base.name: self._base}
+                self._file_default = None
+                self._mtime = None
+                self._version += 1
+                self._last_error = None
+                return True
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    personas, file_default = parse_personas(json.load(f), self._base)
+            except (OSError, json.JSONDecodeError, PersonaConfigError) as e:
+                # 记下修改时间，避免对同一个无效文件反复解析
+                self._mtime = mtime
+                self._last_error = str(e)
+                logger.error(f"人设文件 {self.path} 加载失败，继续使用上一版本: {e}")
+                return False
+            personas.setdefault(self._base.name, self._base)
+            self._personas = personas
+            self._file_default = file_default
+            self._mtime = mtime
+            self._version += 1
+            self._loaded_at = time.time()
+            self._last_error = None
+            logger.info(f"人设文件已加载（第{self._version}版）: {', '.join(personas)}")
+            return True
+
+    def _maybe_reload(self):
+        if time.monotonic() >= self._next_check:
+            self.reload()
+
+    @property
+    def default(self) -> Persona:
+        personas = self._personas
+        for name in (self.default_name, self._file_default):
+            if name and name in personas:
+                return personas[name]
+        return personas[self._base.name]
+
+    def resolve(self, name: Optional[str] = None) -> Optional[Persona]:
+        """按名称取人设，未指定时返回默认人设，名称不存在时返回None"""
+        self._maybe_reload()
+        if not name:
+            return self.default
+        return self._personas.get(name)
+
+    def describe(self) -> Dict[str, Any]:
+        """对外展示的人设列表与默认人设"""
+        self._maybe_reload()
+        return {'default': self.default.name,
+                'personas': [persona.to_dict() for persona in self._personas.values()]}
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'path': self.path,
+            'version': self._version,
+            'loaded_at': self._loaded_at,
+            'last_error': self._last_error,
+            'default': self.default.name,
+            'personas': list(self._personas),
+        }
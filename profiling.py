@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能诊断
+请求追踪（PROFILING_ENABLED，可通过管理接口运行时开关）：按路由统计墙钟时间与CPU时间，CPU占比低说明
+耗时主要花在等待上游（I/O密集），占比高说明花在本进程计算；同时记录每个请求的阶段耗时与上游调用，
+超过 PROFILING_SLOW_THRESHOLD 的请求保存其线程调用栈采样、阶段耗时与上游调用记录。
+采样分析器：通过管理接口启动，按固定间隔采样所有线程的调用栈，输出折叠栈（flamegraph.pl / speedscope 可直接读取）。
+追踪关闭时各埋点只做一次线程局部变量读取
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# 慢请求调用栈的采样间隔（秒）与每个请求最多保留的不同调用栈数
+SLOW_SAMPLE_INTERVAL = 0.05
+MAX_TRACE_STACKS = 200
+# 单个请求最多记录的阶段与上游调用条数
+MAX_TRACE_EVENTS = 200
+# 采样分析器最多保留的不同调用栈数，超出后新栈计入 (other)
+MAX_PROFILE_STACKS = 20000
+# 折叠栈的最大深度
+MAX_STACK_DEPTH = 64
+
+_local = threading.local()
+
+
+def _collapse(frame, limit: int = MAX_STACK_DEPTH) -> str:
+    """把调用栈折叠为 root;...;leaf 形式，每帧为 函数名 (文件名:定义行)"""
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def current_trace() -> Optional['RequestTrace']:
+    return getattr(_local, 'trace', None)
+
+
+class RequestTrace:
+    """一次请求的追踪记录，可绑定到处理该请求的多个线程（请求线程、SSE工作线程、合成线程池）"""
+
+    def __init__(self, route: str, request_id: Optional[str] = None):
+        self.route = route
+        self.request_id = request_id
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.cpu = 0.0
+        self.wall: Optional[float] = None
+        self.marks: List[Dict[str, Any]] = []
+        self.upstream: List[Dict[str, Any]] = []
+        self.stacks: Counter = Counter()
+        self.threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    def attach(self):
+        """绑定到当前线程，返回 detach 所需的令牌"""
+        token = (current_trace(), time.thread_time())
+        _local.trace = self
+        ident = threading.get_ident()
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+        return token
+
+    def detach(self, token):
+        previous, cpu_start = token
+        ident = threading.get_ident()
+        with self._lock:
+            self.cpu += time.thread_time() - cpu_start
+            count = self.threads.get(ident, 0) - 1
+            if count > 0:
+                self.threads[ident] = count
+            else:
+                self.threads.pop(ident, None)
+        _local.trace = previous
+
+    @contextmanager
+    def bind(self):
+        token = self.attach()
+        try:
+            yield self
+        finally:
+            self.detach(token)
+
+    def mark(self, name: str):
+        with self._lock:
+            if len(self.marks) < MAX_TRACE_EVENTS:
+                self.marks.append({'name': name, 'at_ms': round(self.elapsed() * 1000, 1)})
+
+    def add_upstream(self, operation: str, start: float, duration: float, error: Optional[str]):
+        with self._lock:
+            if len(self.upstream) < MAX_TRACE_EVENTS:
+                self.upstream.append({'operation': operation, 'at_ms': round(start * 1000, 1),
+                                      'duration_ms': round(duration * 1000, 1), 'error': error})
+
+    def sample(self, frames: Dict[int, Any]):
+        """记录绑定线程当前的调用栈"""
+        with self._lock:
+            idents = list(self.threads)
+        for ident in idents:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = _collapse(frame)
+            with self._lock:
+                if stack in self.stacks or len(self.stacks) < MAX_TRACE_STACKS:
+                    self.stacks[stack] += 1
+
+    def to_dict(self, include_stacks: bool = True) -> Dict[str, Any]:
+        wall = self.wall if self.wall is not None else self.elapsed()
+        with self._lock:
+            upstream_ms = sum(call['duration_ms'] for call in self.upstream)
+            result = {
+                'route': self.route,
+                'request_id': self.request_id,
+                'started_at': int(self.started_at),
+                'wall_ms': round(wall * 1000, 1),
+                'cpu_ms': round(self.cpu * 1000, 1),
+                'cpu_ratio': round(self.cpu / wall, 3) if wall > 0 else None,
+                # 各线程的上游调用可能并行，合计值可以超过墙钟时间
+                'upstream_ms': round(upstream_ms, 1),
+                'marks': list(self.marks),
+                'upstream': list(self.upstream),
+            }
+            if include_stacks:
+                result['stacks'] = [{'stack': stack, 'samples': count}
+                                    for stack, count in self.stacks.most_common()]
+        return result
+
+
+class _RouteStats:
+    __slots__ = ('count', 'wall', 'cpu', 'wall_max', 'slow')
+
+    def __init__(self):
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.wall_max = 0.0
+        self.slow = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'wall_avg_ms': round(self.wall / self.count * 1000, 1) if self.count else 0.0,
+            'cpu_avg_ms': round(self.cpu / self.count * 1000, 1) if self.count else 0.0,
+            'wall_max_ms': round(self.wall_max * 1000, 1),
+            # 接近0为I/O密集（主要在等待上游），接近或超过1为CPU密集
+            'cpu_ratio': round(self.cpu / self.wall, 3) if self.wall > 0 else None,
+            'slow': self.slow,
+        }
+
+
+class RequestTracer:
+    """请求追踪的开关、进行中请求、按路由汇总与慢请求记录"""
+
+    def __init__(self, enabled: bool = PROFILING_ENABLED, slow_threshold: float = PROFILING_SLOW_THRESHOLD,
+                 slow_max: int = PROFILING_SLOW_MAX):
+        self.enabled = False
+        self.slow_threshold = slow_threshold
+        self._active: Dict[int, RequestTrace] = {}
+        self._routes: Dict[str, _RouteStats] = {}
+        self._slow: deque = deque(maxlen=max(1, slow_max))
+        self._lock = threading.Lock()
+        self._watchdog: Optional[threading.Thread] = None
+        self.configure(enabled)
+
+    def configure(self, enabled: Optional[bool] = None, slow_threshold: Optional[float] = None):
+        """运行时开关追踪、调整慢请求阈值"""
+        if slow_threshold is not None and slow_threshold > 0:
+            self.slow_threshold = slow_threshold
+        if enabled is None:
+            return
+        with self._lock:
+            self.enabled = enabled
+            if enabled and (self._watchdog is None or not self._watchdog.is_alive()):
+                self._watchdog = threading.Thread(target=self._watch, name='slow-request-watchdog', daemon=True)
+                self._watchdog.start()
+        logger.info(f"请求追踪已{'开启' if enabled else '关闭'}，慢请求阈值 {self.slow_threshold}s")
+
+    def begin(self, route: str, request_id: Optional[str] = None) -> Optional[RequestTrace]:
+        if not self.enabled:
+            return None
+        trace = RequestTrace(route, request_id)
+        with self._lock:
+            self._active[id(trace)] = trace
+        return trace
+
+    def finish(self, trace: RequestTrace):
+        trace.wall = trace.elapsed()
+        slow = trace.wall >= self.slow_threshold
+        with self._lock:
+            self._active.pop(id(trace), None)
+            stats = self._routes.setdefault(trace.route, _RouteStats())
+            stats.count += 1
+            stats.wall += trace.wall
+            stats.cpu += trace.cpu
+            stats.wall_max = max(stats.wall_max, trace.wall)
+            if slow:
+                stats.slow += 1
+        if slow:
+            self._slow.append(trace.to_dict())
+            logger.warning(f"慢请求 {trace.route} 耗时 {trace.wall:.2f}s（CPU {trace.cpu:.2f}s）",
+                           extra={'request_id': trace.request_id})
+
+    def _watch(self):
+        """进行中的请求超过慢请求阈值后，定时采样其绑定线程的调用栈"""
+        while self.enabled:
+            time.sleep(SLOW_SAMPLE_INTERVAL)
+            with self._lock:
+                slow = [trace for trace in self._active.values() if trace.elapsed() >= self.slow_threshold]
+            if slow:
+                frames = sys._current_frames()
+                for trace in slow:
+                    trace.sample(frames)
+                del frames
+
+    def routes(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {route: stats.to_dict() for route, stats in self._routes.items()}
+
+    def slow_requests(self, request_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近的慢请求记录（新的在前）"""
+        records = list(self._slow)
+        records.reverse()
+        if request_id:
+            records = [record for record in records if record['request_id'] == request_id]
+        return records
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._active)
+        return {'enabled': self.enabled, 'slow_threshold': self.slow_threshold, 'active': active,
+                'slow_recorded': len(self._slow)}
+
+
+def propagate(func: Callable) -> Callable:
+    """让 func 在其他线程（工作线程、线程池）中执行时仍计入当前请求的追踪"""
+    trace = current_trace()
+    if trace is None:
+        return func
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        with trace.bind():
+            return func(*args, **kwargs)
+    return run
+
+
+def mark(name: str):
+    """记录当前请求的一个阶段时间点"""
+    trace = current_trace()
+    if trace is not None:
+        trace.mark(name)
+
+
+@contextmanager
+def upstream_span(operation: str):
+    """记录一次上游调用的起止时间与结果"""
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+    start = trace.elapsed()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        trace.add_upstream(operation, start, trace.elapsed() - start, error)
+
+
+class SamplingProfiler:
+    """全进程采样分析器：后台线程按间隔读取所有线程的调用栈并按折叠栈计数，最长运行 max_seconds 秒"""
+
+    def __init__(self):
+        self._stacks: Counter = Counter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.interval = PROFILER_INTERVAL
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = PROFILER_INTERVAL, seconds: float = PROFILER_MAX_SECONDS) -> bool:
+        """开始采样，已在运行时返回False；上一次的结果被清空"""
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = min(1.0, max(0.001, interval))
+            seconds = min(PROFILER_MAX_SECONDS, max(0.1, seconds))
+            self._stacks = Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(self.interval, seconds),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+        logger.info(f"采样分析器已启动，间隔 {self.interval * 1000:.0f}ms，最长 {seconds:.0f}s")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=2)
+
+    def _run(self, interval: float, seconds: float):
+        own = threading.get_ident()
+        end = time.monotonic() + seconds
+        try:
+            while not self._stop.wait(interval) and time.monotonic() < end:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                frames = sys._current_frames()
+                with self._lock:
+                    for ident, frame in frames.items():
+                        if ident == own:
+                            continue
+                        # 线程名去掉序号作为根帧，同类线程（如 tts-chunk_0/1/2）合并统计
+                        root = names.get(ident, str(ident)).rstrip('0123456789').rstrip('_-') or 'thread'
+                        stack = f'{root};{_collapse(frame)}'
+                        if stack in self._stacks or len(self._stacks) < MAX_PROFILE_STACKS:
+                            self._stacks[stack] += 1
+                        else:
+                            self._stacks[f'{root};(other)'] += 1
+                    self.samples += 1
+                del frames
+        finally:
+            self.stopped_at = time.time()
+            logger.info(f"采样分析器已停止，共采样 {self.samples} 次")
+
+    def collapsed(self) -> str:
+        """折叠栈文本：每行 栈 次数"""
+        with self._lock:
+            return '\n'.join(f'{stack} {count}' for stack, count in self._stacks.most_common())
+
+    def snapshot(self, top: int = 30) -> Dict[str, Any]:
+        """采样状态与按函数统计的自身/累计采样数"""
+        with self._lock:
+            stacks = list(self._stacks.items())
+            samples = self.samples
+        own, total = Counter(), Counter()
+        for stack, count in stacks:
+            frames = stack.split(';')[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        end = self.stopped_at or time.time()
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'samples': samples,
+            'started_at': int(self.started_at) if self.started_at else None,
+            'duration': round(end - self.started_at, 1) if self.started_at else 0,
+            'unique_stacks': len(stacks),
+            'top_self': [{'frame': frame, 'samples': count} for frame, count in own.most_common(top)],
+            'top_total': [{'frame': frame, 'samples': count} for frame, count in total.most_common(top)],
+        }
+
+
+request_tracer = RequestTracer()
+sampling_profiler = SamplingProfiler()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+回放基准
+以回放模式加载录制的上游HTTP往返，离线重复运行对话流生成（generate_stream_response，含Aily事件流/轮询
+与火山引擎SSE解析）、语音合成（TTS分行解码）与语音识别轮询，统计首个事件耗时、总耗时与CPU时间。
+上游响应与分块时间来自记录文件，每轮结果可重复，适合比较优化前后的差异
+
+录制: HTTP_CASSETTE_MODE=record HTTP_CASSETTE_PATH=cassettes/upstream.jsonl python app.py
+      （完成一次对话、语音合成与识别后停止服务）
+用法: python replay_benchmark.py --cassette cassettes/upstream.jsonl [--runs 5] [--speed 0]
+      [--scenario chat --scenario tts] [--message 你好] [--provider volcano] [--text 要合成的文本]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+SCENARIOS = ('chat', 'tts', 'asr')
+
+
+def measure(run):
+    """执行一轮，返回 (首个结果耗时, 总耗时, CPU时间, 输出大小)；CPU时间含本轮用到的所有线程"""
+    start, cpu_start = time.perf_counter(), time.process_time()
+    first, size = None, 0
+    for item in run():
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(item) if isinstance(item, (str, bytes)) else 0
+    total = time.perf_counter() - start
+    return first if first is not None else total, total, time.process_time() - cpu_start, size
+
+
+def scenario_runner(app, name, args):
+    if name == 'chat':
+        return lambda: app.generate_stream_response(args.message, provider=args.provider)
+    if name == 'tts':
+        def synthesize():
+            audio = app.tts_client.get().synthesize(args.text)
+            yield audio or b''
+        return synthesize
+    def recognize():
+        result = app.asr_client.get().recognize_with_polling(args.audio_url, poll_interval=0)
+        yield (result or {}).get('text') or ''
+    return recognize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='基于录制的上游往返离线测量对话、合成与识别的耗时')
+    parser.add_argument('--cassette', default=os.getenv('HTTP_CASSETTE_PATH', 'cassettes/upstream.jsonl'),
+                        help='回放记录文件')
+    parser.add_argument('--runs', type=int, default=5, help='每个场景的运行次数')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度倍数，1为按录制时间间隔，0为不等待')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='要测量的场景，可重复指定')
+    parser.add_argument('--message', default='你好', help='对话场景发送的消息')
+    parser.add_argument('--provider', help='对话场景使用的LLM提供商')
+    parser.add_argument('--text', default='你好，欢迎使用语音助手。', help='合成场景的文本')
+    parser.add_argument('--audio-url', default='https://example.com/replay.wav', help='识别场景提交的音频地址')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args(argv)
+
+    # 配置在导入时读取，必须在导入 app 之前设置
+    os.environ.update({
+        'HTTP_CASSETTE_MODE': 'replay',
+        'HTTP_CASSETTE_PATH': args.cassette,
+        'HTTP_REPLAY_SPEED': str(args.speed),
+        # 关闭合成缓存，每轮都经过TTS响应解码
+        'TTS_CACHE_TTL': '0',
+    })
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    from http_cassette import get_cassette
+
+    cassette = get_cassette()
+    results = {}
+    for name in args.scenario or ['chat']:
+        run = scenario_runner(app, name, args)
+        samples = []
+        for _ in range(max(1, args.runs)):
+            cassette.rewind()
+            samples.append(measure(run))
+        firsts, totals, cpus, sizes = zip(*samples)
+        results[name] = {
+            'runs': len(samples),
+            'first_ms': round(statistics.median(firsts) * 1000, 1),
+            'total_ms': round(statistics.median(totals) * 1000, 1),
+            'cpu_ms': round(statistics.median(cpus) * 1000, 1),
+            # 每轮输出大小一致说明回放是确定的
+            'output_sizes': sorted(set(sizes)),
+        }
+    results['cassette'] = cassette.stats()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return 0
+    print(f"{'场景':<8}{'次数':>6}{'首个结果(ms)':>14}{'总耗时(ms)':>12}{'CPU(ms)':>10}  输出大小")
+    for name in SCENARIOS:
+        if name in results:
+            r = results[name]
+            print(f"{name:<8}{r['runs']:>6}{r['first_ms']:>14}{r['total_ms']:>12}{r['cpu_ms']:>10}  {r['output_sizes']}")
+    print(f"回放记录: {results['cassette']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上游调用重试
+对可重试的瞬时错误（连接失败、超时、429/5xx、限流错误码）按指数退避加随机抖动重试，
+每次等待与调用都受请求截止时间约束；非幂等写操作只在请求确定未被执行时重试
+"""
+
+import time
+import random
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+import requests
+from config import *
+from cancellation import Deadline, DeadlineExceeded
+from circuit_breaker import CircuitOpenError
+from profiling import upstream_span
+
+logger = logging.getLogger(__name__)
+
+# 表示上游暂时不可用、稍后重试可能成功的HTTP状态码
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 表示请求未被执行（限流/过载拒绝）的HTTP状态码，非幂等写操作也可安全重试
+REJECTED_STATUS = {429, 503}
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """幂等操作的重试判断：瞬时网络错误、超时、可重试状态码，或自身标记 retryable 的业务错误"""
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if getattr(error, 'retryable', False):
+        return True
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(error, requests.HTTPError):
+        return _status_of(error) in RETRYABLE_STATUS
+    return False
+
+
+def is_retryable_unsent(error: BaseException) -> bool:
+    """非幂等写操作的重试判断：只在请求未到达上游或被明确拒绝时重试，避免重复执行"""
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    if getattr(error, 'rejected', False):
+        return True
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.HTTPError):
+        return _status_of(error) in REJECTED_STATUS
+    return False
+
+
+class RetryPolicy:
+    """重试次数与退避参数；退避采用 full jitter：在 [0, min(max_delay, base*2^n)] 内随机"""
+
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+_stats: Dict[str, Dict[str, int]] = {}
+_stats_lock = threading.Lock()
+
+
+def _count(operation: str, field: str):
+    with _stats_lock:
+        stats = _stats.setdefault(operation, {'calls': 0, 'retries': 0, 'recovered': 0, 'failed': 0})
+        stats[field] += 1
+
+
+def retry_call(func: Callable[[], Any], operation: str, policy: Optional[RetryPolicy] = None,
+               deadline: Optional[Deadline] = None, retryable: Callable[[BaseException], bool] = is_retryable,
+               cancel_event: Optional[threading.Event] = None) -> Any:
+    """调用 func，失败时按策略重试
+
+    func 不带参数，需要在闭包中复用幂等键等请求内容。截止时间不足以完成下一次退避时直接抛出
+    最近一次的错误；cancel_event 被设置时停止重试。
+    """
+    policy = policy or DEFAULT_POLICY
+    deadline = deadline or Deadline()
+    _count(operation, 'calls')
+    attempt = 0
+    while True:
+        if deadline.expired:
+            _count(operation, 'failed')
+            raise DeadlineExceeded(f'{operation} 已超过请求截止时间')
+        try:
+            with upstream_span(operation):
+                result = func()
+        except Exception as e:
+            attempt += 1
+            if attempt >= policy.max_attempts or not retryable(e):
+                _count(operation, 'failed')
+                raise
+            delay = policy.backoff(attempt - 1)
+            remaining = deadline.remaining()
+            if remaining is not None and remaining <= delay:
+                _count(operation, 'failed')
+                raise
+            logger.warning(f"{operation} 第{attempt}次失败，{delay * 1000:.0f}ms后重试: {e}")
+            _count(operation, 'retries')
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise
+            else:
+                time.sleep(delay)
+            continue
+        if attempt:
+            _count(operation, 'recovered')
+        return result
+
+
+def retry_snapshots() -> Dict[str, Dict[str, int]]:
+    """各操作的调用、重试、重试后成功与最终失败次数"""
+    with _stats_lock:
+        return {operation: dict(stats) for operation, stats in _stats.items()}
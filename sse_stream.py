@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSE输出层
+上游在工作线程中产出事件并写入有界缓冲，输出端按时间/字节微批合并文本增量，
+空闲时发送注释心跳，客户端断开后通过取消事件立即停止上游轮询
+"""
+
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Iterable, Iterator, Optional
+from config import *
+from profiling import propagate
+
+logger = logging.getLogger(__name__)
+
+DONE_FRAME = 'data: [DONE]\n\n'
+HEARTBEAT_FRAME = ': ping\n\n'
+
+# 工作线程结束标记
+_END = object()
+
+
+def text_frame(text: str) -> str:
+    """文本增量帧（OpenAI兼容的 choices/delta 格式）"""
+    return f'data: {json.dumps({"choices": [{"delta": {"content": text}}]}, ensure_ascii=False)}\n\n'
+
+
+def data_frame(payload) -> str:
+    """控制帧：dict 序列化为JSON，str 视为已序列化的数据原样转发"""
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, ensure_ascii=False)
+    return f'data: {payload}\n\n'
+
+
+def _put(buffer: "queue.Queue", item, cancel_event: threading.Event) -> bool:
+    """写入缓冲，缓冲满时等待（背压），取消后放弃写入"""
+    while not cancel_event.is_set():
+        try:
+            buffer.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _pump(events: Iterable, buffer: "queue.Queue", cancel_event: threading.Event):
+    """工作线程：迭代上游事件写入有界缓冲；取消后关闭上游生成器"""
+    iterator = iter(events)
+    try:
+        for event in iterator:
+            if not _put(buffer, event, cancel_event):
+                break
+    except Exception as e:
+        logger.error(f"SSE上游事件产出异常: {e}")
+        _put(buffer, {'error': {'message': '生成响应时出现错误', 'type': 'server_error'}}, cancel_event)
+    finally:
+        if cancel_event.is_set():
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                # 在迭代所在线程中关闭，上游的 finally/GeneratorExit 清理逻辑得以执行
+                close()
+            logger.info("请求已取消，上游流已停止")
+            # 通过 /api/cancel 取消时客户端仍在读取，尽力通知其结束
+            try:
+                buffer.put_nowait(_END)
+            except queue.Full:
+                pass
+        else:
+            _put(buffer, _END, cancel_event)
+
+
+def stream_sse(events: Iterable, cancel_event: Optional[threading.Event] = None,
+               batch_interval: float = SSE_BATCH_INTERVAL, batch_max_bytes: int = SSE_BATCH_MAX_BYTES,
+               heartbeat_interval: float = SSE_HEARTBEAT_INTERVAL,
+               buffer_size: int = SSE_BUFFER_MAX_EVENTS) -> Iterator[str]:
+    """将上游事件流转换为SSE帧
+
+    events 中的 str 为文本增量，在 batch_interval 秒或 batch_max_bytes 字节内合并为一帧；
+    其他事件（如 replace、error 字典）作为控制帧立即发送，发送前先输出已合并的文本。
+    结束时统一发送一次 [DONE]。
+    """
+    cancel_event = cancel_event or threading.Event()
+    buffer: "queue.Queue" = queue.Queue(maxsize=buffer_size)
+    worker = threading.Thread(target=propagate(_pump), args=(events, buffer, cancel_event), name='sse-pump', daemon=True)
+    worker.start()
+
+    pending = []
+    pending_bytes = 0
+    batch_deadline = 0.0
+    last_write = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            if pending:
+                timeout = max(0.0, batch_deadline - now)
+            else:
+                timeout = max(0.0, last_write + heartbeat_interval - now)
+            try:
+                event = buffer.get(timeout=timeout)
+            except queue.Empty:
+                if not worker.is_alive() and buffer.empty():
+                    # 上游已结束但结束标记未能写入（取消时缓冲已满）
+                    yield (text_frame(''.join(pending)) if pending else '') + DONE_FRAME
+                    return
+                if pending:
+                    yield text_frame(''.join(pending))
+                    pending, pending_bytes = [], 0
+                else:
+                    # 长时间无输出（如Aily工具调用）时发送注释心跳，防止代理断开空闲连接
+                    yield HEARTBEAT_FRAME
+                last_write = time.monotonic()
+                continue
+
+            if isinstance(event, str):
+                if not event:
+                    continue
+                if not pending:
+                    batch_deadline = now + batch_interval
+                pending.append(event)
+                pending_bytes += len(event.encode('utf-8'))
+                if pending_bytes < batch_max_bytes and batch_interval > 0:
+                    continue
+                out = text_frame(''.join(pending))
+                pending, pending_bytes = [], 0
+            else:
+                out = text_frame(''.join(pending)) if pending else ''
+                pending, pending_bytes = [], 0
+                if event is _END:
+                    yield out + DONE_FRAME
+                    return
+                out += data_frame(event)
+
+            yield out
+            last_write = time.monotonic()
+    finally:
+        # 正常结束时上游已完成；客户端断开（GeneratorExit）时通知工作线程停止上游
+        cancel_event.set()
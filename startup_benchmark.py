@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+冷启动基准
+在独立子进程中多次导入 app，统计各部署形态（全功能 / 纯文本对话等）的
+启动耗时、常驻内存峰值与导入后的线程数，用于评估功能开关与延迟初始化的效果
+
+用法: python startup_benchmark.py [--runs 5] [--scenario full --scenario text-only]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# 子进程中执行：计时导入 app 并输出内存峰值（ru_maxrss 在Linux下单位为KB）
+CHILD_CODE = r"""
+import json, time, resource, threading
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print('__BENCH__' + json.dumps({
+    'import_seconds': elapsed,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'threads': threading.active_count(),
+}))
+"""
+
+SCENARIOS = {
+    'full': {},
+    'text-only': {
+        'TTS_ENABLED': 'false',
+        'ASR_ENABLED': 'false',
+        'LLM_WARMUP_ON_START': 'false',
+    },
+    'volcano-text': {
+        'TTS_ENABLED': 'false',
+        'ASR_ENABLED': 'false',
+        'LLM_PROVIDERS': 'volcano',
+        'LLM_PROVIDER': 'volcano',
+        'LLM_WARMUP_ON_START': 'false',
+    },
+}
+
+
+def run_once(env_overrides):
+    env = dict(os.environ)
+    env.update(env_overrides)
+    # 基准只关心启动本身，减少日志I/O干扰
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    result = subprocess.run([sys.executable, '-c', CHILD_CODE], env=env, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=120)
+    for line in result.stdout.splitlines():
+        if line.startswith('__BENCH__'):
+            return json.loads(line[len('__BENCH__'):])
+    raise RuntimeError(f"子进程启动失败（退出码 {result.returncode}）: {result.stderr.strip()[-500:]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='测量不同功能组合下的冷启动耗时与内存')
+    parser.add_argument('--runs', type=int, default=5, help='每种形态的启动次数')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='要测量的形态，可重复指定')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.scenario or list(SCENARIOS):
+        samples = [run_once(SCENARIOS[name]) for _ in range(max(1, args.runs))]
+        times = sorted(s['import_seconds'] for s in samples)
+        results[name] = {
+            'runs': len(samples),
+            'median_ms': round(statistics.median(times) * 1000, 1),
+            'max_ms': round(times[-1] * 1000, 1),
+            'max_rss_mb': round(max(s['max_rss_kb'] for s in samples) / 1024, 1),
+            'threads': max(s['threads'] for s in samples),
+        }
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return 0
+    print(f"{'形态':<14}{'次数':>6}{'中位耗时(ms)':>14}{'最大耗时(ms)':>14}{'内存峰值(MB)':>14}{'线程数':>8}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['runs']:>6}{r['median_ms']:>14}{r['max_ms']:>14}{r['max_rss_mb']:>14}"
+              f"{r['threads']:>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
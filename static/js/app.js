@@ -1,3 +1,556 @@
+// 将资源路径映射为带内容指纹的URL（清单由服务端注入 index.html）
+function assetUrl(path) {
+    return (window.ASSET_MANIFEST && window.ASSET_MANIFEST[path]) || path;
+}
+
+// 基于能量的语音活动检测：跟踪底噪判定语音起止，持续静音达到阈值即视为一句话结束，
+// 采集到的PCM裁掉首尾静音后编码为16kHz WAV（与服务端 /api/stt 的VAD判定方式一致）
+class VoiceActivityDetector {
+    constructor(stream, options = {}) {
+        this.stream = stream;
+        this.options = Object.assign({
+            thresholdDb: 12,      // 高于底噪多少dB判为语音
+            minDb: -50,           // 语音能量下限（dBFS）
+            minSpeechMs: 150,     // 持续多久的语音才算开口，过滤按键声等瞬时噪声
+            silenceMs: 700,       // 语音后持续静音多久视为说完
+            prerollMs: 300,       // 开口前保留的音频，避免截掉首字
+            paddingMs: 200,       // 结尾保留的静音
+            maxSpeechMs: 60000,   // 单句最长时长
+            playbackMarginDb: 10, // 播放回答语音时提高阈值，减少扬声器回声误触发打断
+            targetSampleRate: 16000
+        }, options);
+        this.onSpeechStart = null;
+        this.onSpeechEnd = null;   // (wavBlob, { speechMs })
+        this.shouldPause = null;   // 返回true时暂停检测（如识别期间）
+        this.isPlaybackActive = null;  // 返回true时正在播放回答语音，检测阈值提高 playbackMarginDb
+        this.audioContext = null;
+        this.reset();
+    }
+
+    start() {
+        const AudioCtx = window.AudioContext || window.webkitAudioContext;
+        this.audioContext = new AudioCtx();
+        this.source = this.audioContext.createMediaStreamSource(this.stream);
+        this.processor = this.audioContext.createScriptProcessor(2048, 1, 1);
+        this.processor.onaudioprocess = (event) => this.handleAudio(event.inputBuffer.getChannelData(0));
+        this.source.connect(this.processor);
+        // ScriptProcessor需接入输出才会被调度，未写入输出缓冲因此不会发声
+        this.processor.connect(this.audioContext.destination);
+        this.reset();
+    }
+
+    stop() {
+        if (!this.audioContext) return;
+        this.processor.disconnect();
+        this.source.disconnect();
+        this.audioContext.close().catch(() => {});
+        this.audioContext = null;
+        this.reset();
+    }
+
+    reset() {
+        this.noiseDb = -60;
+        this.speaking = false;
+        this.candidateMs = 0;
+        this.speechMs = 0;
+        this.trailingSilenceMs = 0;
+        this.preroll = [];
+        this.prerollMs = 0;
+        this.chunks = [];
+    }
+
+    handleAudio(input) {
+        if (this.shouldPause && this.shouldPause()) {
+            if (this.speaking || this.preroll.length) this.reset();
+            return;
+        }
+        const samples = new Float32Array(input);
+        const frameMs = samples.length / this.audioContext.sampleRate * 1000;
+        let power = 0;
+        for (let i = 0; i < samples.length; i++) {
+            power += samples[i] * samples[i];
+        }
+        const db = 10 * Math.log10(power / samples.length + 1e-12);
+        const margin = this.isPlaybackActive && this.isPlaybackActive() ? this.options.playbackMarginDb : 0;
+        const threshold = Math.max(this.noiseDb + this.options.thresholdDb, this.options.minDb) + margin;
+        const isSpeech = db >= threshold;
+        if (!isSpeech) {
+            // 底噪：下降立即跟随，上升缓慢跟随，避免被语音拉高
+            this.noiseDb = db < this.noiseDb ? db : this.noiseDb * 0.95 + db * 0.05;
+        }
+
+        if (!this.speaking) {
+            this.preroll.push(samples);
+            this.prerollMs += frameMs;
+            while (this.prerollMs - frameMs > this.options.prerollMs + this.options.minSpeechMs) {
+                this.prerollMs -= frameMs;
+                this.preroll.shift();
+            }
+            this.candidateMs = isSpeech ? this.candidateMs + frameMs : 0;
+            if (this.candidateMs >= this.options.minSpeechMs) {
+                this.speaking = true;
+                this.chunks = this.preroll;
+                this.speechMs = this.prerollMs;
+                this.preroll = [];
+                this.prerollMs = 0;
+                this.trailingSilenceMs = 0;
+                if (this.onSpeechStart) this.onSpeechStart();
+            }
+            return;
+        }
+
+        this.chunks.push(samples);
+        this.speechMs += frameMs;
+        this.trailingSilenceMs = isSpeech ? 0 : this.trailingSilenceMs + frameMs;
+        if (this.trailingSilenceMs >= this.options.silenceMs || this.speechMs >= this.options.maxSpeechMs) {
+            this.finish();
+        }
+    }
+
+    finish() {
+        const sampleRate = this.audioContext.sampleRate;
+        // 去掉结尾静音，只保留 paddingMs
+        const dropMs = Math.max(0, this.trailingSilenceMs - this.options.paddingMs);
+        const total = this.chunks.reduce((sum, chunk) => sum + chunk.length, 0);
+        const keep = Math.max(0, total - Math.round(dropMs / 1000 * sampleRate));
+        const pcm = new Float32Array(keep);
+        let offset = 0;
+        for (const chunk of this.chunks) {
+            if (offset >= keep) break;
+            const part = chunk.subarray(0, Math.min(chunk.length, keep - offset));
+            pcm.set(part, offset);
+            offset += part.length;
+        }
+        const speechMs = this.speechMs - dropMs;
+        this.reset();
+        const downsampled = VoiceActivityDetector.downsample(pcm, sampleRate, this.options.targetSampleRate);
+        const rate = Math.min(sampleRate, this.options.targetSampleRate);
+        if (this.onSpeechEnd) this.onSpeechEnd(VoiceActivityDetector.encodeWav(downsampled, rate), { speechMs });
+    }
+
+    static downsample(pcm, fromRate, toRate) {
+        if (toRate >= fromRate) return pcm;
+        const ratio = fromRate / toRate;
+        const out = new Float32Array(Math.floor(pcm.length / ratio));
+        for (let i = 0; i < out.length; i++) {
+            // 取区间均值，兼作简单的低通滤波
+            const start = Math.floor(i * ratio);
+            const end = Math.min(pcm.length, Math.floor((i + 1) * ratio));
+            let sum = 0;
+            for (let j = start; j < end; j++) sum += pcm[j];
+            out[i] = sum / Math.max(1, end - start);
+        }
+        return out;
+    }
+
+    static encodeWav(pcm, sampleRate) {
+        const buffer = new ArrayBuffer(44 + pcm.length * 2);
+        const view = new DataView(buffer);
+        const writeString = (offset, text) => {
+            for (let i = 0; i < text.length; i++) view.setUint8(offset + i, text.charCodeAt(i));
+        };
+        writeString(0, 'RIFF');
+        view.setUint32(4, 36 + pcm.length * 2, true);
+        writeString(8, 'WAVE');
+        writeString(12, 'fmt ');
+        view.setUint32(16, 16, true);
+        view.setUint16(20, 1, true);              // PCM
+        view.setUint16(22, 1, true);              // 单声道
+        view.setUint32(24, sampleRate, true);
+        view.setUint32(28, sampleRate * 2, true);
+        view.setUint16(32, 2, true);
+        view.setUint16(34, 16, true);
+        writeString(36, 'data');
+        view.setUint32(40, pcm.length * 2, true);
+        for (let i = 0; i < pcm.length; i++) {
+            const sample = Math.max(-1, Math.min(1, pcm[i]));
+            view.setInt16(44 + i * 2, sample < 0 ? sample * 0x8000 : sample * 0x7FFF, true);
+        }
+        return new Blob([view], { type: 'audio/wav' });
+    }
+}
+
+// 流式语音播放：支持 MediaSource 时边接收边播放，各段音频按顺序追加到同一个 SourceBuffer
+// （sequence 模式，时间戳自动衔接）连续播放（段间保留各段编码器的补齐静音）；不支持时退回为逐段 <audio> 播放。
+// stop() 用于打断：停止播放并中止未完成的下载（服务端随之取消尚未开始的合成）
+class StreamingAudioPlayer {
+    static isSupported() {
+        return !!(window.MediaSource && MediaSource.isTypeSupported('audio/mpeg'));
+    }
+
+    constructor(options = {}) {
+        this.onEnded = options.onEnded || null;  // 全部音频播放完毕（被 stop() 打断时不调用）
+        this.useMse = StreamingAudioPlayer.isSupported();
+        this.audio = new Audio();
+        this.chunks = [];        // 已收到的全部音频，用于生成重播用的完整音频
+        this.pending = [];       // 等待追加到 SourceBuffer 或等待播放的音频
+        this.inputEnded = false;
+        this.stopped = false;
+        this.finished = false;
+        this.controller = null;  // 正在读取的响应，stop() 时中止
+        this.objectUrl = null;
+        this.audio.onended = () => {
+            if (this.useMse) this.complete();
+        };
+        if (this.useMse) {
+            this.mediaSource = new MediaSource();
+            this.sourceBuffer = null;
+            this.objectUrl = URL.createObjectURL(this.mediaSource);
+            this.mediaSource.addEventListener('sourceopen', () => {
+                if (this.stopped) return;
+                this.sourceBuffer = this.mediaSource.addSourceBuffer('audio/mpeg');
+                this.sourceBuffer.mode = 'sequence';
+                this.sourceBuffer.addEventListener('updateend', () => this.drain());
+                this.drain();
+            }, { once: true });
+            this.audio.src = this.objectUrl;
+        }
+    }
+
+    get active() {
+        return !this.stopped && !this.finished;
+    }
+
+    append(bytes) {
+        if (this.stopped || !bytes || !bytes.byteLength) return;
+        this.chunks.push(bytes);
+        this.pending.push(bytes);
+        this.drain();
+    }
+
+    // 不会再有新的音频：MSE 模式下数据追加完后结束媒体流，播放到末尾后触发 onEnded
+    end() {
+        this.inputEnded = true;
+        this.drain();
+    }
+
+    // 读取分块传输的音频响应：MSE 模式下边收边播，否则收完后整段播放
+    async playResponse(response, controller = null) {
+        this.controller = controller;
+        const reader = response.body.getReader();
+        const parts = [];
+        try {
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done || this.stopped) break;
+                if (this.useMse) {
+                    this.append(value);
+                } else {
+                    parts.push(value);
+                }
+            }
+            if (parts.length) {
+                this.append(new Uint8Array(await new Blob(parts).arrayBuffer()));
+            }
+        } finally {
+            this.controller = null;
+            this.end();
+        }
+    }
+
+    drain() {
+        if (this.stopped) return;
+        if (!this.useMse) {
+            this.playNextUnit();
+            return;
+        }
+        if (!this.sourceBuffer || this.sourceBuffer.updating) return;
+        if (this.pending.length) {
+            try {
+                this.sourceBuffer.appendBuffer(this.pending.shift());
+            } catch (error) {
+                console.warn('追加音频数据失败:', error);
+                this.stop();
+                return;
+            }
+            // 首段数据追加后立即开始播放
+            if (this.audio.paused && !this.finished) {
+                this.audio.play().catch(error => console.warn('自动播放被阻止:', error));
+            }
+        } else if (this.inputEnded && this.mediaSource.readyState === 'open') {
+            this.mediaSource.endOfStream();
+            // 没有任何音频时不会触发 ended
+            if (!this.chunks.length) this.complete();
+        }
+    }
+
+    // 不支持 MediaSource 时逐段播放，每段为一个完整的音频文件
+    playNextUnit() {
+        if (!this.audio.paused && !this.audio.ended && this.audio.src) return;
+        const bytes = this.pending.shift();
+        if (!bytes) {
+            if (this.inputEnded) this.complete();
+            return;
+        }
+        if (this.objectUrl) URL.revokeObjectURL(this.objectUrl);
+        this.objectUrl = URL.createObjectURL(new Blob([bytes], { type: 'audio/mpeg' }));
+        this.audio.src = this.objectUrl;
+        this.audio.onended = () => this.playNextUnit();
+        this.audio.onerror = () => this.playNextUnit();
+        this.audio.play().catch(() => this.playNextUnit());
+    }
+
+    complete() {
+        if (this.finished || this.stopped) return;
+        this.finished = true;
+        this.release();
+        if (this.onEnded) this.onEnded();
+    }
+
+    stop() {
+        if (this.stopped) return;
+        this.stopped = true;
+        this.pending = [];
+        if (this.controller) this.controller.abort();
+        this.audio.pause();
+        if (this.useMse && this.mediaSource.readyState === 'open') {
+            try {
+                this.mediaSource.endOfStream();
+            } catch (error) {
+                // 正在追加数据时结束会抛出异常，播放已停止，忽略
+            }
+        }
+        this.release();
+    }
+
+    release() {
+        if (this.objectUrl) {
+            URL.revokeObjectURL(this.objectUrl);
+            this.objectUrl = null;
+        }
+    }
+
+    // 完整音频（重播用）
+    toBlob() {
+        return new Blob(this.chunks, { type: 'audio/mpeg' });
+    }
+}
+
+// 流式Markdown渲染：已结束的块（空行、标题、代码块闭合处）只解析并插入一次，
+// 之后不再改动；只有最后一个未结束的块在每帧重绘。文本增量先累积，按动画帧合并写入DOM，
+// 长回答每帧的解析与布局开销与已输出的长度无关。只用DOM接口构建节点，不拼接HTML
+const MD_INLINE_PATTERN = /(`+)([^`]+?)\1|\*\*([^*]+?)\*\*|\*([^*\s][^*]*?)\*|\[([^\]]+)\]\((https?:\/\/[^\s)]+)\)/g;
+const MD_FENCE = /^\s*(```|~~~)/;
+const MD_HEADING = /^(#{1,6})\s+(.*)$/;
+const MD_LIST_ITEM = /^\s*([-*+]|\d+[.)])\s+(.*)$/;
+const MD_QUOTE = /^\s*>\s?(.*)$/;
+
+class StreamingMarkdownRenderer {
+    constructor(container, options = {}) {
+        this.container = container;
+        this.onFirstPaint = options.onFirstPaint || null;  // 首次有内容写入DOM时调用
+        this.onFlush = options.onFlush || null;            // 每次写入DOM后调用（如滚动到底部）
+        this.source = '';
+        this.committed = 0;   // source 中已定稿为固定节点的长度
+        this.tailNodes = [];  // 未结束块对应的节点，每次写入时替换
+        this.frame = null;
+        this.painted = false;
+        this.frames = 0;
+    }
+
+    append(text) {
+        if (!text) return;
+        this.source += text;
+        this.schedule();
+    }
+
+    // 上游改写了已输出内容：整体重绘
+    replace(text) {
+        this.source = text || '';
+        this.committed = 0;
+        this.tailNodes = [];
+        this.container.textContent = '';
+        this.schedule();
+    }
+
+    schedule() {
+        if (this.frame !== null) return;
+        // 后台标签页不触发动画帧，finish() 时同步补写
+        this.frame = requestAnimationFrame(() => {
+            this.frame = null;
+            this.flush(false);
+        });
+    }
+
+    // 流结束：取消待执行的帧并把剩余内容全部定稿
+    finish() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        this.flush(true);
+    }
+
+    flush(final) {
+        const pending = this.source.slice(this.committed);
+        const { blocks, consumed } = StreamingMarkdownRenderer.splitBlocks(pending);
+        if (final && consumed < pending.length) {
+            blocks.push(pending.slice(consumed));
+        }
+        const tail = final ? '' : pending.slice(consumed);
+        if (!blocks.length && this.tailNodes.length === 0 && !tail.trim()) return;
+
+        // 首次写入时清掉占位内容（如“思考中”提示）
+        if (!this.painted) this.container.textContent = '';
+        for (const node of this.tailNodes) node.remove();
+        this.tailNodes = [];
+        for (const block of blocks) {
+            for (const node of StreamingMarkdownRenderer.renderBlock(block)) {
+                this.container.appendChild(node);
+            }
+        }
+        this.committed += final ? pending.length : consumed;
+        if (tail.trim()) {
+            this.tailNodes = StreamingMarkdownRenderer.renderBlock(tail);
+            for (const node of this.tailNodes) this.container.appendChild(node);
+        }
+        this.frames += 1;
+        if (!this.painted && this.container.firstChild) {
+            this.painted = true;
+            if (this.onFirstPaint) this.onFirstPaint();
+        }
+        if (this.onFlush) this.onFlush();
+    }
+
+    // 一次性渲染完整文本（如恢复的历史回答）
+    static render(text) {
+        const { blocks, consumed } = StreamingMarkdownRenderer.splitBlocks(text);
+        if (text.slice(consumed).trim()) blocks.push(text.slice(consumed));
+        return blocks.flatMap(block => StreamingMarkdownRenderer.renderBlock(block));
+    }
+
+    // 从未定稿的文本中切出已结束的块；只根据完整的行（以换行结尾）做判断
+    static splitBlocks(text) {
+        const blocks = [];
+        let start = 0;
+        let lineStart = 0;
+        let inFence = false;
+        const closeBlock = (end) => {
+            if (text.slice(start, end).trim()) blocks.push(text.slice(start, end));
+            start = end;
+        };
+        while (true) {
+            const newline = text.indexOf('\n', lineStart);
+            if (newline === -1) break;
+            const line = text.slice(lineStart, newline);
+            const next = newline + 1;
+            if (MD_FENCE.test(line)) {
+                if (inFence) {
+                    closeBlock(next);
+                } else {
+                    closeBlock(lineStart);
+                }
+                inFence = !inFence;
+            } else if (!inFence) {
+                if (!line.trim()) {
+                    closeBlock(lineStart);
+                    start = next;
+                } else if (MD_HEADING.test(line)) {
+                    closeBlock(lineStart);
+                    closeBlock(next);
+                }
+            }
+            lineStart = next;
+        }
+        return { blocks, consumed: start };
+    }
+
+    // 渲染一个块，返回节点数组；块内的段落、列表、引用按行分组
+    static renderBlock(block) {
+        const lines = block.replace(/\n+$/, '').split('\n');
+        if (MD_FENCE.test(lines[0])) {
+            const pre = document.createElement('pre');
+            const code = document.createElement('code');
+            const body = lines.slice(1);
+            if (body.length && MD_FENCE.test(body[body.length - 1])) body.pop();
+            code.textContent = body.join('\n');
+            pre.appendChild(code);
+            return [pre];
+        }
+        const heading = lines.length === 1 && lines[0].match(MD_HEADING);
+        if (heading) {
+            const h = document.createElement(`h${Math.min(heading[1].length + 2, 6)}`);
+            StreamingMarkdownRenderer.appendInline(h, heading[2]);
+            return [h];
+        }
+
+        const nodes = [];
+        let group = null;  // { type, element, lines }
+        const flushGroup = () => {
+            if (group && group.type !== 'list') {
+                StreamingMarkdownRenderer.appendLines(group.element, group.lines);
+            }
+            group = null;
+        };
+        for (const line of lines) {
+            const item = line.match(MD_LIST_ITEM);
+            const quote = !item && line.match(MD_QUOTE);
+            if (item) {
+                const ordered = /\d/.test(item[1]);
+                const tag = ordered ? 'ol' : 'ul';
+                if (!group || group.type !== 'list' || group.element.tagName.toLowerCase() !== tag) {
+                    flushGroup();
+                    group = { type: 'list', element: document.createElement(tag), lines: [] };
+                    if (ordered && parseInt(item[1], 10) > 1) group.element.start = parseInt(item[1], 10);
+                    nodes.push(group.element);
+                }
+                const li = document.createElement('li');
+                StreamingMarkdownRenderer.appendInline(li, item[2]);
+                group.element.appendChild(li);
+            } else if (group && group.type === 'list' && /^\s+\S/.test(line)) {
+                // 缩进的续行归入上一个列表项
+                const li = group.element.lastChild;
+                li.appendChild(document.createElement('br'));
+                StreamingMarkdownRenderer.appendInline(li, line.trim());
+            } else {
+                const type = quote ? 'quote' : 'paragraph';
+                if (!group || group.type !== type) {
+                    flushGroup();
+                    group = { type, element: document.createElement(quote ? 'blockquote' : 'p'), lines: [] };
+                    nodes.push(group.element);
+                }
+                group.lines.push(quote ? quote[1] : line);
+            }
+        }
+        flushGroup();
+        return nodes;
+    }
+
+    static appendLines(parent, lines) {
+        lines.forEach((line, index) => {
+            if (index > 0) parent.appendChild(document.createElement('br'));
+            StreamingMarkdownRenderer.appendInline(parent, line);
+        });
+    }
+
+    static appendInline(parent, text) {
+        let last = 0;
+        for (const match of text.matchAll(MD_INLINE_PATTERN)) {
+            if (match.index > last) parent.appendChild(document.createTextNode(text.slice(last, match.index)));
+            let node;
+            if (match[2] !== undefined) {
+                node = document.createElement('code');
+                node.textContent = match[2];
+            } else if (match[3] !== undefined) {
+                node = document.createElement('strong');
+                StreamingMarkdownRenderer.appendInline(node, match[3]);
+            } else if (match[4] !== undefined) {
+                node = document.createElement('em');
+                node.textContent = match[4];
+            } else {
+                node = document.createElement('a');
+                node.href = match[6];
+                node.target = '_blank';
+                node.rel = 'noopener noreferrer';
+                node.textContent = match[5];
+            }
+            parent.appendChild(node);
+            last = match.index + match[0].length;
+        }
+        if (last < text.length) parent.appendChild(document.createTextNode(text.slice(last)));
+    }
+}
+
 class ChatApp {
     constructor() {
         this.initElements();
@@ -8,6 +561,7 @@ class ChatApp {
         this.audioChunks = [];
         this.recordingTimer = null;
         this.maxRecordingTime = 60000; // 60秒
+        this.maxUploadRetries = 5; // 单个分片最大重试次数
         this.currentAudio = null;
         // 交互状态
         this.isVoicePressing = false;
@@ -20,6 +574,139 @@ class ChatApp {
         this.thinkingAnimationTimer = null; // 新增思考动画定时器
         // 检测内置浏览器环境
         this.isInAppBrowser = this.detectInAppBrowser();
+        // 会话ID：同一会话的请求固定路由到同一LLM提供商
+        this.conversationId = this.loadConversationId();
+        // 人设：通过页面地址 ?persona=名称 选择，未指定时由服务端使用默认人设
+        this.persona = new URLSearchParams(window.location.search).get('persona') || '';
+        // 预热节流：避免每次按键都触发预热
+        this.lastWarmupTime = 0;
+        this.warmupInterval = 30000;
+        // 会话历史分页游标
+        this.historyCursor = null;
+        this.historyExhausted = false;
+        this.historyLoading = false;
+        // 进行中的请求，用于开始新问题或关闭页面时取消
+        this.activeChat = null;
+        this.activeSttRequestId = null;
+        // 免提模式：语音活动检测到说完后自动识别并发送
+        this.handsFree = false;
+        this.vad = null;
+        this.vadBusy = false;
+        // 语音对话轮次：识别、回答与分句语音在一次请求中返回，过大的录音仍走断点续传
+        this.voiceTurnEnabled = true;
+        this.voiceTurnMaxBytes = 1024 * 1024;
+        // 回答语音的流式播放器与进行中的合成请求，打断时一并停止
+        this.player = null;
+        this.ttsController = null;
+        this.handsFreeTurn = 0;
+    }
+
+    newRequestId() {
+        return (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    }
+
+    // 发起聊天请求：先取消上一个未完成的回答，请求ID随请求头携带，服务端可据此取消上游
+    async postChat(message, inputMode = 'text') {
+        this.cancelActiveChat();
+        const requestId = this.newRequestId();
+        const controller = new AbortController();
+        this.activeChat = { requestId, controller };
+        const startedAt = performance.now();
+        const response = await fetch('/api/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Request-Id': requestId
+            },
+            body: JSON.stringify(this.buildChatRequestBody(message, inputMode)),
+            signal: controller.signal
+        });
+        response.requestId = requestId;
+        response.startedAt = startedAt;
+        return response;
+    }
+
+    cancelActiveChat() {
+        if (!this.activeChat) return;
+        const { requestId, controller } = this.activeChat;
+        this.activeChat = null;
+        controller.abort();
+        this.sendCancel(requestId);
+    }
+
+    // 通知服务端取消请求；页面关闭时也能送达
+    sendCancel(requestId) {
+        const payload = JSON.stringify({ request_id: requestId });
+        if (navigator.sendBeacon) {
+            navigator.sendBeacon('/api/cancel', new Blob([payload], { type: 'application/json' }));
+            return;
+        }
+        fetch('/api/cancel', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: payload,
+            keepalive: true
+        }).catch(() => {});
+    }
+
+    // 用户开始输入或录音时预热后端会话，缩短首字延迟
+    requestWarmup() {
+        const now = Date.now();
+        if (now - this.lastWarmupTime < this.warmupInterval) return;
+        this.lastWarmupTime = now;
+        const body = { conversation_id: this.conversationId };
+        if (this.persona) {
+            body.persona = this.persona;
+        }
+        // 只在用户显式选择提供商时携带，否则由人设或服务端路由决定
+        const provider = window.llmSwitcher && window.llmSwitcher.getCurrentProvider();
+        if (provider) {
+            body.provider = provider;
+        }
+        fetch('/api/warmup', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(body),
+            keepalive: true
+        }).catch((error) => {
+            console.warn('预热请求失败:', error);
+        });
+    }
+
+    loadConversationId() {
+        let conversationId = localStorage.getItem('conversation_id');
+        if (!conversationId) {
+            conversationId = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID()
+                : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+            localStorage.setItem('conversation_id', conversationId);
+        }
+        return conversationId;
+    }
+
+    // 构造聊天请求体，提供商随请求携带，不再全局切换；inputMode 标记消息来自键盘还是语音识别
+    buildChatRequestBody(message, inputMode = 'text') {
+        const body = {
+            message: message,
+            stream: true,
+            conversation_id: this.conversationId,
+            input_mode: inputMode
+        };
+        if (this.persona) {
+            body.persona = this.persona;
+        }
+        // 只在用户显式选择提供商时携带，否则由人设或服务端路由决定
+        const provider = window.llmSwitcher && window.llmSwitcher.getCurrentProvider();
+        if (provider) {
+            body.provider = provider;
+        }
+        return body;
     }
 
     // 检测是否在微信、飞书、钉钉等内置浏览器中
@@ -33,6 +720,46 @@ class ChatApp {
                userAgent.includes('weibo');            // 微博
     }
 
+    // 加载会话历史：首次加载最近一页，滚动到顶部时按游标继续向前加载，返回本次加载的轮数
+    async loadHistory() {
+        if (this.historyLoading || this.historyExhausted) return 0;
+        this.historyLoading = true;
+        try {
+            const params = new URLSearchParams({ conversation_id: this.conversationId, limit: '20' });
+            if (this.historyCursor) {
+                params.set('before', String(this.historyCursor));
+            }
+            const response = await fetch(`/api/history?${params}`);
+            if (!response.ok) return 0;
+            const result = await response.json();
+            
+            // 向前翻页时插入到现有消息之前，并保持当前阅读位置
+            const anchor = this.chatHistory.firstChild;
+            const previousTop = this.chatHistory.scrollTop;
+            const previousHeight = this.chatHistory.scrollHeight;
+            for (const turn of result.items) {
+                this.chatHistory.insertBefore(this.addMessage(turn.user_text, 'user'), anchor);
+                if (turn.assistant_text) {
+                    this.chatHistory.insertBefore(this.addMessage(turn.assistant_text, 'assistant'), anchor);
+                }
+            }
+            if (anchor) {
+                this.chatHistory.scrollTop = previousTop + (this.chatHistory.scrollHeight - previousHeight);
+            } else {
+                this.scrollToBottom();
+            }
+            
+            this.historyCursor = result.next_before;
+            this.historyExhausted = !result.has_more;
+            return result.items.length;
+        } catch (error) {
+            console.warn('加载会话历史失败:', error);
+            return 0;
+        } finally {
+            this.historyLoading = false;
+        }
+    }
+
     initElements() {
         this.messageInput = document.getElementById('messageInput');
         this.sendBtn = document.getElementById('sendBtn');
@@ -43,12 +770,28 @@ class ChatApp {
         this.loadingIndicator = document.getElementById('loadingIndicator');
         this.quoteText = document.getElementById('quoteText');
         this.recordingTime = document.getElementById('recordingTime');
+        this.handsFreeBtn = document.getElementById('handsFreeBtn');
     }
 
     initEventListeners() {
         // 发送按钮点击事件
         this.sendBtn.addEventListener('click', () => this.sendMessage());
         
+        // 关闭或离开页面时取消进行中的回答与语音识别，释放服务端资源
+        window.addEventListener('pagehide', () => {
+            this.cancelActiveChat();
+            if (this.activeSttRequestId) {
+                this.sendCancel(this.activeSttRequestId);
+            }
+        });
+        
+        // 滚动到顶部时加载更早的会话历史
+        this.chatHistory.addEventListener('scroll', () => {
+            if (this.chatHistory.scrollTop === 0 && this.historyCursor) {
+                this.loadHistory();
+            }
+        });
+        
         // 输入框回车事件
         this.messageInput.addEventListener('keypress', (e) => {
             if (e.key === 'Enter' && !e.shiftKey) {
@@ -72,10 +815,18 @@ class ChatApp {
 
         // 停止按钮仍保留
         this.stopRecording.addEventListener('click', () => this.stopVoiceRecording());
+        
+        // 免提模式开关
+        if (this.handsFreeBtn) {
+            this.handsFreeBtn.addEventListener('click', () => this.toggleHandsFree());
+        }
 
         // 输入框内容变化事件
         this.messageInput.addEventListener('input', () => {
             this.updateSendButton();
+            if (this.messageInput.value.trim()) {
+                this.requestWarmup();
+            }
         });
     }
 
@@ -303,11 +1054,17 @@ class ChatApp {
             
             const formData = new FormData();
             formData.append('audio', file);
+            formData.append('conversation_id', this.conversationId);
             
+            this.activeSttRequestId = this.newRequestId();
             const response = await fetch('/api/stt', {
                 method: 'POST',
+                headers: {
+                    'X-Request-Id': this.activeSttRequestId
+                },
                 body: formData
             });
+            this.activeSttRequestId = null;
             
             // 停止动画
             clearInterval(animateDots);
@@ -337,16 +1094,7 @@ class ChatApp {
                 
                 try {
                     // 发送消息到后端
-                    const response = await fetch('/api/chat', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            message: message,
-                            stream: true
-                        })
-                    });
+                    const response = await this.postChat(message, 'voice');
         
                     if (!response.ok) {
                         throw new Error(`HTTP error! status: ${response.status}`);
@@ -356,6 +1104,7 @@ class ChatApp {
                     await this.handleStreamResponse(response, placeholderEl);
         
                 } catch (error) {
+                    if (error.name === 'AbortError') return; // 已被新问题取消
                     console.error('发送消息失败:', error);
                     this.showError('发送消息失败，请重试');
                 }
@@ -422,6 +1171,8 @@ class ChatApp {
     startVoiceRecording() {
         try {
             if (this.mediaRecorder.state === 'inactive') {
+                // 按下说话即打断正在播放的回答
+                this.bargeIn();
                 this.isCancelledRecording = false; // 新录音会话重置取消状态
                 this.audioChunks = [];
                 this.isRecording = true;
@@ -433,6 +1184,8 @@ class ChatApp {
                 
                 // 开始录音
                 this.mediaRecorder.start();
+                // 录音期间预热对话会话
+                this.requestWarmup();
                 
                 // 开始时间显示更新
                 this.updateRecordingTime();
@@ -609,6 +1362,63 @@ class ChatApp {
         this.showError('已取消发送');
     }
 
+    // 免提模式：无需按住说话，检测到一句话结束后自动裁剪静音、识别并发送
+    toggleHandsFree() {
+        if (!this.audioStream) {
+            this.showError('录音功能不可用');
+            return;
+        }
+        if (this.handsFree) {
+            this.handsFree = false;
+            if (this.vad) this.vad.stop();
+            this.handsFreeBtn.classList.remove('active');
+            if (this.voiceIndicator) this.voiceIndicator.classList.remove('active');
+            return;
+        }
+        
+        if (!this.vad) {
+            this.vad = new VoiceActivityDetector(this.audioStream);
+            // 识别/生成回答期间不检测；开始播放回答语音后恢复检测，用户开口即打断
+            this.vad.shouldPause = () => this.isRecording || (this.vadBusy && !this.isSpeaking());
+            this.vad.isPlaybackActive = () => this.isSpeaking();
+            this.vad.onSpeechStart = () => {
+                if (this.isSpeaking()) this.bargeIn();
+                this.updateRecordingStatus('正在聆听...');
+                this.requestWarmup();
+            };
+            this.vad.onSpeechEnd = (blob, stats) => this.handleHandsFreeUtterance(blob, stats);
+        }
+        try {
+            this.vad.start();
+        } catch (error) {
+            console.error('启动语音活动检测失败:', error);
+            this.showError('当前浏览器不支持免提模式');
+            return;
+        }
+        this.handsFree = true;
+        this.handsFreeBtn.classList.add('active');
+        this.updateRecordingStatus('免提模式：请直接说话');
+    }
+
+    async handleHandsFreeUtterance(blob, stats) {
+        console.log('检测到一句话结束，语音时长:', Math.round(stats.speechMs), 'ms');
+        // 打断后上一轮仍在收尾，只由最新一轮清除忙碌状态
+        const turn = ++this.handsFreeTurn;
+        this.vadBusy = true;
+        this.updateRecordingStatus('发送中...');
+        try {
+            await this.recognizeAndSend(blob, 'recording.wav');
+        } finally {
+            if (turn !== this.handsFreeTurn) return;
+            this.vadBusy = false;
+            if (this.handsFree) {
+                this.updateRecordingStatus('免提模式：请直接说话');
+            } else if (this.voiceIndicator) {
+                this.voiceIndicator.classList.remove('active');
+            }
+        }
+    }
+
     updateRecordingStatus(text) {
         const statusEl = document.querySelector('.recording-status');
         if (statusEl) statusEl.textContent = text;
@@ -642,13 +1452,33 @@ class ChatApp {
                 type: this.getSupportedMimeType() 
             });
             
-            console.log('录音文件大小:', (audioBlob.size / 1024).toFixed(2), 'KB');
+            // 根据实际录音格式设置文件名
+            const mimeType = this.getSupportedMimeType();
+            let fileName = 'recording.wav';  // 默认wav
+            if (mimeType && mimeType.includes('ogg')) {
+                fileName = 'recording.ogg';
+            } else if (mimeType && mimeType.includes('mp3')) {
+                fileName = 'recording.mp3';
+            }
             
-            // 检查文件大小（5MB限制）
-            if (audioBlob.size > 5 * 1024 * 1024) {
-                this.showError('录音文件过大，请缩短录音时间');
-                return;
+            await this.recognizeAndSend(audioBlob, fileName);
+        } finally {
+            this.audioChunks = [];
+        }
+    }
+
+    // 识别录音并将结果作为语音消息发送（按住说话与免提模式共用）
+    async recognizeAndSend(audioBlob, fileName) {
+        if (this.voiceTurnEnabled && audioBlob.size <= this.voiceTurnMaxBytes) {
+            try {
+                if (await this.sendVoiceTurn(audioBlob, fileName)) return;
+            } catch (error) {
+                if (error.name === 'AbortError') return; // 已被新问题取消
+                console.warn('语音对话接口失败，回退为分步识别:', error);
             }
+        }
+        try {
+            console.log('录音文件大小:', (audioBlob.size / 1024).toFixed(2), 'KB');
 
             // 添加语音识别中的提示消息
             const recognitionPlaceholder = this.addMessage('语音识别中', 'user');
@@ -669,21 +1499,8 @@ class ChatApp {
             }, 500);
             
             // 发送到后端进行语音识别
-            const formData = new FormData();
-            // 根据实际录音格式设置文件名
-            const mimeType = this.getSupportedMimeType();
-            let fileName = 'recording.wav';  // 默认wav
-            if (mimeType && mimeType.includes('ogg')) {
-                fileName = 'recording.ogg';
-            } else if (mimeType && mimeType.includes('mp3')) {
-                fileName = 'recording.mp3';
-            }
-            formData.append('audio', audioBlob, fileName);
-            
-            const response = await fetch('/api/stt', {
-                method: 'POST',
-                body: formData
-            });
+            // 分片断点续传，弱网下失败只重传当前分片
+            const response = await this.uploadAudioResumable(audioBlob, fileName);
             
             // 停止动画
             if (this.recognitionAnimationTimer) {
@@ -716,16 +1533,7 @@ class ChatApp {
                 
                 try {
                     // 发送消息到后端
-                    const response = await fetch('/api/chat', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            message: message,
-                            stream: true
-                        })
-                    });
+                    const response = await this.postChat(message, 'voice');
         
                     if (!response.ok) {
                         throw new Error(`HTTP error! status: ${response.status}`);
@@ -735,6 +1543,7 @@ class ChatApp {
                     await this.handleStreamResponse(response, placeholderEl);
         
                 } catch (error) {
+                    if (error.name === 'AbortError') return; // 已被新问题取消
                     console.error('发送消息失败:', error);
                     this.showError('发送消息失败，请重试');
                 }
@@ -743,7 +1552,10 @@ class ChatApp {
                 if (recognitionPlaceholder && recognitionPlaceholder.parentNode) {
                     recognitionPlaceholder.parentNode.removeChild(recognitionPlaceholder);
                 }
-                this.showError(result.error || '语音识别失败');
+                // 免提模式下误触发（服务端VAD判定无语音）时静默忽略
+                if (!(result.no_speech && this.handsFree)) {
+                    this.showError(result.error || '语音识别失败');
+                }
             }
             
         } catch (error) {
@@ -760,7 +1572,317 @@ class ChatApp {
                 clearInterval(this.recognitionAnimationTimer);
                 this.recognitionAnimationTimer = null;
             }
-            this.audioChunks = [];
+        }
+    }
+
+    // 一次往返完成语音对话：服务端识别后直接生成回答并分句合成，
+    // 同一条SSE流返回识别文本、文本增量与音频分段；接口不可用时返回false由调用方回退
+    async sendVoiceTurn(audioBlob, fileName) {
+        this.cancelActiveChat();
+        this.stopPlayback();
+        const requestId = this.newRequestId();
+        const controller = new AbortController();
+        this.activeChat = { requestId, controller };
+        
+        const form = new FormData();
+        form.append('audio', audioBlob, fileName);
+        form.append('conversation_id', this.conversationId);
+        if (this.persona) {
+            form.append('persona', this.persona);
+        }
+        const provider = window.llmSwitcher && window.llmSwitcher.getCurrentProvider();
+        if (provider) {
+            form.append('provider', provider);
+        }
+        
+        const userElement = this.addMessage('语音识别中...', 'user');
+        const startedAt = performance.now();
+        let response;
+        try {
+            response = await fetch('/api/voice-turn', {
+                method: 'POST',
+                headers: {
+                    'X-Request-Id': requestId
+                },
+                body: form,
+                signal: controller.signal
+            });
+        } catch (error) {
+            userElement.remove();
+            throw error;
+        }
+        if (!response.ok) {
+            userElement.remove();
+            this.activeChat = null;
+            if (response.status === 404) {
+                this.voiceTurnEnabled = false;
+            }
+            if (response.status === 404 || response.status === 503) return false;
+            const result = await response.json().catch(() => ({}));
+            this.showError(result.error || '语音识别失败');
+            return true;
+        }
+        response.requestId = requestId;
+        response.startedAt = startedAt;
+        await this.handleVoiceTurnStream(response, userElement);
+        return true;
+    }
+
+    async handleVoiceTurnStream(response, userElement) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let fullContent = '';
+        let assistantElement = null;
+        let messageTextElement = null;
+        let renderer = null;
+        let player = null;
+        const timing = this.createStreamTiming(response);
+        
+        const handleEvent = (parsed) => {
+            if (parsed.type === 'transcript') {
+                userElement.querySelector('.message-text').textContent = parsed.text;
+                assistantElement = this.addMessage('耀忠思考中...', 'assistant', false);
+                messageTextElement = assistantElement.querySelector('.message-text');
+                renderer = this.createStreamRenderer(messageTextElement, timing);
+                return;
+            }
+            if (parsed.type === 'error' || parsed.error) {
+                const message = parsed.type === 'error' ? parsed.error : (parsed.error.message || '生成响应时出现错误');
+                if (!assistantElement) userElement.remove();
+                // 免提模式下误触发（无语音）时静默忽略
+                if (!(parsed.no_speech && this.handsFree)) this.showError(message);
+                return;
+            }
+            if (parsed.type === 'audio') {
+                // 分句音频追加到同一播放器，首句到达即开始播放，后续句子依次衔接
+                if (!player) player = this.startPlayback();
+                player.append(Uint8Array.from(atob(parsed.data), c => c.charCodeAt(0)));
+                return;
+            }
+            if (!messageTextElement) return;
+            let content = '';
+            if (typeof parsed.replace === 'string') {
+                fullContent = parsed.replace;
+            } else if (parsed.choices && parsed.choices[0] && parsed.choices[0].delta && parsed.choices[0].delta.content) {
+                content = parsed.choices[0].delta.content;
+            }
+            if (content || typeof parsed.replace === 'string') {
+                if (this.thinkingAnimationTimer) {
+                    clearInterval(this.thinkingAnimationTimer);
+                    this.thinkingAnimationTimer = null;
+                }
+                if (timing.firstToken === null) timing.firstToken = performance.now();
+                fullContent += content;
+                if (typeof parsed.replace === 'string') {
+                    renderer.replace(fullContent);
+                } else {
+                    renderer.append(content);
+                }
+            }
+        };
+        
+        try {
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop() || '';
+                for (const line of lines) {
+                    if (!line.startsWith('data: ')) continue;
+                    const data = line.slice(6);
+                    if (data === '[DONE]') continue;
+                    try {
+                        handleEvent(JSON.parse(data));
+                    } catch (e) {
+                        console.warn('解析JSON失败:', e, '数据:', data);
+                    }
+                }
+            }
+            if (renderer) this.finishStreamRender(renderer, timing);
+            if (player) player.end();
+            // 回答结束后提供整段语音的重播入口（分段已边收边播）
+            if (assistantElement && player && player.chunks.length) {
+                const audioUrl = URL.createObjectURL(player.toBlob());
+                if (this.isInAppBrowser) {
+                    this.addWeChatStyleVoiceMessage(assistantElement, audioUrl, fullContent);
+                } else {
+                    this.addAudioButton(assistantElement, audioUrl);
+                }
+            }
+        } catch (error) {
+            if (error.name === 'AbortError') {
+                console.log('语音对话已取消');
+                return;
+            }
+            console.error('处理语音对话响应时出错:', error);
+            if (renderer) this.finishStreamRender(renderer, timing);
+            if (messageTextElement) messageTextElement.textContent = '响应处理出错，请重试';
+        } finally {
+            if (this.thinkingAnimationTimer && !fullContent) {
+                clearInterval(this.thinkingAnimationTimer);
+                this.thinkingAnimationTimer = null;
+            }
+            if (renderer) {
+                this.finishStreamRender(renderer, timing);
+                this.reportStreamTiming('voice_turn', timing, renderer, fullContent);
+            }
+            if (this.activeChat && this.activeChat.requestId === response.requestId) {
+                this.activeChat = null;
+            }
+        }
+    }
+
+    // 新建回答语音的播放器，同一时刻只播放一个回答
+    startPlayback() {
+        this.stopPlayback();
+        this.stopCurrentAudio();
+        const player = new StreamingAudioPlayer({
+            onEnded: () => {
+                if (this.player === player) this.player = null;
+            }
+        });
+        this.player = player;
+        return player;
+    }
+
+    // 停止回答语音播放并中止进行中的合成请求
+    stopPlayback() {
+        if (this.ttsController) {
+            this.ttsController.abort();
+            this.ttsController = null;
+        }
+        if (this.player) {
+            this.player.stop();
+            this.player = null;
+        }
+    }
+
+    // 停止重播按钮/语音消息的播放并复位图标
+    stopCurrentAudio() {
+        if (!this.currentAudio) return;
+        this.currentAudio.pause();
+        this.currentAudio = null;
+        document.querySelectorAll('.audio-btn').forEach(btn => {
+            btn.innerHTML = '<i class="fas fa-play"></i>';
+            btn.classList.remove('playing');
+        });
+        document.querySelectorAll('.voice-icon').forEach(icon => {
+            icon.innerHTML = '🔊';
+            icon.classList.remove('playing');
+        });
+    }
+
+    // 正在出声（自动播放被阻止、尚未开始播放时不算）
+    isSpeaking() {
+        return !!(this.player && this.player.active && !this.player.audio.paused) ||
+            !!(this.currentAudio && !this.currentAudio.paused);
+    }
+
+    // 打断：用户开口或开始新问题时停止播放，并取消尚未完成的回答与语音合成
+    bargeIn() {
+        this.stopPlayback();
+        this.stopCurrentAudio();
+        this.cancelActiveChat();
+        // 上一轮已取消，立即恢复检测，不丢失打断时这句话的开头
+        this.vadBusy = false;
+    }
+
+    // 断点续传上传录音：按分片发送原始二进制，失败时查询服务端偏移量后续传，最后提交校验并识别
+    async uploadAudioResumable(blob, fileName) {
+        const createResponse = await fetch('/api/stt/uploads', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                filename: fileName,
+                size: blob.size
+            })
+        });
+        const created = await createResponse.json();
+        if (!createResponse.ok) {
+            throw new Error(created.error || `HTTP error! status: ${createResponse.status}`);
+        }
+        
+        const uploadId = created.upload_id;
+        const chunkSize = created.chunk_size || 256 * 1024;
+        // 与分片上传并行计算整体校验值
+        const checksumPromise = this.computeSha256(blob);
+        let offset = 0;
+        let retries = 0;
+        
+        while (offset < blob.size) {
+            const chunk = blob.slice(offset, offset + chunkSize);
+            try {
+                const response = await fetch(`/api/stt/uploads/${uploadId}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'Upload-Offset': String(offset)
+                    },
+                    body: chunk
+                });
+                const result = await response.json();
+                if (response.ok || (response.status === 409 && typeof result.offset === 'number')) {
+                    // 成功或偏移量不一致时，以服务端记录的偏移量为准继续
+                    offset = result.offset;
+                    retries = 0;
+                    continue;
+                }
+                const error = new Error(result.error || `HTTP error! status: ${response.status}`);
+                error.fatal = response.status >= 400 && response.status < 500;
+                throw error;
+            } catch (error) {
+                retries += 1;
+                if (error.fatal || retries > this.maxUploadRetries) {
+                    throw error;
+                }
+                console.warn(`分片上传失败，第${retries}次重试:`, error);
+                await new Promise(resolve => setTimeout(resolve, 500 * Math.pow(2, retries - 1)));
+                offset = await this.fetchUploadOffset(uploadId, offset);
+            }
+        }
+        
+        const sha256 = await checksumPromise;
+        this.activeSttRequestId = this.newRequestId();
+        try {
+            return await fetch(`/api/stt/uploads/${uploadId}/commit`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Request-Id': this.activeSttRequestId
+                },
+                body: JSON.stringify({ sha256: sha256, conversation_id: this.conversationId })
+            });
+        } finally {
+            this.activeSttRequestId = null;
+        }
+    }
+
+    async fetchUploadOffset(uploadId, fallbackOffset) {
+        try {
+            const response = await fetch(`/api/stt/uploads/${uploadId}`);
+            if (response.ok) {
+                const result = await response.json();
+                return result.offset;
+            }
+        } catch (error) {
+            console.warn('查询上传偏移量失败:', error);
+        }
+        return fallbackOffset;
+    }
+
+    async computeSha256(blob) {
+        // 非安全上下文中 crypto.subtle 不可用，跳过整体校验
+        if (!window.crypto || !crypto.subtle) return null;
+        try {
+            const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+            return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        } catch (error) {
+            console.warn('计算音频校验值失败:', error);
+            return null;
         }
     }
 
@@ -772,6 +1894,7 @@ class ChatApp {
     async sendMessage() {
         const message = this.messageInput.value.trim();
         if (!message) return;
+        this.stopPlayback();
     
         // 清空输入框
         this.messageInput.value = '';
@@ -785,16 +1908,7 @@ class ChatApp {
     
         try {
             // 发送消息到后端
-            const response = await fetch('/api/chat', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    message: message,
-                    stream: true
-                })
-            });
+            const response = await this.postChat(message);
     
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -804,6 +1918,7 @@ class ChatApp {
             await this.handleStreamResponse(response, placeholderEl);
     
         } catch (error) {
+            if (error.name === 'AbortError') return; // 已被新问题取消
             console.error('发送消息失败:', error);
             this.showError('发送消息失败，请重试');
         }
@@ -830,6 +1945,9 @@ class ChatApp {
             contentDiv.innerHTML = ''; // 清空占位内容
             contentDiv.appendChild(messageTextElement);
         }
+        // 增量Markdown渲染，DOM写入按动画帧合并
+        const timing = this.createStreamTiming(response);
+        const renderer = this.createStreamRenderer(messageTextElement, timing);
         
         try {
             while (true) {
@@ -837,6 +1955,7 @@ class ChatApp {
                 
                 if (done) {
                     console.log('流式响应完成');
+                    this.finishStreamRender(renderer, timing);
                     // 流式响应完成后调用语音合成
                     if (fullContent.trim()) {
                         console.log('开始语音合成，文本长度:', fullContent.length);
@@ -859,6 +1978,7 @@ class ChatApp {
                         const data = line.slice(6);
                         if (data === '[DONE]') {
                             console.log('收到结束标记');
+                            this.finishStreamRender(renderer, timing);
                             // 收到结束标记后也调用语音合成
                             if (fullContent.trim()) {
                                 console.log('开始语音合成，文本长度:', fullContent.length);
@@ -871,6 +1991,14 @@ class ChatApp {
                             const parsed = JSON.parse(data);
                             let content = '';
                             
+                            // 上游改写了已输出内容：整体替换
+                            if (typeof parsed.replace === 'string') {
+                                if (timing.firstToken === null) timing.firstToken = performance.now();
+                                fullContent = parsed.replace;
+                                renderer.replace(fullContent);
+                                continue;
+                            }
+                            
                             // 处理不同的数据格式
                             if (parsed.content) {
                                 // 直接content格式
@@ -881,9 +2009,9 @@ class ChatApp {
                             }
                             
                             if (content) {
+                                if (timing.firstToken === null) timing.firstToken = performance.now();
                                 fullContent += content;
-                                messageTextElement.textContent = fullContent;
-                                this.scrollToBottom();
+                                renderer.append(content);
                             }
                         } catch (e) {
                             console.warn('解析JSON失败:', e, '数据:', data);
@@ -892,12 +2020,75 @@ class ChatApp {
                 }
             }
         } catch (error) {
+            if (error.name === 'AbortError') {
+                // 用户开始了新问题，保留已显示的部分回答
+                console.log('流式响应已取消');
+                return;
+            }
             console.error('处理流式响应时出错:', error);
+            this.finishStreamRender(renderer, timing);
             messageTextElement.textContent = '响应处理出错，请重试';
+        } finally {
+            this.finishStreamRender(renderer, timing);
+            this.reportStreamTiming('chat', timing, renderer, fullContent);
+            if (this.activeChat && this.activeChat.requestId === response.requestId) {
+                this.activeChat = null;
+            }
+        }
+    }
+
+    createStreamTiming(response) {
+        return {
+            requestId: response.requestId,
+            startedAt: response.startedAt || performance.now(),
+            firstToken: null,
+            firstPaint: null
+        };
+    }
+
+    // 流结束：写入剩余内容并记录完成时间（之后的语音合成不计入）
+    finishStreamRender(renderer, timing) {
+        renderer.finish();
+        if (!timing.finishedAt) timing.finishedAt = performance.now();
+    }
+
+    createStreamRenderer(element, timing) {
+        return new StreamingMarkdownRenderer(element, {
+            onFirstPaint: () => { timing.firstPaint = performance.now(); },
+            onFlush: () => this.scrollToBottom()
+        });
+    }
+
+    // 上报本次回答的首个文本到达、首次绘制与完成耗时（毫秒），只上报实际输出了内容的回答
+    reportStreamTiming(kind, timing, renderer, content) {
+        if (timing.reported || timing.firstPaint === null) return;
+        timing.reported = true;
+        const payload = JSON.stringify({
+            kind,
+            request_id: timing.requestId,
+            first_token_ms: Math.round(timing.firstToken - timing.startedAt),
+            first_paint_ms: Math.round(timing.firstPaint - timing.startedAt),
+            total_ms: Math.round((timing.finishedAt || performance.now()) - timing.startedAt),
+            chars: content.length,
+            frames: renderer.frames
+        });
+        if (navigator.sendBeacon) {
+            navigator.sendBeacon('/api/metrics/client', new Blob([payload], { type: 'application/json' }));
+        } else {
+            fetch('/api/metrics/client', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: payload,
+                keepalive: true
+            }).catch(() => {});
         }
     }
 
     async requestTTS(text, messageElement) {
+        // 内置浏览器不允许自动播放，合成完成后以语音消息展示；其他浏览器边接收边播放
+        const player = this.isInAppBrowser ? null : this.startPlayback();
+        const controller = new AbortController();
+        this.ttsController = controller;
         try {
             const response = await fetch('/api/tts', {
                 method: 'POST',
@@ -905,32 +2096,31 @@ class ChatApp {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({
-                    text: text
-                })
+                    text: text,
+                    persona: this.persona || undefined
+                }),
+                signal: controller.signal
             });
 
-            if (response.ok) {
-                const audioBlob = await response.blob();
-                const audioUrl = URL.createObjectURL(audioBlob);
-                
-                // 根据浏览器环境选择不同的UI
-                if (this.isInAppBrowser) {
-                    this.addWeChatStyleVoiceMessage(messageElement, audioUrl, text);
-                } else {
-                    this.addAudioButton(messageElement, audioUrl);
-                    
-                    // 自动播放语音
-                    const audioBtn = messageElement.querySelector('.audio-btn');
-                    if (audioBtn) {
-                        // 延迟一小段时间确保按钮已添加
-                        setTimeout(() => {
-                            this.playAudio(audioUrl, audioBtn);
-                        }, 100);
-                    }
-                }
+            if (!response.ok) {
+                if (player) player.stop();
+                return;
+            }
+            if (!player) {
+                const audioUrl = URL.createObjectURL(await response.blob());
+                this.addWeChatStyleVoiceMessage(messageElement, audioUrl, text);
+                return;
+            }
+            await player.playResponse(response, controller);
+            // 被打断时不提供重播入口
+            if (!player.stopped && player.chunks.length) {
+                this.addAudioButton(messageElement, URL.createObjectURL(player.toBlob()));
             }
         } catch (error) {
+            if (error.name === 'AbortError') return; // 已被打断或新问题取消
             console.error('语音合成失败:', error);
+        } finally {
+            if (this.ttsController === controller) this.ttsController = null;
         }
     }
 
@@ -981,6 +2171,7 @@ class ChatApp {
 
     // 播放微信风格语音
     playWeChatVoice(audioUrl, iconElement) {
+        this.stopPlayback();
         // 停止当前播放的音频
         if (this.currentAudio) {
             this.currentAudio.pause();
@@ -1030,6 +2221,7 @@ class ChatApp {
     }
 
     playAudio(audioUrl, button) {
+        this.stopPlayback();
         // 停止当前播放的音频
         if (this.currentAudio) {
             this.currentAudio.pause();
@@ -1069,7 +2261,7 @@ class ChatApp {
         
         const avatarImg = document.createElement('img');
         avatarImg.className = 'message-avatar';
-        avatarImg.src = sender === 'user' ? 'static/images/user-avatar.svg' : 'resources/yaozhong.jpg';
+        avatarImg.src = assetUrl(sender === 'user' ? 'static/images/user-avatar.svg' : 'resources/yaozhong.jpg');
         avatarImg.alt = sender === 'user' ? '用户头像' : '耀忠头像';
         
         const contentDiv = document.createElement('div');
@@ -1098,7 +2290,12 @@ class ChatApp {
         } else {
             const textDiv = document.createElement('div');
             textDiv.className = 'message-text';
-            textDiv.textContent = text;
+            if (sender === 'assistant' && text !== '耀忠思考中...') {
+                // 与流式回答一致按Markdown显示（恢复的历史、欢迎语）
+                for (const node of StreamingMarkdownRenderer.render(text)) textDiv.appendChild(node);
+            } else {
+                textDiv.textContent = text;
+            }
             contentDiv.appendChild(textDiv);
             
             // 如果是"耀忠思考中"消息，添加动态省略号动画
@@ -1180,10 +2377,14 @@ class ChatApp {
 document.addEventListener('DOMContentLoaded', () => {
     const app = new ChatApp();
     
-    // 添加欢迎消息
-    setTimeout(() => {
-        app.initWelcomeMessage();
-    }, 1000);
+    // 恢复会话历史，没有历史时添加欢迎消息
+    app.loadHistory().then((restored) => {
+        if (!restored) {
+            setTimeout(() => {
+                app.initWelcomeMessage();
+            }, 1000);
+        }
+    });
 });
 
 // 处理页面可见性变化，暂停音频播放
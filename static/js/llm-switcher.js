@@ -3,7 +3,8 @@
  */
 class LLMSwitcher {
     constructor() {
-        this.currentProvider = 'volcano'; // 默认使用火山引擎
+        // 未显式选择时为 null：请求不携带提供商，由人设或服务端路由策略决定
+        this.currentProvider = null;
         this.init();
     }
 
@@ -20,10 +21,11 @@ class LLMSwitcher {
             <div class="llm-switcher">
                 <label for="llm-provider-select">LLM提供商:</label>
                 <select id="llm-provider-select" class="llm-provider-select">
+                    <option value="">自动</option>
                     <option value="volcano">火山引擎</option>
                     <option value="feishu_aily">飞书Aily</option>
                 </select>
-                <span class="provider-status" id="provider-status">火山引擎</span>
+                <span class="provider-status" id="provider-status">自动</span>
             </div>
         `;
 
@@ -88,7 +90,7 @@ class LLMSwitcher {
         // 绑定事件
         const select = document.getElementById('llm-provider-select');
         select.addEventListener('change', (e) => {
-            this.switchProvider(e.target.value);
+            this.switchProvider(e.target.value || null);
         });
     }
 
@@ -109,14 +111,17 @@ class LLMSwitcher {
 
         this.currentProvider = provider;
         
-        // 保存到localStorage
-        localStorage.setItem('llm_provider', provider);
+        // 保存到localStorage，选回“自动”时清除
+        if (provider) {
+            localStorage.setItem('llm_provider', provider);
+        } else {
+            localStorage.removeItem('llm_provider');
+        }
         
         // 更新状态显示
         this.updateStatus();
         
-        // 通知服务器切换提供商
-        this.notifyServerSwitch(provider);
+        // 提供商随每次聊天请求发送，无需通知服务器全局切换
         
         // 显示切换成功消息
         this.showSwitchMessage(provider);
@@ -130,55 +135,19 @@ class LLMSwitcher {
         };
         
         if (statusElement) {
-            statusElement.textContent = providerNames[this.currentProvider] || this.currentProvider;
-        }
-    }
-
-    async notifyServerSwitch(provider) {
-        try {
-            const response = await fetch('/api/switch-llm', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    provider: provider
-                })
-            });
-
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-
-            const result = await response.json();
-            console.log('LLM提供商切换成功:', result);
-        } catch (error) {
-            console.error('切换LLM提供商失败:', error);
-            // 如果服务器切换失败，恢复之前的设置
-            this.revertProvider();
+            statusElement.textContent = this.currentProvider
+                ? (providerNames[this.currentProvider] || this.currentProvider)
+                : '自动';
         }
     }
 
-    revertProvider() {
-        // 恢复到之前的提供商设置
-        const select = document.getElementById('llm-provider-select');
-        const previousProvider = this.currentProvider === 'volcano' ? 'feishu_aily' : 'volcano';
-        
-        this.currentProvider = previousProvider;
-        select.value = previousProvider;
-        localStorage.setItem('llm_provider', previousProvider);
-        this.updateStatus();
-        
-        this.showErrorMessage('切换失败，已恢复到之前的设置');
-    }
-
     showSwitchMessage(provider) {
         const providerNames = {
             'volcano': '火山引擎',
             'feishu_aily': '飞书Aily'
         };
         
-        this.showMessage(`已切换到 ${providerNames[provider]}`, 'success');
+        this.showMessage(provider ? `已切换到 ${providerNames[provider]}` : '已切换为自动选择', 'success');
     }
 
     showErrorMessage(message) {
@@ -240,6 +209,7 @@ class LLMSwitcher {
         }, 3000);
     }
 
+    /** 用户显式选择的提供商，未选择（自动）时返回 null */
     getCurrentProvider() {
         return this.currentProvider;
     }
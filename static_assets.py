@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静态资源管线
+首次请求页面或静态资源时计算内容哈希并预压缩（gzip/brotli），生成带指纹的URL与长期缓存响应，
+同时为图片生成WebP/AVIF变体，无需额外构建步骤；不提供页面的worker不做这些工作
+"""
+
+import os
+import re
+import io
+import gzip
+import json
+import hashlib
+import logging
+import mimetypes
+import threading
+from typing import Dict, Optional, Tuple
+from flask import Response, request
+from features import StaticAssetSettings, get_settings
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时仅提供gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# 值得压缩的文本类型
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# 可生成现代格式变体的图片类型
+CONVERTIBLE_IMAGE_TYPES = ('image/jpeg', 'image/png')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+_image_module = None
+
+
+def _pil_image():
+    """首次构建图片变体时才导入Pillow（可选依赖，导入较慢），未安装时返回None"""
+    global _image_module
+    if _image_module is None:
+        try:
+            from PIL import Image
+        except ImportError:  # 未安装时不生成WebP/AVIF变体
+            Image = False
+        _image_module = Image
+    return _image_module or None
+
+
+def parse_qvalues(header: str) -> Dict[str, float]:
+    """解析 Accept / Accept-Encoding 请求头，返回 {取值(小写): q值}；q值无效时视为0"""
+    values: Dict[str, float] = {}
+    for item in (header or '').split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = max(0.0, min(1.0, float(value.strip())))
+                except ValueError:
+                    q = 0.0
+        values[name] = q
+    return values
+
+
+class StaticAsset:
+    """单个静态资源及其预压缩/图片变体"""
+
+    def __init__(self, path: str, content: bytes, mimetype: str, settings: Optional[StaticAssetSettings] = None):
+        self.settings = settings or get_settings().static_assets
+        self.path = path
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(content).hexdigest()[:12]
+        base, ext = os.path.splitext(path)
+        self.fingerprinted_path = f"{base}.{self.digest}{ext}"
+        # (媒体类型, 编码) -> 内容
+        self.variants: Dict[Tuple[str, str], bytes] = {(mimetype, 'identity'): content}
+        self._precompress(mimetype, content)
+        if self.settings.image_variants and mimetype in CONVERTIBLE_IMAGE_TYPES:
+            self._build_image_variants(content)
+
+    def _precompress(self, mimetype: str, content: bytes):
+        if len(content) < self.settings.compress_min_size or not mimetype.startswith(COMPRESSIBLE_TYPES):
+            return
+        gzipped = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(gzipped) < len(content):
+            self.variants[(mimetype, 'gzip')] = gzipped
+        if brotli is not None:
+            compressed = brotli.compress(content, quality=11)
+            if len(compressed) < len(content):
+                self.variants[(mimetype, 'br')] = compressed
+
+    def _build_image_variants(self, content: bytes):
+        Image = _pil_image()
+        if Image is None:
+            return
+        for fmt, mimetype in (('AVIF', 'image/avif'), ('WEBP', 'image/webp')):
+            try:
+                with Image.open(io.BytesIO(content)) as img:
+                    buffer = io.BytesIO()
+                    img.save(buffer, format=fmt, quality=self.settings.image_quality)
+                data = buffer.getvalue()
+            except Exception as e:
+                logger.debug(f"生成{fmt}变体失败 {self.path}: {e}")
+                continue
+            if len(data) < len(content):
+                self.variants[(mimetype, 'identity')] = data
+                logger.info(f"生成图片变体 {self.path} -> {mimetype} ({len(content)} -> {len(data)} 字节)")
+
+    @property
+    def has_image_variants(self) -> bool:
+        return any(mimetype != self.mimetype for mimetype, _ in self.variants)
+
+    def select(self, accept: str, accept_encoding: str) -> Tuple[str, str, bytes]:
+        """按 Accept / Accept-Encoding 的q值选择最优变体，q=0 的格式与编码不会被选中
+
+        图片变体只在客户端显式声明该格式时使用（不按通配符 */* 推断）；
+        编码取q值最高的可用变体，q值相同时优先br。
+        """
+        mimetype = self.mimetype
+        accepted = parse_qvalues(accept)
+        formats = [c for c in ('image/avif', 'image/webp')
+                   if accepted.get(c, 0) > 0 and (c, 'identity') in self.variants]
+        if formats:
+            mimetype = max(formats, key=lambda c: accepted[c])
+        encodings = parse_qvalues(accept_encoding)
+        wildcard = encodings.get('*', 0.0)
+        best, best_q = 'identity', 0.0
+        for encoding in ('br', 'gzip'):
+            q = encodings.get(encoding, wildcard)
+            if q > best_q and (mimetype, encoding) in self.variants:
+                best, best_q = encoding, q
+        return mimetype, best, self.variants[(mimetype, best)]
+
+
+class StaticAssetPipeline:
+    """静态资源管线：内存中持有全部小型静态资源，按指纹URL提供长期缓存"""
+
+    def __init__(self, root: str, directories=('static', 'resources'), index_file: str = 'index.html',
+                 settings: Optional[StaticAssetSettings] = None):
+        self.settings = settings or get_settings().static_assets
+        self.root = root
+        self.directories = directories
+        self.index_file = index_file
+        self.assets: Dict[str, StaticAsset] = {}
+        self._by_fingerprint: Dict[str, StaticAsset] = {}
+        self.index_asset: Optional[StaticAsset] = None
+        self._built: Optional[bool] = None  # None 为尚未构建，False 为构建失败
+        self._build_lock = threading.Lock()
+
+    def ensure_built(self) -> bool:
+        """首次调用时构建（线程安全，只构建一次），返回管线是否可用；构建失败时调用方退回普通文件服务"""
+        if self._built is not None:
+            return self._built
+        with self._build_lock:
+            if self._built is None:
+                try:
+                    self.build()
+                    self._built = True
+                except Exception as e:
+                    logger.error(f"静态资源管线构建失败，退回普通文件服务: {e}")
+                    self._built = False
+            return self._built
+
+    def build(self):
+        """扫描资源目录，计算哈希、预压缩并重写 index.html 中的引用"""
+        for directory in self.directories:
+            base_dir = os.path.join(self.root, directory)
+            for dirpath, _, filenames in os.walk(base_dir):
+                for filename in filenames:
+                    fs_path = os.path.join(dirpath, filename)
+                    if os.path.getsize(fs_path) > self.settings.max_inmemory_size:
+                        continue
+                    rel_path = os.path.relpath(fs_path, self.root).replace(os.sep, '/')
+                    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                    with open(fs_path, 'rb') as f:
+                        asset = StaticAsset(rel_path, f.read(), mimetype, self.settings)
+                    self.assets[rel_path] = asset
+                    self._by_fingerprint[asset.fingerprinted_path] = asset
+        self._build_index()
+        logger.info(f"静态资源管线就绪: {len(self.assets)} 个资源，brotli={'启用' if brotli else '未安装'}，"
+                    f"图片变体={'启用' if self.settings.image_variants and _pil_image() else '未启用'}")
+
+    def url_for(self, path: str) -> str:
+        asset = self.assets.get(path.lstrip('/'))
+        return asset.fingerprinted_path if asset else path
+
+    def _build_index(self):
+        index_path = os.path.join(self.root, self.index_file)
+        with open(index_path, 'r', encoding='utf-8') as f:
+            html = f.read()
+
+        def _rewrite(match):
+            return f'{match.group(1)}="{self.url_for(match.group(2))}"'
+
+        html = re.sub(r'\b(href|src)="([^"]+)"', _rewrite, html)
+        # 注入资源清单，供前端脚本引用带指纹的URL
+        manifest = json.dumps({path: asset.fingerprinted_path for path, asset in sorted(self.assets.items())})
+        html = html.replace('</head>', f'    <script>window.ASSET_MANIFEST = {manifest};</script>\n</head>', 1)
+        self.index_asset = StaticAsset(self.index_file, html.encode('utf-8'), 'text/html', self.settings)
+
+    def lookup(self, path: str) -> Tuple[Optional[StaticAsset], bool]:
+        """根据请求路径查找资源，返回 (资源, 是否为带指纹的不可变URL)"""
+        asset = self._by_fingerprint.get(path)
+        if asset is not None:
+            return asset, True
+        return self.assets.get(path), False
+
+    def make_response(self, asset: StaticAsset, immutable: bool) -> Response:
+        """构造带协商与缓存头的响应"""
+        mimetype, encoding, body = asset.select(request.headers.get('Accept', ''),
+                                                request.headers.get('Accept-Encoding', ''))
+        etag = f'"{asset.digest}-{mimetype.split("/")[-1]}-{encoding}"'
+        headers = {
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+            'ETag': etag,
+            'Vary': 'Accept, Accept-Encoding' if asset.has_image_variants else 'Accept-Encoding'
+        }
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=304, headers=headers)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(body, mimetype=mimetype, headers=headers)
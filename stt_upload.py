@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音识别断点续传上传
+原始二进制分片按偏移量追加写入上传目录，边写边计算SHA-256，提交时校验后直接交给ASR。
+会话元数据与分片文件放在同一目录，进程重启或请求落到其他worker（共享上传目录）时从磁盘恢复会话
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# 从请求流读取数据的块大小，避免整段分片驻留内存
+STREAM_READ_SIZE = 64 * 1024
+# 上传会话ID格式（uuid4 hex），从磁盘恢复前校验，避免路径穿越
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """上传协议错误，status 为对应的HTTP状态码"""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        self.status = status
+        self.offset = offset
+        super().__init__(message)
+
+
+class UploadSession:
+    """单个断点续传上传会话"""
+
+    def __init__(self, upload_id: str, filename: str, part_path: str, total_size: Optional[int],
+                 created_at: Optional[float] = None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.part_path = part_path
+        self.total_size = total_size
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        self.created_at = created_at or time.time()
+        self.updated_at = self.created_at
+        self.lock = threading.Lock()
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.splitext(self.part_path)[0] + '.json'
+
+    def save_meta(self):
+        """写入会话元数据（先写临时文件再原子替换）；偏移量与SHA-256由分片文件本身决定，不在此保存"""
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'upload_id': self.upload_id, 'filename': self.filename,
+                       'total_size': self.total_size, 'created_at': self.created_at}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def sync_from_disk(self):
+        """分片文件大小与内存记录不一致时（其他worker写入过），按文件内容重算偏移量与SHA-256"""
+        size = os.path.getsize(self.part_path)
+        if size == self.offset:
+            return
+        hasher = hashlib.sha256()
+        with open(self.part_path, 'rb') as f:
+            for data in iter(lambda: f.read(STREAM_READ_SIZE), b''):
+                hasher.update(data)
+        self.offset = size
+        self.hasher = hasher
+        self.updated_at = os.path.getmtime(self.part_path)
+
+    def to_dict(self) -> Dict:
+        return {
+            'upload_id': self.upload_id,
+            'offset': self.offset,
+            'total_size': self.total_size,
+            'chunk_size': STT_UPLOAD_CHUNK_SIZE
+        }
+
+
+class ResumableUploadManager:
+    """断点续传上传会话管理
+
+    分片写入 <upload_folder>/partial/ 目录（不对外提供访问），提交后原子重命名到上传目录，
+    ASR服务即可通过公网URL拉取，无需二次拷贝。多worker部署时各worker需共享上传目录，
+    内存中没有的会话从 <upload_id>.json 恢复；同一上传的分片须顺序发送（偏移量不匹配时返回409）。
+    """
+
+    def __init__(self, upload_folder: str):
+        self.upload_folder = upload_folder
+        self.partial_folder = os.path.join(upload_folder, 'partial')
+        os.makedirs(self.partial_folder, exist_ok=True)
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename: str, total_size: Optional[int] = None) -> UploadSession:
+        """创建上传会话"""
+        self.cleanup_expired()
+        if total_size is not None and total_size < 0:
+            raise UploadError('size 必须为非负整数', 400)
+        if total_size is not None and total_size > STT_UPLOAD_MAX_SIZE:
+            raise UploadError(f'文件过大，超过{STT_UPLOAD_MAX_SIZE // (1024 * 1024)}MB限制', 413)
+        upload_id = uuid.uuid4().hex
+        part_path = os.path.join(self.partial_folder, f"{upload_id}.part")
+        open(part_path, 'wb').close()
+        session = UploadSession(upload_id, filename, part_path, total_size)
+        session.save_meta()
+        with self._lock:
+            self._sessions[upload_id] = session
+        logger.info(f"创建断点续传上传会话: {upload_id} 文件名={filename} 总大小={total_size}")
+        return session
+
+    def _load(self, upload_id: str) -> Optional[UploadSession]:
+        """从磁盘恢复会话（本进程重启过，或会话由其他worker创建）"""
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            return None
+        part_path = os.path.join(self.partial_folder, f"{upload_id}.part")
+        meta_path = os.path.join(self.partial_folder, f"{upload_id}.json")
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            session = UploadSession(upload_id, meta['filename'], part_path, meta.get('total_size'),
+                                    meta.get('created_at'))
+            session.sync_from_disk()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"上传会话元数据无法读取 {upload_id}: {e}")
+            return None
+        if time.time() - session.updated_at > STT_UPLOAD_TTL:
+            return None
+        logger.info(f"从磁盘恢复上传会话: {upload_id} 偏移={session.offset}")
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            session = self._load(upload_id)
+            if session is None:
+                raise UploadError('上传会话不存在或已过期', 404)
+            with self._lock:
+                session = self._sessions.setdefault(upload_id, session)
+            return session
+        with session.lock:
+            try:
+                session.sync_from_disk()
+            except FileNotFoundError:
+                # 其他worker已提交或放弃该上传
+                with self._lock:
+                    self._sessions.pop(upload_id, None)
+                raise UploadError('上传会话不存在或已过期', 404)
+        return session
+
+    def append(self, upload_id: str, offset: int, stream, expected_sha256: Optional[str] = None) -> UploadSession:
+        """在指定偏移量追加一个分片，分片从请求流边读边写
+
+        偏移量与服务端记录不一致时返回409及当前偏移量，客户端据此续传。
+        分片校验失败时回滚到分片写入前的位置。
+        """
+        session = self.get(upload_id)
+        with session.lock:
+            if offset != session.offset:
+                raise UploadError('偏移量不匹配', 409, session.offset)
+
+            chunk_hasher = hashlib.sha256() if expected_sha256 else None
+            file_hasher = session.hasher.copy()
+            written = 0
+            with open(session.part_path, 'r+b') as f:
+                f.seek(session.offset)
+                try:
+                    while True:
+                        data = stream.read(STREAM_READ_SIZE)
+                        if not data:
+                            break
+                        written += len(data)
+                        if session.offset + written > STT_UPLOAD_MAX_SIZE:
+                            raise UploadError(f'文件过大，超过{STT_UPLOAD_MAX_SIZE // (1024 * 1024)}MB限制', 413)
+                        f.write(data)
+                        file_hasher.update(data)
+                        if chunk_hasher:
+                            chunk_hasher.update(data)
+                except Exception:
+                    # 分片未完整写入（超限或客户端断开）时回滚，磁盘上只保留完整的分片
+                    f.truncate(session.offset)
+                    raise
+
+                if chunk_hasher and chunk_hasher.hexdigest() != expected_sha256.lower():
+                    f.truncate(session.offset)
+                    raise UploadError('分片校验失败', 422, session.offset)
+                f.truncate(session.offset + written)
+
+            session.offset += written
+            session.hasher = file_hasher
+            session.updated_at = time.time()
+            logger.debug(f"上传会话 {upload_id} 写入分片 {written} 字节，当前偏移 {session.offset}")
+            return session
+
+    def commit(self, upload_id: str, sha256: Optional[str] = None) -> str:
+        """提交上传：校验大小与SHA-256后移入上传目录，返回最终文件名"""
+        session = self.get(upload_id)
+        with session.lock:
+            if session.total_size is not None and session.offset != session.total_size:
+                raise UploadError('上传未完成', 409, session.offset)
+            if session.offset == 0:
+                raise UploadError('上传内容为空', 400, 0)
+            if sha256 and session.hasher.hexdigest() != sha256.lower():
+                raise UploadError('文件校验失败', 422, session.offset)
+
+            filename = f"{int(time.time())}_{session.upload_id[:8]}_{session.filename}"
+            final_path = os.path.join(self.upload_folder, filename)
+            os.replace(session.part_path, final_path)
+            self._remove_file(session.meta_path)
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            logger.info(f"断点续传上传完成: {final_path} 大小={session.offset}")
+            return filename
+
+    def abort(self, upload_id: str):
+        """放弃上传并删除分片文件"""
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+        if UPLOAD_ID_PATTERN.match(upload_id):
+            self._remove_files(upload_id)
+
+    def cleanup_expired(self):
+        """清理超过TTL未更新的上传会话（包括其他worker创建、已不在内存中的会话）"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if now - s.updated_at > STT_UPLOAD_TTL]
+            for session in expired:
+                self._sessions.pop(session.upload_id, None)
+        expired_ids = {session.upload_id for session in expired}
+        # 分片文件的修改时间即最近一次写入时间，各worker写入都会更新
+        for name in os.listdir(self.partial_folder):
+            upload_id, ext = os.path.splitext(name)
+            if ext != '.json' or upload_id in expired_ids:
+                continue
+            part_path = os.path.join(self.partial_folder, f"{upload_id}.part")
+            try:
+                if now - os.path.getmtime(part_path) > STT_UPLOAD_TTL:
+                    expired_ids.add(upload_id)
+            except FileNotFoundError:
+                expired_ids.add(upload_id)
+        for upload_id in expired_ids:
+            logger.info(f"清理过期上传会话: {upload_id}")
+            self._remove_files(upload_id)
+
+    def _remove_files(self, upload_id: str):
+        for ext in ('.part', '.json'):
+            self._remove_file(os.path.join(self.partial_folder, f"{upload_id}{ext}"))
+
+    @staticmethod
+    def _remove_file(path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"删除上传文件失败 {path}: {e}")
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""飞书Aily事件流与轮询两种模式：基于本地模拟服务，输出的文本应一致"""
+
+import threading
+
+import pytest
+import requests
+
+import aily_mock_server
+from feishu_aily_streaming_client import EventStreamUnavailable, FeishuAilyStreamingClient
+
+REPLY = '收到：你好。这是本地模拟服务生成的回复，用于联调流式输出。'
+
+
+@pytest.fixture
+def mock_aily(request):
+    """按参数 events 启动模拟服务，返回 (客户端, 服务地址)"""
+    server = aily_mock_server.create_server(port=0, events=request.param, chars_per_second=400)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    client = FeishuAilyStreamingClient()
+    client.base_url = base_url
+    client.polling_interval = 0.05
+    yield client, base_url
+    server.shutdown()
+    server.server_close()
+
+
+def stats(base_url):
+    return requests.get(f'{base_url}/__stats', timeout=5).json()
+
+
+@pytest.mark.parametrize('mock_aily', [True, False], indirect=True, ids=['events', 'polling'])
+def test_chat_stream_text_same_in_both_modes(mock_aily):
+    client, base_url = mock_aily
+    assert ''.join(client.chat_stream('你好')) == REPLY
+
+
+@pytest.mark.parametrize('mock_aily', [True], indirect=True, ids=['events'])
+def test_first_run_enables_event_stream(mock_aily):
+    client, base_url = mock_aily
+    assert client._event_stream_supported is None
+    ''.join(client.chat_stream('你好'))
+    assert client._event_stream_supported is True
+    assert stats(base_url)['run_events'] == 1
+
+
+@pytest.mark.parametrize('mock_aily', [False], indirect=True, ids=['polling'])
+def test_unsupported_event_stream_falls_back_to_polling(mock_aily):
+    client, base_url = mock_aily
+    assert ''.join(client.chat_stream('你好')) == REPLY
+    assert client._event_stream_supported is False
+    # 判定不支持后，重试间隔内的运行直接轮询
+    assert ''.join(client.chat_stream('你好')) == REPLY
+    assert stats(base_url)['run_events'] == 1
+
+
+def test_only_unsupported_status_disables_event_stream():
+    assert EventStreamUnavailable(404, 'HTTP 404').unsupported
+    assert EventStreamUnavailable(415, 'HTTP 415').unsupported
+    assert not EventStreamUnavailable(503, 'HTTP 503').unsupported
+    assert not EventStreamUnavailable(401, 'HTTP 401').unsupported
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""AilyMessageReader：按消息快照计算增量，非追加式改写输出 AilyContentReplace"""
+
+import pytest
+
+from feishu_aily_streaming_client import RETRYABLE_CODES, AilyAPIError, AilyContentReplace, AilyMessageReader
+
+
+def user_message(message_id, content='你好'):
+    return {'id': message_id, 'sender': {'sender_type': 'USER'}, 'content': content, 'status': 'COMPLETED'}
+
+
+def bot_message(content, status='IN_PROGRESS', message_id='bot-1'):
+    return {'id': message_id, 'sender': {'sender_type': 'ASSISTANT'}, 'content': content, 'status': status}
+
+
+class FakeClient:
+    """按顺序返回消息快照；run_id 过滤失败时抛出指定错误"""
+
+    def __init__(self, snapshots, run_filter_error=None):
+        self.snapshots = list(snapshots)
+        self.run_filter_error = run_filter_error
+        self.calls = []
+
+    def _list_messages(self, session_id, with_partial=False, run_id=None, page_size=None, deadline=None):
+        self.calls.append(run_id)
+        if run_id is not None and self.run_filter_error is not None:
+            raise self.run_filter_error
+        return {'messages': self.snapshots.pop(0)}
+
+
+def make_reader(snapshots=(), known=(), **client_options):
+    return AilyMessageReader(FakeClient(snapshots, **client_options), 'session', 'run', known_message_ids=known)
+
+
+def test_appended_content_yields_only_the_new_text():
+    reader = make_reader()
+    assert reader.apply([user_message('u1'), bot_message('你好')]) == '你好'
+    assert reader.apply([user_message('u1'), bot_message('你好，世界')]) == '，世界'
+    assert reader.apply([user_message('u1'), bot_message('你好，世界')]) is None
+    assert reader.content == '你好，世界'
+
+
+def test_rewritten_content_yields_replace_with_full_text():
+    reader = make_reader()
+    reader.apply([bot_message('正在查询天气')])
+    change = reader.apply([bot_message('今天北京晴')])
+    assert isinstance(change, AilyContentReplace)
+    assert change == '今天北京晴'
+    # 改写后继续追加时恢复输出增量
+    change = reader.apply([bot_message('今天北京晴，25度')])
+    assert change == '，25度' and not isinstance(change, AilyContentReplace)
+
+
+def test_shrunk_content_is_a_replace():
+    reader = make_reader()
+    reader.apply([bot_message('一二三四')])
+    change = reader.apply([bot_message('一二')])
+    assert isinstance(change, AilyContentReplace) and change == '一二'
+
+
+def test_known_messages_are_skipped_and_bot_message_is_pinned():
+    reader = make_reader(known={'old-bot'})
+    old = bot_message('上一轮的回答', status='COMPLETED', message_id='old-bot')
+    assert reader.apply([old, user_message('u1')]) is None
+    assert reader.apply([old, user_message('u1'), bot_message('新回答')]) == '新回答'
+    assert reader.bot_message_id == 'bot-1'
+    # 锁定后只按ID匹配，其他Bot消息不影响输出
+    other = bot_message('另一条', message_id='bot-2')
+    assert reader.apply([other, bot_message('新回答')]) is None
+
+
+def test_finished_requires_completed_message_with_content_or_final_run():
+    reader = make_reader()
+    reader.apply([bot_message('', status='COMPLETED')])
+    assert not reader.finished
+    reader.apply([bot_message('完成', status='COMPLETED')])
+    assert reader.finished
+
+    reader = make_reader()
+    reader.run_status = 'FAILED'
+    assert reader.finished
+
+
+def test_poll_falls_back_to_full_list_when_run_filter_unsupported():
+    reader = make_reader([[bot_message('a')], [bot_message('ab')]],
+                         run_filter_error=AilyAPIError(1254000, 'invalid param'))
+    assert reader.poll() == 'a'
+    assert reader.poll() == 'b'
+    assert reader.client.calls == ['run', None, None]
+
+
+def test_poll_reraises_retryable_errors():
+    code = next(iter(RETRYABLE_CODES))
+    reader = make_reader([[bot_message('a')]], run_filter_error=AilyAPIError(code, 'rate limited'))
+    with pytest.raises(AilyAPIError):
+        reader.poll()
+    assert reader._filter_by_run
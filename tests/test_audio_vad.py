@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""能量VAD：语音段边界、首尾余量、短促噪声与不支持的格式"""
+
+import math
+import random
+import wave
+
+import pytest
+
+from audio_vad import detect_speech, trim_wav_file
+
+RATE = 16000
+FRAME_MS = 30
+PADDING_MS = 200
+
+
+def noise(seconds, amplitude=30):
+    rng = random.Random(1)
+    return [int(rng.uniform(-amplitude, amplitude)) for _ in range(int(seconds * RATE))]
+
+
+def tone(seconds, amplitude=8000, freq=440):
+    return [int(amplitude * math.sin(2 * math.pi * freq * i / RATE)) for i in range(int(seconds * RATE))]
+
+
+def write_wav(path, samples, channels=1, width=2):
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(RATE)
+        if width == 2:
+            frames = b''.join(int(s).to_bytes(2, 'little', signed=True) for s in samples for _ in range(channels))
+        else:
+            frames = bytes(128 for _ in samples)
+        wav.writeframes(frames)
+    return str(path)
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wav:
+        return wav.getnchannels(), wav.getnframes()
+
+
+def test_leading_and_trailing_silence_trimmed_with_padding(tmp_path):
+    path = write_wav(tmp_path / 'a.wav', noise(2.0) + tone(1.0) + noise(1.5))
+    result = trim_wav_file(path, FRAME_MS, PADDING_MS)
+    assert result.analyzed and result.speech
+    assert result.original_seconds == pytest.approx(4.5)
+    # 保留语音段加前后余量，误差不超过一帧
+    assert result.kept_seconds == pytest.approx(1.0 + 2 * PADDING_MS / 1000, abs=2 * FRAME_MS / 1000)
+    assert result.trimmed_seconds == pytest.approx(4.5 - result.kept_seconds)
+    _, frames = read_wav(path)
+    assert frames / RATE == pytest.approx(result.kept_seconds)
+
+
+def test_padding_is_clamped_at_file_edges(tmp_path):
+    path = write_wav(tmp_path / 'a.wav', tone(1.0) + noise(2.0))
+    result = trim_wav_file(path, FRAME_MS, PADDING_MS)
+    assert result.kept_seconds == pytest.approx(1.0 + PADDING_MS / 1000, abs=2 * FRAME_MS / 1000)
+
+
+def test_speech_spanning_whole_file_is_left_untouched(tmp_path):
+    path = write_wav(tmp_path / 'a.wav', noise(0.1) + tone(2.0) + noise(0.1))
+    with open(path, 'rb') as f:
+        before = f.read()
+    result = trim_wav_file(path, FRAME_MS, PADDING_MS)
+    assert result.speech and result.trimmed_seconds == 0
+    with open(path, 'rb') as f:
+        assert f.read() == before
+
+
+def test_silence_only_reports_no_speech(tmp_path):
+    path = write_wav(tmp_path / 'a.wav', noise(3.0))
+    result = trim_wav_file(path, FRAME_MS, PADDING_MS)
+    assert result.analyzed and not result.speech
+    assert result.kept_seconds == 0
+
+
+def test_short_click_is_not_speech(tmp_path):
+    path = write_wav(tmp_path / 'a.wav', noise(1.0) + tone(0.06, amplitude=20000) + noise(1.0))
+    assert not trim_wav_file(path, FRAME_MS, PADDING_MS).speech
+
+
+def test_stereo_keeps_channel_layout(tmp_path):
+    path = write_wav(tmp_path / 'a.wav', noise(1.5) + tone(0.5) + noise(1.5), channels=2)
+    result = trim_wav_file(path, FRAME_MS, PADDING_MS)
+    channels, frames = read_wav(path)
+    assert channels == 2
+    assert frames / RATE == pytest.approx(result.kept_seconds)
+    assert result.kept_seconds < 1.5
+
+
+def test_unsupported_formats_pass_through(tmp_path):
+    eight_bit = write_wav(tmp_path / 'a.wav', noise(1.0), width=1)
+    assert not trim_wav_file(eight_bit).analyzed
+    garbage = tmp_path / 'b.wav'
+    garbage.write_bytes(b'ID3 not a wav file')
+    assert not trim_wav_file(str(garbage)).analyzed
+    assert garbage.read_bytes() == b'ID3 not a wav file'
+
+
+def test_detect_speech_boundaries_on_energies():
+    energies = [-90.0] * 10 + [-20.0] * 6 + [-90.0] * 10
+    assert detect_speech(energies, 30, 12, -50, 150) == (10, 16)
+    # 不足 min_speech_ms 的能量突起被忽略
+    assert detect_speech([-90.0] * 10 + [-20.0] * 3 + [-90.0] * 10, 30, 12, -50, 150) is None
+    assert detect_speech([], 30, 12, -50, 150) is None
+
+
+def test_detect_speech_loud_background_uses_absolute_floor():
+    # 整段都很响时底噪不可信，只按 min_db 判定
+    energies = [-30.0] * 20
+    assert detect_speech(energies, 30, 12, -50, 150) == (0, 20)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""缓存后端：进程内LRU、mmap共享缓存、RESP客户端与故障回退"""
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import cache_backend
+from cache_backend import CacheError, MemoryCache, MmapCache, NamespacedCache, RespCache, create_backend
+
+
+class FakeRespServer:
+    """socket级的最小RESP服务：支持 AUTH/SELECT/GET/SET [PX]/DEL/DBSIZE"""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.commands = []
+        self.connections = 0
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen()
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self.sock.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        reader = conn.makefile('rb')
+        authed = self.password is None
+        try:
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int(reader.readline()[1:-2])
+                    args.append(reader.read(length + 2)[:-2])
+                command = args[0].decode().upper()
+                self.commands.append(command)
+                if command == 'AUTH':
+                    authed = args[1].decode() == self.password
+                    conn.sendall(b'+OK\r\n' if authed else b'-ERR invalid password\r\n')
+                elif not authed:
+                    conn.sendall(b'-NOAUTH Authentication required.\r\n')
+                elif command == 'SELECT':
+                    conn.sendall(b'+OK\r\n')
+                elif command == 'SET':
+                    expire_at = None
+                    if len(args) > 3 and args[3].upper() == b'PX':
+                        expire_at = time.time() + int(args[4]) / 1000
+                    self.data[args[1]] = (args[2], expire_at)
+                    conn.sendall(b'+OK\r\n')
+                elif command == 'GET':
+                    value, expire_at = self.data.get(args[1], (None, None))
+                    if value is None or (expire_at is not None and expire_at <= time.time()):
+                        conn.sendall(b'$-1\r\n')
+                    else:
+                        conn.sendall(b'$%d\r\n%s\r\n' % (len(value), value))
+                elif command == 'DEL':
+                    conn.sendall(b':%d\r\n' % (1 if self.data.pop(args[1], None) else 0))
+                elif command == 'DBSIZE':
+                    conn.sendall(b':%d\r\n' % len(self.data))
+                else:
+                    conn.sendall(b'-ERR unknown command\r\n')
+        finally:
+            reader.close()
+            conn.close()
+
+
+@pytest.fixture
+def resp_server():
+    server = FakeRespServer()
+    yield server
+    server.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# ---- MemoryCache ----
+
+def test_memory_ttl_expiry():
+    cache = MemoryCache(max_bytes=1024, max_entries=10)
+    cache.set('short', b'v', ttl=0.05)
+    cache.set('forever', b'v')
+    assert cache.get('short') == b'v'
+    time.sleep(0.08)
+    assert cache.get('short') is None
+    assert cache.get('forever') == b'v'
+    assert cache.stats()['entries'] == 1
+
+
+def test_memory_lru_eviction_by_entries():
+    cache = MemoryCache(max_bytes=1024, max_entries=2)
+    cache.set('a', b'1')
+    cache.set('b', b'2')
+    cache.get('a')  # a 变为最近使用
+    cache.set('c', b'3')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1' and cache.get('c') == b'3'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_eviction_by_bytes_and_oversized_values():
+    cache = MemoryCache(max_bytes=100, max_entries=100)
+    assert cache.set('huge', b'x' * 26) is False  # 超过总容量的1/4
+    for i in range(5):
+        assert cache.set(f'k{i}', b'x' * 25)
+    stats = cache.stats()
+    assert stats['bytes'] <= 100
+    assert cache.get('k0') is None and cache.get('k4') is not None
+    cache.set('k4', b'y')
+    assert cache.stats()['bytes'] == 3 * 25 + 1
+
+
+# ---- MmapCache ----
+
+def test_mmap_roundtrip_ttl_and_delete(tmp_path):
+    cache = MmapCache(str(tmp_path / 'c.mmap'), size=4096, index_slots=64)
+    assert cache.set('k', b'value')
+    cache.set('t', b'soon', ttl=0.05)
+    assert cache.get('k') == b'value'
+    assert cache.get('t') == b'soon'
+    time.sleep(0.08)
+    assert cache.get('t') is None
+    cache.delete('k')
+    assert cache.get('k') is None
+    assert cache.set('big', b'x' * 2000) is False
+
+
+def test_mmap_wraparound_overwrites_oldest_records(tmp_path):
+    cache = MmapCache(str(tmp_path / 'c.mmap'), size=1024, index_slots=256)
+    for i in range(40):
+        assert cache.set(f'key{i}', bytes([i]) * 50)
+    stats = cache.stats()
+    assert stats['wrapped'] is True
+    assert stats['bytes'] <= 1024
+    assert cache.get('key0') is None
+    for i in range(36, 40):
+        assert cache.get(f'key{i}') == bytes([i]) * 50
+
+
+def test_mmap_shared_with_second_process(tmp_path):
+    path = str(tmp_path / 'c.mmap')
+    cache = MmapCache(path, size=4096, index_slots=64)
+    cache.set('shared', '来自父进程'.encode('utf-8'))
+    code = (
+        "import sys; from cache_backend import MmapCache\n"
+        f"cache = MmapCache({path!r}, size=4096, index_slots=64)\n"
+        "sys.stdout.write(cache.get('shared').decode('utf-8'))\n"
+        "cache.set('reply', b'child')\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, timeout=30,
+                            cwd=os.path.dirname(os.path.abspath(cache_backend.__file__)))
+    assert result.returncode == 0, result.stderr.decode()
+    assert result.stdout.decode('utf-8') == '来自父进程'
+    assert cache.get('reply') == b'child'
+
+
+def test_mmap_reinitializes_on_size_change(tmp_path):
+    path = str(tmp_path / 'c.mmap')
+    MmapCache(path, size=4096, index_slots=64).set('k', b'v')
+    assert MmapCache(path, size=8192, index_slots=64).get('k') is None
+
+
+# ---- RespCache ----
+
+def test_resp_get_set_ttl_delete(resp_server):
+    cache = RespCache(f'redis://127.0.0.1:{resp_server.port}/0', timeout=1, pool_size=2)
+    assert cache.set('k', b'\x00\r\nbinary')
+    assert cache.get('k') == b'\x00\r\nbinary'
+    assert cache.get('missing') is None
+    cache.set('t', b'v', ttl=0.05)
+    time.sleep(0.08)
+    assert cache.get('t') is None
+    cache.delete('k')
+    assert cache.get('k') is None
+    assert cache.stats()['available'] is True
+    assert resp_server.connections == 1  # 连接复用
+
+
+def test_resp_auth_and_select(resp_server):
+    resp_server.password = 'secret'
+    cache = RespCache(f'redis://:secret@127.0.0.1:{resp_server.port}/2', timeout=1)
+    assert cache.set('k', b'v')
+    assert resp_server.commands[:3] == ['AUTH', 'SELECT', 'SET']
+
+
+def test_resp_server_error_keeps_backend_up(resp_server):
+    resp_server.password = 'secret'
+    cache = RespCache(f'redis://127.0.0.1:{resp_server.port}', timeout=1)
+    with pytest.raises(CacheError):
+        cache.get('k')
+    assert cache._down_until == 0.0
+
+
+def test_resp_down_server_falls_back_to_miss(monkeypatch):
+    monkeypatch.setattr(cache_backend, 'CACHE_REDIS_RETRY_INTERVAL', 60)
+    backend = RespCache(f'redis://127.0.0.1:{free_port()}', timeout=0.5)
+    cache = NamespacedCache(backend, 'test')
+    assert cache.get('k') is None
+    assert cache.set('k', b'v') is False
+    assert cache.stats()['errors'] == 2
+    assert backend.stats()['connection_errors'] == 1  # 重试间隔内不再连接
+    assert backend.stats()['available'] is False
+
+
+def test_create_backend_falls_back_to_memory(monkeypatch):
+    def broken(*args, **kwargs):
+        raise OSError('read-only file system')
+
+    monkeypatch.setattr(cache_backend, 'MmapCache', broken)
+    assert isinstance(create_backend('mmap'), MemoryCache)
+    assert isinstance(create_backend('unknown'), MemoryCache)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""取消令牌回调、截止时间与按请求ID的注册表"""
+
+import threading
+import time
+
+import pytest
+
+from cancellation import CancellationRegistry, CancellationToken, Deadline, DeadlineExceeded
+
+
+# ---- Deadline ----
+
+def test_unbounded_deadline_uses_default_timeout():
+    deadline = Deadline()
+    assert deadline.remaining() is None
+    assert not deadline.expired
+    assert deadline.timeout(30) == 30
+
+
+def test_deadline_caps_timeout_at_remaining_time():
+    deadline = Deadline(0.5)
+    assert deadline.timeout(30) <= 0.5
+    assert deadline.timeout(0.1) == 0.1
+
+
+def test_expired_deadline_raises():
+    deadline = Deadline(0.02)
+    time.sleep(0.04)
+    assert deadline.expired
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout(30)
+    assert isinstance(DeadlineExceeded(), TimeoutError)
+
+
+# ---- CancellationToken ----
+
+def test_callbacks_run_once_on_cancel_in_order():
+    token = CancellationToken()
+    calls = []
+    token.add_callback(lambda: calls.append('close'))
+    token.add_callback(lambda: calls.append('abort'))
+    token.cancel('client_disconnect')
+    token.cancel('again')
+    token.set()
+    assert calls == ['close', 'abort']
+    assert token.cancelled and token.reason == 'client_disconnect'
+
+
+def test_callback_added_after_cancel_runs_immediately():
+    token = CancellationToken()
+    token.cancel()
+    calls = []
+    token.add_callback(lambda: calls.append(1))
+    assert calls == [1]
+
+
+def test_failing_callback_does_not_block_others():
+    token = CancellationToken()
+    calls = []
+
+    def broken():
+        raise OSError('already closed')
+
+    token.add_callback(broken)
+    token.add_callback(lambda: calls.append('ok'))
+    token.cancel()
+    assert calls == ['ok']
+
+
+def test_wait_wakes_up_on_cancel():
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel).start()
+    started = time.monotonic()
+    assert token.wait(5)
+    assert time.monotonic() - started < 1
+
+
+def test_concurrent_cancel_runs_callbacks_once():
+    token = CancellationToken()
+    calls = []
+    token.add_callback(lambda: calls.append(1))
+    threads = [threading.Thread(target=token.cancel) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+
+
+# ---- CancellationRegistry ----
+
+def test_registry_cancels_by_request_id_and_carries_deadline():
+    registry = CancellationRegistry()
+    token = registry.register('req-1', timeout=10)
+    assert 0 < token.deadline.remaining() <= 10
+    assert registry.cancel('req-1', 'user')
+    assert token.cancelled and token.reason == 'user'
+    assert not registry.cancel('missing')
+
+
+def test_resubmitted_request_supersedes_previous():
+    registry = CancellationRegistry()
+    first = registry.register('req')
+    second = registry.register('req')
+    assert first.reason == 'superseded'
+    assert not second.cancelled
+    registry.unregister(first)  # 旧令牌注销不影响新令牌
+    assert registry.active_count() == 1
+
+
+def test_guard_unregisters_when_stream_closes_early():
+    registry = CancellationRegistry()
+    token = registry.register()
+    stream = registry.guard(token, iter(['a', 'b', 'c']))
+    assert next(stream) == 'a'
+    stream.close()
+    assert registry.active_count() == 0
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""熔断器状态转换与对冲请求"""
+
+import threading
+import time
+
+import pytest
+
+from circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker, CircuitOpenError, hedged_call
+
+
+def make_breaker(**kwargs):
+    options = {'failure_threshold': 2, 'recovery_timeout': 0.1, 'slow_call_threshold': 0}
+    options.update(kwargs)
+    return CircuitBreaker('test', **options)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = make_breaker()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_late_success_does_not_close_open_breaker():
+    breaker = make_breaker(recovery_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    # 熔断前发出的请求迟到的成功
+    breaker.record_success(0.01)
+    assert breaker.state == STATE_OPEN
+
+
+def test_half_open_probe_success_closes():
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.15)
+    assert breaker.state == STATE_HALF_OPEN
+    # 没有探测在途时的成功不关闭
+    breaker.record_success()
+    assert breaker.state == STATE_HALF_OPEN
+    breaker.before_call()
+    assert breaker.is_open()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+
+
+def test_half_open_probe_failure_reopens():
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    time.sleep(0.15)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+
+
+def test_slow_success_counts_as_failure():
+    breaker = make_breaker(slow_call_threshold=0.05)
+    breaker.record_success(0.1)
+    breaker.record_success(0.1)
+    assert breaker.state == STATE_OPEN
+
+
+def _attempts(*behaviours):
+    """按调用顺序执行各次尝试的行为：(耗时, 结果或异常)"""
+    calls = []
+    lock = threading.Lock()
+
+    def func():
+        with lock:
+            index = len(calls)
+            calls.append(index)
+        delay, outcome = behaviours[min(index, len(behaviours) - 1)]
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return func, calls
+
+
+def test_fast_hedge_wins_over_slow_first_attempt():
+    func, calls = _attempts((1.5, 'slow'), (0.02, 'hedge'))
+    start = time.monotonic()
+    assert hedged_call(func, hedge_delay=0.1, max_attempts=2) == 'hedge'
+    assert time.monotonic() - start < 0.8
+    assert len(calls) == 2
+
+
+def test_fast_first_attempt_launches_no_hedge():
+    func, calls = _attempts((0.01, 'first'))
+    assert hedged_call(func, hedge_delay=0.2, max_attempts=2) == 'first'
+    time.sleep(0.3)
+    assert len(calls) == 1
+
+
+def test_first_error_falls_back_to_hedge_result():
+    func, calls = _attempts((0.3, IOError('down')), (0.05, 'hedge'))
+    assert hedged_call(func, hedge_delay=0.05, max_attempts=2) == 'hedge'
+
+
+def test_all_attempts_failing_raises_and_counts_once():
+    breaker = make_breaker(failure_threshold=5)
+    func, calls = _attempts((0.1, IOError('first')), (0.01, IOError('second')))
+    with pytest.raises(IOError):
+        hedged_call(func, hedge_delay=0.02, max_attempts=2, breaker=breaker)
+    assert len(calls) == 2
+    snapshot = breaker.snapshot()
+    assert snapshot['total_calls'] == 1 and snapshot['total_failures'] == 1
+
+
+def test_hedged_success_counts_one_breaker_outcome():
+    breaker = make_breaker()
+    func, calls = _attempts((0.3, 'slow'), (0.01, 'hedge'))
+    assert hedged_call(func, hedge_delay=0.05, max_attempts=2, breaker=breaker) == 'hedge'
+    assert breaker.snapshot()['total_calls'] == 1
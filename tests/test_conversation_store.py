@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""会话存储：键集分页与进程退出前写完队列"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from conversation_store import ConversationStore, TurnRecord
+from features import ConversationStoreSettings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_settings(db_path, **overrides):
+    options = dict(db_path=db_path, queue_size=1000, batch_size=50, flush_interval=0.01, history_max_limit=10)
+    options.update(overrides)
+    return ConversationStoreSettings(**options)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(settings=make_settings(str(tmp_path / 'c.db')))
+    for i in range(25):
+        store.record_turn(TurnRecord('conv', f'q{i}'))
+        if i % 5 == 0:
+            store.record_turn(TurnRecord('other', f'x{i}'))
+    assert store.flush()
+    return store
+
+
+def texts(page):
+    return [item['user_text'] for item in page['items']]
+
+
+def test_pages_walk_backwards_in_chronological_order(store):
+    page = store.history('conv', limit=10)
+    assert texts(page) == [f'q{i}' for i in range(15, 25)]
+    assert page['has_more'] and page['next_before'] == page['items'][0]['id']
+
+    page = store.history('conv', before=page['next_before'], limit=10)
+    assert texts(page) == [f'q{i}' for i in range(5, 15)]
+
+    page = store.history('conv', before=page['next_before'], limit=10)
+    assert texts(page) == [f'q{i}' for i in range(5)]
+    assert not page['has_more'] and page['next_before'] is None
+
+
+def test_exact_page_boundary_has_no_more(store):
+    first = store.history('conv', limit=5)
+    cursor = first['items'][0]['id']
+    rest = store.history('conv', before=cursor, limit=10)
+    rest = store.history('conv', before=rest['next_before'], limit=10)
+    assert len(rest['items']) == 10 and not rest['has_more']
+
+
+def test_limit_is_clamped(store):
+    assert len(store.history('conv', limit=1000)['items']) == 10
+    assert len(store.history('conv', limit=0)['items']) == 1
+
+
+def test_conversations_are_isolated_and_unknown_is_empty(store):
+    assert texts(store.history('other')) == ['x0', 'x5', 'x10', 'x15', 'x20']
+    assert store.history('missing') == {'items': [], 'has_more': False, 'next_before': None}
+
+
+def test_pages_are_stable_when_new_turns_arrive(store):
+    page = store.history('conv', limit=10)
+    store.record_turn(TurnRecord('conv', 'new'))
+    assert store.flush()
+    older = store.history('conv', before=page['next_before'], limit=10)
+    assert texts(older) == [f'q{i}' for i in range(5, 15)]
+
+
+def test_turns_without_conversation_are_not_recorded(tmp_path):
+    store = ConversationStore(settings=make_settings(str(tmp_path / 'c.db')))
+    store.record_turn(TurnRecord(None, 'anonymous'))
+    assert store._writer is None
+    assert store.close()
+
+
+def test_queued_batch_is_written_on_exit(tmp_path):
+    db_path = str(tmp_path / 'c.db')
+    # 攒批等待远长于进程存活时间：不在退出前写完就会丢失
+    code = (
+        "from conversation_store import ConversationStore, TurnRecord\n"
+        "from features import ConversationStoreSettings\n"
+        f"settings = ConversationStoreSettings({db_path!r}, 1000, 500, 2.0, 10)\n"
+        "store = ConversationStore(settings=settings)\n"
+        "for i in range(20):\n"
+        "    store.record_turn(TurnRecord('conv', f'q{i}'))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, timeout=30)
+    assert result.returncode == 0, result.stderr.decode()
+    count = sqlite3.connect(db_path).execute('SELECT COUNT(*) FROM turns').fetchone()[0]
+    assert count == 20
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""类型化设置的校验，以及线程池、写线程与静态资源的延迟创建"""
+
+import threading
+
+import config
+import features
+from conversation_store import ConversationStore, TurnRecord
+from features import ConversationStoreSettings, get_settings
+from health import SharedExecutor, health_monitor
+from static_assets import StaticAssetPipeline
+
+
+def test_settings_group_feature_parameters():
+    settings = get_settings()
+    assert settings.tts.longform_window == max(1, config.TTS_LONGFORM_WINDOW)
+    assert settings.voice_turn.tts_workers == max(1, config.VOICE_TURN_TTS_WORKERS)
+    assert settings.resilience.hedge_max_workers == max(1, config.HEDGE_MAX_WORKERS)
+    assert settings.conversation_store.db_path == config.CONVERSATION_DB_PATH
+
+
+def test_feature_settings_clamp_values_below_minimum(monkeypatch):
+    monkeypatch.setattr(config, 'TTS_LONGFORM_WORKERS', 0)
+    monkeypatch.setattr(config, 'HEDGE_MAX_ATTEMPTS', -3)
+    loaded = features._load_feature_settings()
+    assert loaded['tts'].longform_workers == 1
+    assert loaded['resilience'].hedge_max_attempts == 1
+
+
+def test_shared_executor_starts_threads_on_first_submit():
+    sizes = []
+    executor = SharedExecutor('test_lazy', lambda: sizes.append(2) or 2, 'test-lazy')
+    try:
+        assert not executor.started
+        assert sizes == []
+        assert health_monitor.queue_depths()['test_lazy'] == 0
+        assert executor.submit(lambda: threading.current_thread().name).result().startswith('test-lazy')
+        assert executor.started
+        assert sizes == [2]
+    finally:
+        executor.get().shutdown()
+        health_monitor._executors.pop('test_lazy', None)
+
+
+def test_conversation_writer_starts_on_first_record(tmp_path):
+    settings = ConversationStoreSettings(db_path=str(tmp_path / 'c.db'), queue_size=10, batch_size=5,
+                                         flush_interval=0.01, history_max_limit=10)
+    store = ConversationStore(settings=settings)
+    assert store._writer is None
+    store.record_turn(TurnRecord('conv', '你好'))
+    assert store._writer is not None and store._writer.is_alive()
+    assert store.flush()
+    assert [item['user_text'] for item in store.history('conv')['items']] == ['你好']
+
+
+def test_static_pipeline_builds_once_on_demand(tmp_path):
+    (tmp_path / 'static').mkdir()
+    (tmp_path / 'static' / 'app.js').write_text('console.log(1);\n' * 200)
+    (tmp_path / 'index.html').write_text('<html><head></head><script src="static/app.js"></script></html>')
+    pipeline = StaticAssetPipeline(str(tmp_path), directories=('static',))
+    assert pipeline.index_asset is None
+    assert pipeline.ensure_built()
+    asset = pipeline.assets['static/app.js']
+    assert asset.fingerprinted_path in pipeline.index_asset.variants[('text/html', 'identity')].decode()
+    assert pipeline.ensure_built()
+    assert pipeline.assets['static/app.js'] is asset
+
+
+def test_static_pipeline_build_failure_falls_back(tmp_path):
+    pipeline = StaticAssetPipeline(str(tmp_path), directories=('static',))
+    assert pipeline.ensure_built() is False
+    assert pipeline.ensure_built() is False
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""生成参数档位：自定义档位的校验、范围限定与请求参数优先级"""
+
+import json
+import logging
+
+from llm_usage import BUILTIN_PROFILES, PARAM_LIMITS, load_profiles, resolve_generation_params
+
+
+def test_custom_profile_values_are_clamped():
+    profiles = load_profiles(json.dumps({
+        'wild': {'temperature': 9, 'max_tokens': 10 ** 9, 'top_p': 5},
+        'low': {'temperature': -1, 'max_tokens': 0, 'top_p': 0},
+    }))
+    max_tokens = PARAM_LIMITS['max_tokens'][1]
+    assert profiles['wild'] == {'temperature': 2.0, 'max_tokens': max_tokens, 'top_p': 1.0}
+    assert profiles['low'] == {'temperature': 0.0, 'max_tokens': 1, 'top_p': 0.01}
+
+
+def test_invalid_and_unknown_values_are_ignored(caplog):
+    with caplog.at_level(logging.WARNING):
+        profiles = load_profiles(json.dumps({
+            'brief': {'temperature': 'hot', 'max_tokens': True, 'top_p': None, 'seed': 1, 'max_tokens ': 5},
+        }))
+    assert profiles['brief'] == BUILTIN_PROFILES['default']
+    assert 'seed' in caplog.text
+
+
+def test_non_object_spec_falls_back_to_builtin(caplog):
+    for spec in ('[1, 2]', '"voice"', '42', '{"brief": [0.3]}', '{not json'):
+        with caplog.at_level(logging.ERROR):
+            profiles = load_profiles(spec)
+        assert set(profiles) == set(BUILTIN_PROFILES)
+    assert 'GENERATION_PROFILES' in caplog.text
+
+
+def test_custom_profile_extends_builtin():
+    profiles = load_profiles('{"voice": {"top_p": 0.8}}')
+    assert profiles['voice'] == {**BUILTIN_PROFILES['voice'], 'top_p': 0.8}
+
+
+def test_request_overrides_are_clamped_and_capped_by_persona():
+    params = resolve_generation_params(None, 'text', {'temperature': '0.5', 'max_tokens': 10 ** 9, 'top_p': 3},
+                                       {'max_tokens': 64})
+    assert params['temperature'] == 0.5
+    assert params['max_tokens'] == 64
+    assert params['top_p'] == 1.0
+    assert params['profile'] == 'default'
+
+
+def test_voice_input_uses_voice_profile():
+    params = resolve_generation_params('missing', 'voice', {'temperature': 'bad'})
+    assert params['profile'] == 'voice'
+    assert params['temperature'] == BUILTIN_PROFILES['voice']['temperature']
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""人设注册表：热加载、无效文件保留上一版本与文件删除回退"""
+
+import json
+import os
+
+import pytest
+
+from personas import PersonaConfigError, PersonaRegistry, builtin_persona, parse_personas
+
+
+def write(path, content, mtime):
+    path.write_text(content if isinstance(content, str) else json.dumps(content), encoding='utf-8')
+    # 显式设置修改时间，避免同一秒内多次写入 mtime 不变
+    os.utime(path, (mtime, mtime))
+
+
+VALID = {'default': 'tutor', 'personas': {'tutor': {'system_prompt': '你是老师', 'temperature': '0.3'}}}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / 'personas.json'
+
+
+def make_registry(path):
+    return PersonaRegistry(str(path), check_interval=0, default_name='')
+
+
+def test_missing_file_uses_builtin_persona(path):
+    registry = make_registry(path)
+    assert registry.resolve().name == 'default'
+    assert registry.snapshot()['last_error'] is None
+
+
+def test_valid_file_is_loaded_with_types_cast(path):
+    write(path, VALID, 1000)
+    registry = make_registry(path)
+    tutor = registry.resolve()
+    assert tutor.name == 'tutor' and tutor.temperature == 0.3
+    assert registry.resolve('default') is not None
+    assert registry.resolve('missing') is None
+
+
+@pytest.mark.parametrize('content', [
+    '{"personas": {',
+    {'personas': []},
+    {'personas': {'tutor': {'system_prompt': 'x', 'mood': 'happy'}}},
+    {'personas': {'tutor': {'system_prompt': 'x', 'max_tokens': 'many'}}},
+    {'default': 'ghost', 'personas': {'tutor': {'system_prompt': 'x'}}},
+])
+def test_invalid_file_keeps_previous_version(path, content):
+    write(path, VALID, 1000)
+    registry = make_registry(path)
+    version = registry.snapshot()['version']
+
+    write(path, content, 2000)
+    assert registry.resolve().name == 'tutor'
+    snapshot = registry.snapshot()
+    assert snapshot['version'] == version
+    assert snapshot['last_error']
+
+
+def test_invalid_file_is_not_reparsed_until_it_changes(path, monkeypatch):
+    write(path, VALID, 1000)
+    registry = make_registry(path)
+    write(path, '{broken', 2000)
+    registry.resolve()
+    calls = []
+    monkeypatch.setattr('personas.parse_personas', lambda *args: calls.append(args))
+    registry.resolve()
+    registry.resolve()
+    assert calls == []
+
+
+def test_fixed_file_is_picked_up_and_clears_error(path):
+    write(path, VALID, 1000)
+    registry = make_registry(path)
+    write(path, '{broken', 2000)
+    registry.resolve()
+    fixed = {'personas': {'tutor': {'system_prompt': '新提示词'}, 'guide': {'system_prompt': '导游'}}}
+    write(path, fixed, 3000)
+    assert registry.resolve('tutor').system_prompt == '新提示词'
+    assert registry.resolve('guide') is not None
+    assert registry.snapshot()['last_error'] is None
+
+
+def test_deleted_file_falls_back_to_builtin(path):
+    write(path, VALID, 1000)
+    registry = make_registry(path)
+    path.unlink()
+    assert registry.resolve().name == 'default'
+    assert registry.resolve('tutor') is None
+
+
+def test_reload_is_throttled_by_check_interval(path):
+    write(path, VALID, 1000)
+    registry = PersonaRegistry(str(path), check_interval=60, default_name='')
+    write(path, {'personas': {'guide': {'system_prompt': '导游'}}}, 2000)
+    assert registry.resolve('guide') is None
+    assert registry.reload()
+    assert registry.resolve('guide') is not None
+
+
+def test_parse_personas_rejects_non_object_entry():
+    with pytest.raises(PersonaConfigError):
+        parse_personas({'personas': {'tutor': 'x'}}, builtin_persona())
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""上游重试：错误分类（幂等/非幂等写）、退避次数与截止时间截断"""
+
+import threading
+import time
+
+import pytest
+import requests
+
+from cancellation import Deadline, DeadlineExceeded
+from circuit_breaker import CircuitOpenError
+from retry import RetryPolicy, is_retryable, is_retryable_unsent, retry_call, retry_snapshots
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f'{status}', response=response)
+
+
+class BusinessError(Exception):
+    def __init__(self, retryable=False, rejected=False):
+        super().__init__('business')
+        self.retryable = retryable
+        self.rejected = rejected
+
+
+@pytest.mark.parametrize('error, idempotent, unsent', [
+    (requests.ConnectTimeout(), True, True),
+    (requests.ReadTimeout(), True, False),
+    (requests.ConnectionError(), True, False),
+    (requests.exceptions.ChunkedEncodingError(), True, False),
+    (http_error(429), True, True),
+    (http_error(503), True, True),
+    (http_error(500), True, False),
+    (http_error(504), True, False),
+    (http_error(400), False, False),
+    (http_error(404), False, False),
+    (BusinessError(retryable=True), True, False),
+    (BusinessError(rejected=True), False, True),
+    (ValueError('bad'), False, False),
+])
+def test_error_classification(error, idempotent, unsent):
+    assert is_retryable(error) is idempotent
+    assert is_retryable_unsent(error) is unsent
+
+
+@pytest.mark.parametrize('error', [CircuitOpenError('llm', 1.0), DeadlineExceeded()])
+def test_circuit_open_and_deadline_are_never_retried(error):
+    # DeadlineExceeded 是 TimeoutError，但不能被当作网络超时重试
+    error.retryable = True
+    error.rejected = True
+    assert not is_retryable(error)
+    assert not is_retryable_unsent(error)
+
+
+def flaky(failures, error_factory=requests.ConnectionError):
+    calls = []
+
+    def func():
+        calls.append(time.monotonic())
+        if len(calls) <= failures:
+            raise error_factory()
+        return 'ok'
+    return func, calls
+
+
+FAST = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.001)
+
+
+def test_recovers_after_transient_failures():
+    func, calls = flaky(2)
+    assert retry_call(func, 'test_recover', FAST) == 'ok'
+    assert len(calls) == 3
+    assert retry_snapshots()['test_recover'] == {'calls': 1, 'retries': 2, 'recovered': 1, 'failed': 0}
+
+
+def test_gives_up_after_max_attempts():
+    func, calls = flaky(10)
+    with pytest.raises(requests.ConnectionError):
+        retry_call(func, 'test_exhaust', FAST)
+    assert len(calls) == 3
+    assert retry_snapshots()['test_exhaust']['failed'] == 1
+
+
+def test_non_retryable_error_raises_immediately():
+    func, calls = flaky(1, lambda: http_error(400))
+    with pytest.raises(requests.HTTPError):
+        retry_call(func, 'test_fatal', FAST)
+    assert len(calls) == 1
+
+
+def test_unsent_classifier_does_not_retry_read_timeout():
+    func, calls = flaky(1, requests.ReadTimeout)
+    with pytest.raises(requests.ReadTimeout):
+        retry_call(func, 'test_write', FAST, retryable=is_retryable_unsent)
+    assert len(calls) == 1
+
+
+def test_backoff_longer_than_remaining_deadline_raises_last_error():
+    # 退避至少1秒，截止时间只剩0.2秒：不等待，直接抛出最近一次错误
+    policy = RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=1.0)
+    policy.backoff = lambda attempt: 1.0
+    func, calls = flaky(10)
+    started = time.monotonic()
+    with pytest.raises(requests.ConnectionError):
+        retry_call(func, 'test_deadline_cut', policy, deadline=Deadline(0.2))
+    assert len(calls) == 1
+    assert time.monotonic() - started < 0.2
+
+
+def test_expired_deadline_stops_before_next_attempt():
+    policy = RetryPolicy(max_attempts=10, base_delay=0.05, max_delay=0.05)
+    policy.backoff = lambda attempt: 0.05
+    func, calls = flaky(100)
+    with pytest.raises((DeadlineExceeded, requests.ConnectionError)):
+        retry_call(func, 'test_deadline_expire', policy, deadline=Deadline(0.12))
+    # 每次退避0.05秒，0.12秒内最多尝试3次
+    assert 1 < len(calls) <= 3
+
+
+def test_already_expired_deadline_never_calls():
+    deadline = Deadline(0)
+    func, calls = flaky(0)
+    with pytest.raises(DeadlineExceeded):
+        retry_call(func, 'test_expired', FAST, deadline=deadline)
+    assert calls == []
+
+
+def test_cancel_event_interrupts_backoff():
+    policy = RetryPolicy(max_attempts=3, base_delay=5.0, max_delay=5.0)
+    policy.backoff = lambda attempt: 5.0
+    cancel_event = threading.Event()
+    threading.Timer(0.05, cancel_event.set).start()
+    func, calls = flaky(10)
+    started = time.monotonic()
+    with pytest.raises(requests.ConnectionError):
+        retry_call(func, 'test_cancel', policy, cancel_event=cancel_event)
+    assert len(calls) == 1
+    assert time.monotonic() - started < 1
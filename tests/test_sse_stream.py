@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""SSE输出层：文本微批合并、控制帧、空闲心跳与客户端断开时取消上游"""
+
+import json
+import threading
+import time
+
+from sse_stream import DONE_FRAME, HEARTBEAT_FRAME, stream_sse
+
+
+def frames_of(output):
+    """把输出拆成SSE帧（每帧以空行结束）"""
+    return [frame + '\n\n' for frame in ''.join(output).split('\n\n') if frame]
+
+
+def text_of(frame):
+    return json.loads(frame[len('data: '):])['choices'][0]['delta']['content']
+
+
+def test_text_deltas_within_interval_are_merged():
+    output = list(stream_sse(iter(['你', '好', '', '世界']), batch_interval=1.0, heartbeat_interval=10))
+    frames = frames_of(output)
+    assert [text_of(frame) for frame in frames[:-1]] == ['你好世界']
+    assert frames[-1] == DONE_FRAME
+
+
+def test_batch_flushes_when_byte_limit_reached():
+    output = list(stream_sse(iter(['ab', 'cd', 'ef']), batch_interval=10, batch_max_bytes=4,
+                             heartbeat_interval=10))
+    assert [text_of(frame) for frame in frames_of(output)[:-1]] == ['abcd', 'ef']
+
+
+def test_batching_disabled_sends_each_delta():
+    output = list(stream_sse(iter(['a', 'b']), batch_interval=0, heartbeat_interval=10))
+    assert [text_of(frame) for frame in frames_of(output)[:-1]] == ['a', 'b']
+
+
+def test_batch_flushes_after_interval():
+    def events():
+        yield 'a'
+        time.sleep(0.2)
+        yield 'b'
+
+    output = list(stream_sse(events(), batch_interval=0.05, heartbeat_interval=10))
+    assert [text_of(frame) for frame in frames_of(output)[:-1]] == ['a', 'b']
+
+
+def test_control_frame_flushes_pending_text_first():
+    output = list(stream_sse(iter(['部分', {'replace': '整体替换'}, '追加']), batch_interval=10,
+                             heartbeat_interval=10))
+    frames = frames_of(output)
+    assert text_of(frames[0]) == '部分'
+    assert json.loads(frames[1][len('data: '):]) == {'replace': '整体替换'}
+    assert text_of(frames[2]) == '追加'
+    assert frames[3] == DONE_FRAME
+
+
+def test_heartbeat_sent_while_upstream_idle():
+    def events():
+        time.sleep(0.35)
+        yield 'done'
+
+    frames = frames_of(stream_sse(events(), batch_interval=0, heartbeat_interval=0.1))
+    heartbeats = frames.count(HEARTBEAT_FRAME)
+    assert heartbeats >= 2
+    assert frames.index(HEARTBEAT_FRAME) < frames.index(next(f for f in frames if f.startswith('data: {')))
+    assert frames[-1] == DONE_FRAME
+
+
+def test_upstream_error_becomes_error_frame():
+    def events():
+        yield 'a'
+        raise RuntimeError('boom')
+
+    frames = frames_of(stream_sse(events(), batch_interval=0, heartbeat_interval=10))
+    assert json.loads(frames[1][len('data: '):])['error']['type'] == 'server_error'
+    assert frames[-1] == DONE_FRAME
+
+
+def test_client_disconnect_cancels_and_closes_upstream():
+    closed = threading.Event()
+    produced = []
+
+    def events():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield f'{i} '
+                time.sleep(0.01)
+        finally:
+            closed.set()
+
+    cancel_event = threading.Event()
+    stream = stream_sse(events(), cancel_event, batch_interval=0, heartbeat_interval=10, buffer_size=2)
+    next(stream)
+    stream.close()  # 客户端断开：生成器收到 GeneratorExit
+    assert cancel_event.is_set()
+    assert closed.wait(2)
+    stopped_at = len(produced)
+    time.sleep(0.1)
+    assert len(produced) == stopped_at < 1000
+
+
+def test_external_cancel_ends_stream_with_done():
+    cancel_event = threading.Event()
+
+    def events():
+        while True:
+            yield 'x'
+            time.sleep(0.01)
+
+    stream = stream_sse(events(), cancel_event, batch_interval=0, heartbeat_interval=10)
+    next(stream)
+    cancel_event.set()
+    rest = list(stream)
+    assert rest[-1].endswith(DONE_FRAME)
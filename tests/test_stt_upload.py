@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""断点续传上传：会话从磁盘恢复、多worker共享上传目录、分片回滚"""
+
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+import stt_upload
+from stt_upload import ResumableUploadManager, UploadError
+
+
+class BrokenStream:
+    """读出一部分数据后模拟客户端断开"""
+
+    def __init__(self, data):
+        self.data = io.BytesIO(data)
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        if self.reads > 1:
+            raise IOError('client disconnected')
+        return self.data.read(4)
+
+
+def test_session_survives_restart(tmp_path):
+    first = ResumableUploadManager(str(tmp_path))
+    session = first.create('a.wav', 6)
+    first.append(session.upload_id, 0, io.BytesIO(b'abc'))
+
+    restarted = ResumableUploadManager(str(tmp_path))
+    resumed = restarted.get(session.upload_id)
+    assert resumed.offset == 3
+    assert resumed.total_size == 6
+    restarted.append(session.upload_id, 3, io.BytesIO(b'def'))
+    filename = restarted.commit(session.upload_id, hashlib.sha256(b'abcdef').hexdigest())
+
+    with open(os.path.join(str(tmp_path), filename), 'rb') as f:
+        assert f.read() == b'abcdef'
+    assert os.listdir(os.path.join(str(tmp_path), 'partial')) == []
+
+
+def test_workers_sharing_folder_see_each_others_progress(tmp_path):
+    worker_a = ResumableUploadManager(str(tmp_path))
+    worker_b = ResumableUploadManager(str(tmp_path))
+    session = worker_a.create('a.wav')
+    worker_a.append(session.upload_id, 0, io.BytesIO(b'12'))
+    worker_b.append(session.upload_id, 2, io.BytesIO(b'34'))
+
+    with pytest.raises(UploadError) as error:
+        worker_a.append(session.upload_id, 2, io.BytesIO(b'xx'))
+    assert error.value.status == 409 and error.value.offset == 4
+
+    worker_a.append(session.upload_id, 4, io.BytesIO(b'56'))
+    worker_b.commit(session.upload_id, hashlib.sha256(b'123456').hexdigest())
+    with pytest.raises(UploadError) as error:
+        worker_a.get(session.upload_id)
+    assert error.value.status == 404
+
+
+def test_interrupted_chunk_is_rolled_back(tmp_path):
+    manager = ResumableUploadManager(str(tmp_path))
+    session = manager.create('a.wav')
+    manager.append(session.upload_id, 0, io.BytesIO(b'ok'))
+    with pytest.raises(IOError):
+        manager.append(session.upload_id, 2, BrokenStream(b'partial-data'))
+    assert os.path.getsize(session.part_path) == 2
+    assert ResumableUploadManager(str(tmp_path)).get(session.upload_id).offset == 2
+
+
+def test_unknown_or_malformed_ids_are_not_found(tmp_path):
+    manager = ResumableUploadManager(str(tmp_path))
+    for upload_id in ('0' * 32, '../secret', 'nope'):
+        with pytest.raises(UploadError) as error:
+            manager.get(upload_id)
+        assert error.value.status == 404
+
+
+def test_negative_size_is_rejected(tmp_path):
+    with pytest.raises(UploadError) as error:
+        ResumableUploadManager(str(tmp_path)).create('a.wav', -1)
+    assert error.value.status == 400
+
+
+def test_cleanup_removes_expired_sessions_created_elsewhere(tmp_path):
+    other = ResumableUploadManager(str(tmp_path))
+    session = other.create('a.wav')
+    stale = time.time() - stt_upload.STT_UPLOAD_TTL - 10
+    os.utime(session.part_path, (stale, stale))
+
+    ResumableUploadManager(str(tmp_path)).cleanup_expired()
+    assert os.listdir(os.path.join(str(tmp_path), 'partial')) == []
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""语音轮次：分句、按序下发音频与每轮合成窗口"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from voice_turn import SentenceSegmenter, VoiceTurnPipeline
+
+SENTENCES = [f'这是第{i}句比较完整的回答。' for i in range(8)]
+
+
+class FakeSynth:
+    """记录同时在合成的句子数"""
+
+    def __init__(self, delay=0.03):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.calls.append(text)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return text.encode('utf-8')
+
+
+def test_segmenter_cuts_on_sentence_end_and_flushes_tail():
+    segmenter = SentenceSegmenter(max_chars=50, first_chars=50, min_chars=2)
+    assert segmenter.feed('你好') == []
+    assert segmenter.feed('，世界。今天') == ['你好，世界。']
+    assert segmenter.flush() == ['今天']
+
+
+def test_audio_in_order_and_window_bounded():
+    synth = FakeSynth()
+    executor = ThreadPoolExecutor(max_workers=8)
+    pipeline = VoiceTurnPipeline(synth, executor=executor, window=2)
+    events = list(pipeline.stream(iter([''.join(SENTENCES)]), threading.Event()))
+    audio = [e for e in events if isinstance(e, dict) and e.get('type') == 'audio']
+    assert [e['index'] for e in audio] == list(range(len(SENTENCES)))
+    assert [e['text'] for e in audio] == SENTENCES
+    assert synth.peak <= 2
+    executor.shutdown()
+
+
+def test_closing_stream_drops_pending_sentences():
+    synth = FakeSynth(delay=0.1)
+    executor = ThreadPoolExecutor(max_workers=8)
+    pipeline = VoiceTurnPipeline(synth, executor=executor, window=2)
+    stream = pipeline.stream(iter([''.join(SENTENCES)]), threading.Event())
+    for event in stream:
+        if isinstance(event, dict) and event.get('type') == 'audio':
+            break
+    stream.close()
+    time.sleep(0.3)
+    assert len(synth.calls) < len(SENTENCES)
+    executor.shutdown()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+火山引擎语音合成客户端
+V3单向流式合成接口，支持声音复刻音色；合成结果按文本与音色参数缓存。
+独立成模块，命令行预渲染等场景只需构造该客户端，不必加载整个服务
+"""
+
+import copy
+import json
+import time
+import base64
+import logging
+from config import *
+from cache_backend import get_cache
+from http_session import create_http_session
+from logging_setup import sample_log
+from profiling import upstream_span
+from tts_store import TTSAudioStore
+
+logger = logging.getLogger(__name__)
+
+
+class VolcanoTTSClient:
+    """火山引擎语音合成客户端 - V3版本支持声音复刻"""
+    
+    def __init__(self):
+        self.app_id = VOICE_APP_ID
+        self.access_token = VOICE_ACCESS_TOKEN
+        self.voice_type = TTS_VOICE_TYPE  # 从环境变量读取音色ID
+        self.speech_rate = TTS_SPEECH_RATE
+        # 使用V3版本API端点
+        self.api_url = "https://openspeech.bytedance.com/api/v3/tts/unidirectional"
+        # 合成结果缓存（按文本与音色参数），各worker共享，重复的回答/句子不再重复合成
+        self.audio_cache = get_cache('tts_audio')
+        # 各人设的音色视图共用同一会话与连接池
+        self.session = create_http_session(name='volcano_tts')
+
+    def with_voice(self, voice_type=None, speech_rate=None):
+        """返回使用指定音色/语速的客户端视图（浅拷贝，凭据与配置共用），供各人设使用"""
+        voice_type = voice_type or self.voice_type
+        speech_rate = self.speech_rate if speech_rate is None else speech_rate
+        if voice_type == self.voice_type and speech_rate == self.speech_rate:
+            return self
+        voice = copy.copy(self)
+        voice.voice_type = voice_type
+        voice.speech_rate = speech_rate
+        return voice
+
+    def cache_params(self):
+        """影响合成结果的参数，作为预渲染音频库键的一部分"""
+        return {
+            'speaker': self.voice_type,
+            'resource_id': TTS_RESOURCE_ID,
+            'speech_rate': self.speech_rate,
+            'format': 'mp3',
+            'sample_rate': 24000
+        }
+    
+    def synthesize(self, text):
+        """语音合成，优先返回缓存的音频"""
+        if TTS_CACHE_TTL <= 0:
+            with upstream_span('volcano_tts.synthesize'):
+                return self._synthesize(text)
+        key = TTSAudioStore.make_key(text, self.cache_params())
+        audio = self.audio_cache.get(key)
+        if audio is not None:
+            return audio
+        with upstream_span('volcano_tts.synthesize'):
+            audio = self._synthesize(text)
+        if audio:
+            self.audio_cache.set(key, audio, TTS_CACHE_TTL)
+        return audio
+    
+    def _synthesize(self, text):
+        """语音合成 - V3版本"""
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Api-App-Id': self.app_id,
+            'X-Api-Access-Key': self.access_token,
+            'X-Api-Resource-Id': TTS_RESOURCE_ID,  # 从环境变量读取资源ID
+            'X-Api-Request-Id': str(int(time.time() * 1000))
+        }
+        
+        payload = {
+            'user': {
+                'uid': 'user_001'
+            },
+            'namespace': 'BidirectionalTTS',
+            'req_params': {
+                'text': text,
+                'speaker': self.voice_type,  # 使用声音复刻音色ID
+                'audio_params': {
+                    'format': 'mp3',
+                    'sample_rate': 24000,
+                    'speech_rate': self.speech_rate,  # 语速（默认取配置常量，人设可覆盖）
+                    'loudness_rate': 0  # 音量，取值范围[-50,100]
+                }
+            }
+        }
+        
+        try:
+            response = self.session.post(
+                self.api_url,
+                headers=headers,
+                json=payload,
+                timeout=30,
+                stream=True  # 启用流式响应
+            )
+            response.raise_for_status()
+            
+            # 处理流式响应 - V3版本返回多个JSON对象
+            audio_data_parts = []
+            
+            for line in response.iter_lines():
+                if line:
+                    line_str = line.decode('utf-8').strip()
+                    if not line_str:
+                        continue
+                        
+                    try:
+                        result = json.loads(line_str)
+                        if sample_log(logger, 'tts.line'):
+                            # 不记录base64音频本身，只记录状态与长度
+                            logger.debug(f"TTS流式响应: code={result.get('code')} message={result.get('message')} 音频长度={len(result.get('data') or '')}")
+                        
+                        # 检查是否有音频数据
+                        if result.get('data') and isinstance(result['data'], str):
+                            # 收集base64音频数据
+                            audio_data_parts.append(result['data'])
+                            
+                        # 检查是否完成
+                        if result.get('code') == 20000000 and result.get('message') == 'OK':
+                            logger.info("TTS流式响应完成")
+                            break
+                            
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"TTS流式响应JSON解析失败: {e}, 行内容: {line_str}")
+                        continue
+            
+            # 合并所有音频数据
+            if audio_data_parts:
+                # 将所有base64数据合并
+                combined_audio_data = ''.join(audio_data_parts)
+                logger.info(f"TTS音频数据合并完成，总长度: {len(combined_audio_data)}")
+                return base64.b64decode(combined_audio_data)
+            else:
+                logger.error("TTS响应中未找到音频数据")
+                return None
+            
+        except Exception as e:
+            logger.error(f"TTS请求失败: {e}")
+            return None
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+长文本语音合成
+按句子/分句边界切分长文本，有界线程池并行合成各分段，按顺序拼接MP3帧后流式输出：
+第一段合成完成即可开始下发，其后的少量分段在后台预先合成
+"""
+
+import re
+import logging
+from collections import deque
+from typing import Iterator, List, Optional
+from features import get_settings
+from health import SharedExecutor
+from profiling import propagate
+
+logger = logging.getLogger(__name__)
+
+# 句末标点（切分优先级最高）与分句标点
+SENTENCE_END = re.compile(r'(?<=[。！？!?；;…\n])')
+CLAUSE_END = re.compile(r'(?<=[，,、：:）)])')
+
+# MPEG Layer III 比特率（kbps）与采样率表
+_BITRATES_V1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_BITRATES_V2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+# 合成线程池在所有请求间共享，限制对TTS服务的总并发；首次合成时才创建
+_synth_executor = SharedExecutor('tts_longform', lambda: get_settings().tts.longform_workers, 'tts-chunk')
+
+
+def _pieces(text: str, pattern: re.Pattern) -> List[str]:
+    return [p for p in pattern.split(text) if p.strip()]
+
+
+def _hard_split(text: str, max_chars: int) -> List[str]:
+    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+
+def split_text(text: str, max_chars: Optional[int] = None,
+               first_chunk_chars: Optional[int] = None) -> List[str]:
+    """按句子、分句边界切分文本，每段不超过 max_chars
+
+    相邻短句合并为一段以减少请求数；第一段限制在 first_chunk_chars 以内，尽快出首段音频。
+    """
+    settings = get_settings().tts
+    max_chars = max_chars or settings.chunk_max_chars
+    first_chunk_chars = first_chunk_chars or settings.first_chunk_chars
+    units = []
+    for sentence in _pieces(text, SENTENCE_END):
+        if len(sentence) <= max_chars:
+            units.append(sentence)
+            continue
+        for clause in _pieces(sentence, CLAUSE_END):
+            units.extend([clause] if len(clause) <= max_chars else _hard_split(clause, max_chars))
+
+    chunks: List[str] = []
+    current = ''
+    for unit in units:
+        limit = first_chunk_chars if not chunks else max_chars
+        if current and len(current) + len(unit) > limit:
+            chunks.append(current)
+            current = ''
+        current += unit
+    if current:
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def _strip_id3(data: bytes) -> bytes:
+    """去掉开头的ID3v2标签与结尾的ID3v1标签"""
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+def _frame_length(header: bytes) -> Optional[int]:
+    """解析MPEG Layer III帧头，返回帧长度；不是合法帧头时返回None"""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = (_BITRATES_V1 if version == 3 else _BITRATES_V2)[bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x01
+    return (144 if version == 3 else 72) * bitrate // sample_rate + padding
+
+
+def mp3_audio_frames(data: bytes) -> bytes:
+    """提取MP3中的音频帧，拼接为单一连续的MP3码流（容器层面无缝，并非采样级无间隙）
+
+    去掉ID3标签及首帧的Xing/Info/VBRI信息帧（其中记录的总帧数只对单段有效，
+    拼接后会导致播放器提前结束或时长错误），音频帧本身原样保留，不重新编码。
+    每段编码器延迟与末帧补齐的静音（LAME头中的 delay/padding，通常共几十毫秒）仍保留在段与段之间：
+    MP3只能按整帧（1152个采样）裁剪，采样级去除需要解码后重新编码。
+    无法解析时退回只去掉ID3标签的原始数据。
+    """
+    data = _strip_id3(data)
+    frames = []
+    pos = 0
+    first = True
+    while pos + 4 <= len(data):
+        length = _frame_length(data[pos:pos + 4])
+        if length is None or pos + length > len(data):
+            break
+        frame = data[pos:pos + length]
+        if not (first and any(tag in frame[:64] for tag in (b'Xing', b'Info', b'VBRI'))):
+            frames.append(frame)
+        first = False
+        pos += length
+
+    if not frames:
+        return data
+    if pos < len(data):
+        logger.debug(f"MP3尾部 {len(data) - pos} 字节无法解析为完整帧，已丢弃")
+    return b''.join(frames)
+
+
+class LongFormSynthesizer:
+    """长文本分段并行合成"""
+
+    def __init__(self, tts_client, executor=None, window: Optional[int] = None):
+        self.tts_client = tts_client
+        self.executor = executor or _synth_executor
+        self.window = max(1, window or get_settings().tts.longform_window)
+
+    def _synthesize_chunk(self, index: int, text: str) -> bytes:
+        # 分段失败不在此重试：上游故障时逐段重试会成倍放大请求量
+        audio = self.tts_client.synthesize(text)
+        if not audio:
+            raise RuntimeError(f'第{index + 1}段语音合成失败')
+        return mp3_audio_frames(audio)
+
+    def stream(self, text: str) -> Iterator[bytes]:
+        """按顺序产出各分段的MP3帧
+
+        每个请求最多 window 个分段同时在合成，下发一段后再提交下一段，
+        一个长文本不会占满共享线程池。客户端断开时取消尚未开始的分段。
+        """
+        chunks = split_text(text)
+        logger.info(f"长文本语音合成: {len(text)} 字，切分为 {len(chunks)} 段")
+        synthesize_chunk = propagate(self._synthesize_chunk)
+        remaining = iter(enumerate(chunks))
+        pending = deque()
+
+        def submit_next():
+            item = next(remaining, None)
+            if item is not None:
+                pending.append(self.executor.submit(synthesize_chunk, *item))
+
+        try:
+            for _ in range(self.window):
+                submit_next()
+            while pending:
+                audio = pending.popleft().result()
+                submit_next()
+                yield audio
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def synthesize(self, text: str) -> bytes:
+        """合成完整音频（非流式）"""
+        return b''.join(self.stream(text))
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+语音合成预渲染与持久化音频库
+将欢迎语、常见问题答案、公告等固定话术批量合成后落盘，/api/tts 命中时直接返回，
+并提供命令行入口：python tts_store.py scripts.txt
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+def read_script_lines(lines: Iterable[str]) -> List[str]:
+    """解析话术文件：每行一条，忽略空行与 # 开头的注释，保持顺序去重"""
+    texts = []
+    seen = set()
+    for line in lines:
+        text = line.strip()
+        if not text or text.startswith('#') or text in seen:
+            continue
+        seen.add(text)
+        texts.append(text)
+    return texts
+
+
+class TTSAudioStore:
+    """持久化音频库
+
+    以 文本 + 音色参数 的SHA-256作为键，音频按键名分目录存放，元数据写在同名JSON中。
+    写入先落临时文件再原子重命名，进程中断不会留下半个音频。
+    """
+
+    def __init__(self, root: str = TTS_STORE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def make_key(text: str, params: Dict) -> str:
+        raw = json.dumps({'text': text, 'params': params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{ext}")
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key, 'mp3'))
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key, 'mp3'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, audio: bytes, text: str, params: Dict):
+        audio_path = self._path(key, 'mp3')
+        os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+        tmp_path = f"{audio_path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(tmp_path, audio_path)
+        with open(self._path(key, 'json'), 'w', encoding='utf-8') as f:
+            json.dump({'text': text, 'params': params, 'size': len(audio), 'created_at': int(time.time())},
+                      f, ensure_ascii=False)
+
+    def stats(self) -> Dict:
+        count = 0
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.mp3'):
+                    count += 1
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+        return {'entries': count, 'bytes': total}
+
+
+class PrerenderJob:
+    """一次批量预渲染任务的进度"""
+
+    def __init__(self, texts: List[str], voice=None):
+        self.job_id = uuid.uuid4().hex
+        self.texts = texts
+        self.voice = voice  # 指定音色的TTS客户端视图（人设），为空时使用预渲染器的默认客户端
+        self.total = len(texts)
+        self.rendered = 0
+        self.cached = 0
+        self.failed: List[str] = []
+        self.chars = 0
+        self.audio_bytes = 0
+        self.started_at = None
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def done(self) -> int:
+        return self.rendered + self.cached + len(self.failed)
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+            return {
+                'job_id': self.job_id,
+                'status': 'finished' if self.finished_at else ('running' if self.started_at else 'pending'),
+                'total': self.total,
+                'done': self.done,
+                'rendered': self.rendered,
+                'cached': self.cached,
+                'failed': len(self.failed),
+                'failed_texts': self.failed[:20],
+                'elapsed': round(elapsed, 2),
+                # 吞吐量只统计实际合成的条目
+                'items_per_sec': round(self.rendered / elapsed, 2) if elapsed else 0.0,
+                'chars_per_sec': round(self.chars / elapsed, 1) if elapsed else 0.0,
+                'audio_bytes': self.audio_bytes
+            }
+
+
+class TTSPrerenderer:
+    """批量预渲染：有界并发合成，失败按指数退避重试，已在库中的话术直接跳过"""
+
+    def __init__(self, tts_client, store: TTSAudioStore,
+                 concurrency: int = TTS_PRERENDER_CONCURRENCY, retries: int = TTS_PRERENDER_RETRIES):
+        self.tts_client = tts_client
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self._jobs: Dict[str, PrerenderJob] = {}
+        self._jobs_lock = threading.Lock()
+
+    def lookup(self, text: str, voice=None) -> Optional[bytes]:
+        """按音色参数查找预渲染音频，voice 为人设的TTS客户端视图，默认使用当前音色"""
+        return self.store.get(self.store.make_key(text, (voice or self.tts_client).cache_params()))
+
+    def _render_one(self, text: str, params: Dict, job: PrerenderJob):
+        key = self.store.make_key(text, params)
+        if self.store.contains(key):
+            with job.lock:
+                job.cached += 1
+            return
+
+        for attempt in range(self.retries + 1):
+            audio = (job.voice or self.tts_client).synthesize(text)
+            if audio:
+                self.store.put(key, audio, text, params)
+                with job.lock:
+                    job.rendered += 1
+                    job.chars += len(text)
+                    job.audio_bytes += len(audio)
+                return
+            if attempt < self.retries:
+                time.sleep(min(2 ** attempt, 8))
+                logger.warning(f"预渲染失败，第{attempt + 1}次重试: {text[:30]}")
+
+        with job.lock:
+            job.failed.append(text)
+        logger.error(f"预渲染最终失败: {text[:30]}")
+
+    def run(self, job: PrerenderJob, on_progress: Optional[Callable[[PrerenderJob], None]] = None) -> PrerenderJob:
+        """同步执行预渲染任务"""
+        params = (job.voice or self.tts_client).cache_params()
+        job.started_at = time.time()
+        logger.info(f"开始预渲染任务 {job.job_id}: {job.total} 条，并发 {self.concurrency}")
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='tts-prerender') as executor:
+            futures = [executor.submit(self._render_one, text, params, job) for text in job.texts]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"预渲染任务异常: {e}")
+                if on_progress:
+                    on_progress(job)
+        job.finished_at = time.time()
+        logger.info(f"预渲染任务 {job.job_id} 完成: {job.to_dict()}")
+        return job
+
+    def submit(self, texts: List[str], voice=None) -> PrerenderJob:
+        """在后台线程执行预渲染任务，立即返回任务对象供查询进度"""
+        job = PrerenderJob(texts, voice)
+        with self._jobs_lock:
+            # 只保留最近的任务记录
+            if len(self._jobs) >= 50:
+                finished = [j for j in self._jobs.values() if j.finished_at]
+                for old in sorted(finished, key=lambda j: j.finished_at)[:len(self._jobs) - 49]:
+                    self._jobs.pop(old.job_id, None)
+            self._jobs[job.job_id] = job
+        threading.Thread(target=self.run, args=(job,), name=f'tts-job-{job.job_id[:8]}', daemon=True).start()
+        return job
+
+    def get_job(self, job_id: str) -> Optional[PrerenderJob]:
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量预渲染固定话术的语音')
+    parser.add_argument('file', help='话术文件，每行一条；传 - 从标准输入读取')
+    parser.add_argument('--concurrency', type=int, default=TTS_PRERENDER_CONCURRENCY, help='并发合成数')
+    parser.add_argument('--retries', type=int, default=TTS_PRERENDER_RETRIES, help='失败重试次数')
+    parser.add_argument('--persona', help='按人设的音色与语速渲染（默认使用默认人设）')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    # 只构造TTS客户端与人设注册表，不加载服务端（不创建LLM客户端、不启动后台线程）
+    from features import FeatureUnavailableError, get_settings
+    from personas import PersonaRegistry
+    from tts_client import VolcanoTTSClient
+    try:
+        get_settings().require('tts')
+    except FeatureUnavailableError as e:
+        print(str(e))
+        return 1
+    persona = PersonaRegistry().resolve(args.persona)
+    if persona is None:
+        print(f'人设不存在: {args.persona}')
+        return 1
+    tts_client = VolcanoTTSClient().with_voice(persona.voice_type, persona.speech_rate)
+
+    if args.file == '-':
+        texts = read_script_lines(sys.stdin)
+    else:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            texts = read_script_lines(f)
+    if not texts:
+        print('话术文件为空')
+        return 1
+
+    prerenderer = TTSPrerenderer(tts_client, TTSAudioStore(), args.concurrency, args.retries)
+
+    def report(job: PrerenderJob):
+        progress = job.to_dict()
+        print(f"\r进度 {progress['done']}/{progress['total']}  合成 {progress['rendered']}  "
+              f"已存在 {progress['cached']}  失败 {progress['failed']}  "
+              f"{progress['items_per_sec']} 条/秒  {progress['chars_per_sec']} 字/秒", end='', flush=True)
+
+    job = prerenderer.run(PrerenderJob(texts), on_progress=report)
+    print()
+    for text in job.failed:
+        print(f"失败: {text}")
+    return 1 if job.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
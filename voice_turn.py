@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+一次往返的语音对话轮次
+服务端串联 ASR → LLM → 分句TTS：LLM文本增量按句切分后立即提交合成，
+文本增量与按序完成的音频分段复用同一条SSE响应下发，各阶段之间不再经过浏览器往返
+"""
+
+import queue
+import base64
+from collections import deque
+import logging
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+from features import get_settings
+from health import SharedExecutor
+from profiling import propagate, mark
+from tts_longform import SENTENCE_END, CLAUSE_END, mp3_audio_frames
+
+logger = logging.getLogger(__name__)
+
+# 语音轮次的分句合成线程池在所有请求间共享；首次语音轮次时才创建
+_voice_tts_executor = SharedExecutor('voice_turn_tts', lambda: get_settings().voice_turn.tts_workers, 'voice-tts')
+
+
+class SentenceSegmenter:
+    """把流式文本增量切分为适合合成的句子
+
+    遇到句末标点即输出一句；首句较长时在分句标点处提前切出，尽快开始合成第一段音频；
+    超过 max_chars 仍无标点时强制切分。
+    """
+
+    def __init__(self, max_chars: Optional[int] = None, first_chars: Optional[int] = None,
+                 min_chars: Optional[int] = None):
+        settings = get_settings()
+        self.max_chars = max_chars or settings.tts.chunk_max_chars
+        self.first_chars = first_chars or settings.tts.first_chunk_chars
+        self.min_chars = min_chars if min_chars is not None else settings.voice_turn.min_segment_chars
+        self.text = ''
+        self.offset = 0  # 已切出部分在全文中的结束位置
+        self.emitted = 0
+
+    def _cut(self, pending: str) -> Optional[int]:
+        """返回 pending 中可切出的长度，不可切时返回None"""
+        for match in SENTENCE_END.finditer(pending):
+            if match.end() >= self.min_chars and pending[:match.end()].strip():
+                return match.end()
+        limit = self.first_chars if self.emitted == 0 else self.max_chars
+        if len(pending) >= limit:
+            cuts = [m.end() for m in CLAUSE_END.finditer(pending[:limit]) if m.end() >= self.min_chars]
+            return cuts[-1] if cuts else (limit if len(pending) >= self.max_chars else None)
+        return None
+
+    def _drain(self) -> List[str]:
+        segments = []
+        while True:
+            pending = self.text[self.offset:]
+            length = self._cut(pending)
+            if length is None:
+                return segments
+            self.offset += length
+            segment = pending[:length].strip()
+            if segment:
+                segments.append(segment)
+                self.emitted += 1
+
+    def feed(self, delta: str) -> List[str]:
+        self.text += delta
+        return self._drain()
+
+    def replace(self, text: str) -> List[str]:
+        """上游整体改写了文本：已合成的部分无法撤回，从原位置继续切分"""
+        self.text = text
+        self.offset = min(self.offset, len(text))
+        return self._drain()
+
+    def flush(self) -> List[str]:
+        tail = self.text[self.offset:].strip()
+        self.offset = len(self.text)
+        return [tail] if tail else []
+
+
+def audio_event(index: int, text: str, audio: Optional[bytes]) -> dict:
+    """分句音频事件：只下发MP3音频帧（去掉ID3与Xing信息帧），前端可直接首尾相接连续播放"""
+    if not audio:
+        return {'type': 'audio_error', 'index': index, 'text': text}
+    return {'type': 'audio', 'index': index, 'text': text, 'format': 'mp3',
+            'data': base64.b64encode(mp3_audio_frames(audio)).decode('ascii')}
+
+
+class VoiceTurnPipeline:
+    """把LLM事件流与分句TTS合并为一条事件流
+
+    LLM事件在独立线程中读取，合成结果通过回调写入同一队列，因此LLM停顿（如Aily工具调用）时
+    已合成好的音频也能立即下发；音频分段严格按句子顺序输出。
+    """
+
+    def __init__(self, synthesize: Optional[Callable[[str], Optional[bytes]]],
+                 executor=None, window: Optional[int] = None):
+        self.synthesize = synthesize  # 为None时只输出文本（语音合成未启用）
+        self.executor = executor or _voice_tts_executor
+        # 每个轮次最多 window 句同时在合成，一个长回答不会占满共享线程池
+        self.window = max(1, window or get_settings().voice_turn.tts_window)
+
+    def _pump(self, events: Iterable, inbox: "queue.Queue", cancel_event: threading.Event):
+        iterator = iter(events)
+        try:
+            for event in iterator:
+                if cancel_event.is_set():
+                    break
+                inbox.put(('llm', event))
+        except Exception as e:
+            logger.error(f"语音轮次LLM事件读取异常: {e}")
+            inbox.put(('llm', {'error': {'message': '生成响应时出现错误', 'type': 'server_error'}}))
+        finally:
+            if cancel_event.is_set():
+                close = getattr(iterator, 'close', None)
+                if close is not None:
+                    close()
+            inbox.put(('llm_end', None))
+
+    def stream(self, events: Iterable, cancel_event: threading.Event) -> Iterator:
+        inbox: "queue.Queue" = queue.Queue()
+        segmenter = SentenceSegmenter()
+        futures = []
+        backlog: "deque[str]" = deque()  # 已切出、等待窗口空位的句子
+        ready = {}
+        next_emit = 0
+        llm_done = False
+
+        synthesize = propagate(self.synthesize) if self.synthesize is not None else None
+
+        def dispatch():
+            while backlog and len(futures) - next_emit < self.window:
+                text = backlog.popleft()
+                index = len(futures)
+                future = self.executor.submit(synthesize, text)
+                future.add_done_callback(lambda f, i=index, t=text: inbox.put(('audio', (i, t, f))))
+                futures.append(future)
+
+        def submit(texts: List[str]):
+            if synthesize is None:
+                return
+            backlog.extend(texts)
+            dispatch()
+
+        threading.Thread(target=propagate(self._pump), args=(events, inbox, cancel_event),
+                         name='voice-turn-llm', daemon=True).start()
+        try:
+            while not (llm_done and next_emit == len(futures) and not backlog):
+                try:
+                    kind, payload = inbox.get(timeout=0.5)
+                except queue.Empty:
+                    if cancel_event.is_set():
+                        return
+                    continue
+
+                if kind == 'llm':
+                    if isinstance(payload, str):
+                        submit(segmenter.feed(payload))
+                    elif isinstance(payload, dict) and isinstance(payload.get('replace'), str):
+                        submit(segmenter.replace(payload['replace']))
+                    yield payload
+                elif kind == 'llm_end':
+                    llm_done = True
+                    if cancel_event.is_set():
+                        return
+                    submit(segmenter.flush())
+                elif kind == 'audio':
+                    index, text, future = payload
+                    try:
+                        ready[index] = (text, None if future.cancelled() else future.result())
+                    except Exception as e:
+                        logger.warning(f"语音轮次第{index + 1}段合成失败: {e}")
+                        ready[index] = (text, None)
+                    while next_emit in ready:
+                        text, audio = ready.pop(next_emit)
+                        if next_emit == 0:
+                            mark('voice_turn.first_audio')
+                        yield audio_event(next_emit, text, audio)
+                        next_emit += 1
+                    dispatch()
+        finally:
+            # 客户端断开或取消：未开始的合成不再执行，等待窗口的句子直接丢弃
+            backlog.clear()
+            for future in futures:
+                future.cancel()